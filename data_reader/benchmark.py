@@ -0,0 +1,556 @@
+"""
+Benchmarks of the readers created by data_reader.
+
+The benchmarks build data dictionaries of several kinds with *BuildDataDictionary*, write synthetic DELIM and FLAT
+files of them of the size asked for, and time readers of each engine reading them.  Each run reports rows/sec,
+MB/sec and the peak resident memory of the process, and of the processes of *multi_process*.  The results are
+added to a CSV file under a label, by default the git commit of data_reader, so that runs of different commits
+can be compared with *compare_results*.
+
+The kinds of data dictionary are:
+
+- narrow: an int, a float and a str.
+- wide: 20 floats, 20 ints and 10 strs.
+- quoted: strs in quotes that hold the delimiter, read with string_delim (DELIM only).
+- dates: dates in the formats CCYYMMDD, MM/DD/CCYY and CCYY/MM/DD.
+- legal: a state, strs and an int checked against legal values, some of which are not legal.
+
+From the command line::
+
+    python -m data_reader.benchmark --work-dir /tmp/bench --size 2GB --results bench.csv
+    python -m data_reader.benchmark --results bench.csv --compare 1a2b3c4 5d6e7f8
+
+"""
+import collections as co
+import csv
+import datetime
+import importlib
+import os
+import sys
+import time
+
+import numpy as np
+
+import data_reader.data_reader as d
+
+kinds = ('narrow', 'wide', 'quoted', 'dates', 'legal')
+
+# the columns of the results file
+result_columns = ['label', 'date', 'kind', 'file_format', 'engine', 'output_type', 'num_process', 'sample_rate',
+                  'file_mb', 'file_rows', 'rows_out', 'seconds', 'rows_per_sec', 'mb_per_sec', 'peak_rss_mb',
+                  'peak_child_rss_mb', 'error']
+
+states = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA', 'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA',
+          'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC', 'ND', 'OH', 'OK',
+          'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY']
+
+
+def random_ints(rng, n):
+    return rng.integers(0, 10 ** 9, n).astype(str)
+
+
+def random_floats(rng, n):
+    return np.char.mod('%.4f', rng.uniform(-10000.0, 10000.0, n))
+
+
+def random_strs(rng, n, width=8):
+    return rng.integers(97, 123, (n, width), dtype=np.uint8).view('S' + str(width)).ravel().astype(str)
+
+
+def random_dates(rng, n, date_format):
+    dates = (np.datetime64('1990-01-01') + rng.integers(0, 12000, n)).astype(str).tolist()
+    if date_format == 'CCYYMMDD':
+        return np.array([x[0:4] + x[5:7] + x[8:10] for x in dates])
+    if date_format == 'MM/DD/CCYY':
+        return np.array([x[5:7] + '/' + x[8:10] + '/' + x[0:4] for x in dates])
+    return np.array([x[0:4] + '/' + x[5:7] + '/' + x[8:10] for x in dates])
+
+
+def random_choices(rng, n, values, bad=None, bad_rate=0.01):
+    col = np.array(values)[rng.integers(0, len(values), n)]
+    if bad is not None:
+        col[rng.random(n) < bad_rate] = bad
+    return col
+
+
+def dictionary_fields(kind):
+    """
+    The fields of a kind of data dictionary.
+
+    :param kind: narrow, wide, quoted, dates or legal
+    :type kind: str
+    :return: for each field: name, field_type, other arguments of add_field, width in a FLAT file, and a function
+      from a generator and a number of rows to the values as str
+    :rtype: list
+    """
+    codes = ['c' + str(ind).zfill(3) for ind in range(200)]
+    if kind == 'narrow':
+        return [('obs', 'int', {}, 10, random_ints),
+                ('amount', 'float', {}, 11, random_floats),
+                ('code', 'str', {}, 8, random_strs)]
+    if kind == 'wide':
+        return ([('f' + str(ind), 'float', {}, 11, random_floats) for ind in range(20)] +
+                [('i' + str(ind), 'int', {}, 10, random_ints) for ind in range(20)] +
+                [('s' + str(ind), 'str', {}, 8, random_strs) for ind in range(10)])
+    if kind == 'quoted':
+        def quoted(rng, n):
+            return np.array(['"' + last + ', ' + first + '"' for (last, first) in
+                             zip(random_strs(rng, n).tolist(), random_strs(rng, n, 5).tolist())])
+        return [('obs', 'int', {}, 10, random_ints),
+                ('name', 'str', {}, 17, quoted),
+                ('amount', 'float', {}, 11, random_floats),
+                ('note', 'str', {}, 17, quoted)]
+    if kind == 'dates':
+        fields = [('obs', 'int', {}, 10, random_ints)]
+        for (ind, date_format) in enumerate(('CCYYMMDD', 'MM/DD/CCYY', 'CCYY/MM/DD') * 2):
+            fields += [('date' + str(ind), 'date', {'field_format': date_format}, len(date_format),
+                        lambda rng, n, date_format=date_format: random_dates(rng, n, date_format))]
+        return fields
+    if kind == 'legal':
+        fields = [('obs', 'int', {}, 10, random_ints),
+                  ('state', 'state', {'action': 'drop'}, 2,
+                   lambda rng, n: random_choices(rng, n, states, 'ZZ'))]
+        for ind in range(4):
+            fields += [('code' + str(ind), 'str', {'legal_values': codes, 'action': 'drop'}, 4,
+                        lambda rng, n: random_choices(rng, n, codes, 'bad'))]
+        fields += [('level', 'int', {'legal_values': list(range(0, 1000, 7)), 'action': 'fix',
+                                     'illegal_replacement_value': -1}, 4,
+                    lambda rng, n: random_choices(rng, n, [str(val) for val in range(0, 1000, 7)], '3'))]
+        return fields
+    raise ValueError('kind must be one of: ' + ', '.join(kinds))
+
+
+def make_dictionary(kind, file_format):
+    """
+    Build a kind of data dictionary for a file format.
+
+    :param kind: narrow, wide, quoted, dates or legal
+    :type kind: str
+    :param file_format: DELIM or FLAT
+    :type file_format: str
+    :return: the data dictionary, lrecl (None for DELIM), string_delim (None unless quoted)
+    :rtype: BuildDataDictionary, int, str
+    """
+    file_format = file_format.upper()
+    if (kind == 'quoted') and (file_format == 'FLAT'):
+        raise ValueError('quoted is only for DELIM files')
+    dictionary = d.BuildDataDictionary()
+    start = 1
+    for (name, field_type, options, width, make) in dictionary_fields(kind):
+        if file_format == 'FLAT':
+            options = dict(options, field_start=start, field_width=width)
+            start += width
+        dictionary.add_field(name, field_type, **options)
+    lrecl = None
+    if file_format == 'FLAT':
+        lrecl = start
+    string_delim = None
+    if kind == 'quoted':
+        string_delim = '"'
+    return dictionary, lrecl, string_delim
+
+
+def write_data_file(kind, file_format, file_name, size, seed=0, block_rows=20000, distinct_blocks=4):
+    """
+    Write a synthetic file of a kind of data dictionary of at least *size* bytes.  A few blocks of rows are made
+    and written in turn until the file is large enough, so that a large file is quick to write.  The number of rows
+    and the size are kept in *file_name* + '.rows' and the file is not written again if it is large enough.
+
+    :param kind: narrow, wide, quoted, dates or legal
+    :type kind: str
+    :param file_format: DELIM or FLAT
+    :type file_format: str
+    :param file_name: file to write
+    :type file_name: str
+    :param size: least number of bytes in the file
+    :type size: int
+    :param seed: seed of the values
+    :type seed: int
+    :param block_rows: number of rows in each block
+    :type block_rows: int
+    :param distinct_blocks: number of different blocks
+    :type distinct_blocks: int
+    :return: number of rows, number of bytes
+    :rtype: int, int
+    """
+    try:
+        with open(file_name + '.rows') as f:
+            (rows, written) = [int(val) for val in f.read().split()]
+        if (written >= size) and (os.stat(file_name).st_size == written):
+            return rows, written
+    except (OSError, ValueError):
+        pass
+    fields = dictionary_fields(kind)
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for ind in range(distinct_blocks):
+        cols = [make(rng, block_rows) for (name, field_type, options, width, make) in fields]
+        if file_format.upper() == 'FLAT':
+            cols = [np.char.rjust(col, field[3]) for (col, field) in zip(cols, fields)]
+            lines = [''.join(row) for row in zip(*[col.tolist() for col in cols])]
+        else:
+            lines = [','.join(row) for row in zip(*[col.tolist() for col in cols])]
+        blocks += [('\n'.join(lines) + '\n').encode()]
+    rows = written = 0
+    with open(file_name, 'wb') as f:
+        while written < size:
+            block = blocks[(rows // block_rows) % distinct_blocks]
+            f.write(block)
+            rows += block_rows
+            written += len(block)
+    with open(file_name + '.rows', 'w') as f:
+        f.write(str(rows) + ' ' + str(written) + '\n')
+    return rows, written
+
+
+def load_reader(reader_file):
+    """
+    Import a reader module.  Its directory is put on sys.path so that the processes of multi_process, which are
+    started by spawn in a spawned process, can import it to unpickle its reader.
+
+    :param reader_file: the reader module
+    :type reader_file: str
+    :return: the module
+    :rtype: module
+    """
+    path = os.path.dirname(os.path.abspath(reader_file))
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(os.path.basename(reader_file)[0:-3])
+
+
+def peak_rss_mb():
+    """
+    The peak resident memory of this process in MB.  This is VmHWM where there is /proc, since ru_maxrss carries
+    the peak of the parent across exec.
+
+    :return: peak resident memory
+    :rtype: float
+    """
+    import resource
+
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_case(case):
+    """
+    Read the file of a case once and measure it.  This is run in a process of its own so that the peak memory is
+    that of the case alone.
+
+    :param case: reader_file, data_file, output_type, output_file, num_process and sample_rate
+    :type case: dict
+    :return: seconds, rows output (None for files), peak resident memory in MB of the process and of the largest
+      of its child processes
+    :rtype: dict
+    """
+    import resource
+    import multiprocessing as mp
+
+    module = load_reader(case['reader_file'])
+    params = {'data_file': case['data_file'], 'module_path': os.path.dirname(case['reader_file']),
+              'output_type': case['output_type'], 'sample_rate': case['sample_rate'], 'seed': 0}
+    if case['output_type'].upper() in ('DELIM', 'TFRECORDS', 'PARQUET', 'ARROW'):
+        params['output_file'] = case['output_file']
+    start = time.perf_counter()
+    if case['num_process'] > 1:
+        output = d.multi_process(module.reader, params, case['num_process'])
+    else:
+        output = module.reader(params)
+    seconds = time.perf_counter() - start
+    rows_out = None
+    if isinstance(output, dict):
+        rows_out = len(next(iter(output.values()), []))
+    elif output is not None:
+        rows_out = len(output)
+    # reap the processes of multi_process so that they are counted
+    mp.active_children()
+    return {'seconds': seconds, 'rows_out': rows_out,
+            'peak_rss_mb': peak_rss_mb(),
+            'peak_child_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0}
+
+
+def run_case_process(case, send):
+    """
+    Run a case and send back its measures, or the error it raised.
+
+    :param case: the case
+    :type case: dict
+    :param send: end of a pipe to send on
+    :type send: multiprocessing.connection.Connection
+    """
+    try:
+        send.send(run_case(case))
+    except Exception as err:
+        send.send(err)
+    send.close()
+
+
+def benchmark_cases(kinds=kinds, file_formats=('delim', 'flat'), engines=('row', 'vectorized'),
+                    output_types=('pandas', 'arrays', 'list', 'delim', 'parquet'), num_processes=(1, 2, 4),
+                    sample_rates=(1.0, 0.1, 0.01)):
+    """
+    The cases to run.  Every kind, file format and engine is read with the first output type, number of processes
+    and sample rate.  The others are each run with the first kind, for every file format and engine.
+
+    :param kinds: kinds of data dictionary
+    :type kinds: tuple
+    :param file_formats: file formats
+    :type file_formats: tuple
+    :param engines: engines of the readers
+    :type engines: tuple
+    :param output_types: output types
+    :type output_types: tuple
+    :param num_processes: numbers of processes.  1 is reader without multi_process.
+    :type num_processes: tuple
+    :param sample_rates: sample rates
+    :type sample_rates: tuple
+    :return: kind, file_format, engine, output_type, num_process and sample_rate of each case
+    :rtype: list
+    """
+    base = {'output_type': output_types[0], 'num_process': num_processes[0], 'sample_rate': sample_rates[0]}
+    cases = []
+    for kind in kinds:
+        for file_format in file_formats:
+            if (kind == 'quoted') and (file_format.upper() == 'FLAT'):
+                continue
+            for engine in engines:
+                cases += [dict(base, kind=kind, file_format=file_format, engine=engine)]
+                if kind != kinds[0]:
+                    continue
+                for output_type in output_types[1:]:
+                    cases += [dict(base, kind=kind, file_format=file_format, engine=engine, output_type=output_type)]
+                for num_process in num_processes[1:]:
+                    cases += [dict(base, kind=kind, file_format=file_format, engine=engine, num_process=num_process)]
+                for sample_rate in sample_rates[1:]:
+                    cases += [dict(base, kind=kind, file_format=file_format, engine=engine, sample_rate=sample_rate)]
+    return cases
+
+
+def git_label():
+    """
+    The git commit of data_reader, or 'unlabelled' if it is not in git.
+
+    :return: label
+    :rtype: str
+    """
+    import subprocess
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(__file__),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unlabelled'
+
+
+def run_benchmarks(work_dir, size=1 << 31, cases=None, results_file=None, label=None, repeats=1, verbose=True):
+    """
+    Run the benchmarks.  The data files and readers are made in *work_dir* the first time they are needed.  Each
+    case is run *repeats* times, each in a new process, and the fastest run is kept.  A case that fails (say, parquet
+    output without pyarrow) is reported with its error.
+
+    :param work_dir: directory for the data files, readers and output files
+    :type work_dir: str
+    :param size: least number of bytes in each data file.  The default is 2GB.
+    :type size: int
+    :param cases: cases to run.  The default is *benchmark_cases()*.
+    :type cases: list
+    :param results_file: CSV file to add the results to.  The default is *None*: do not save them.
+    :type results_file: str
+    :param label: label of the results.  The default is the git commit of data_reader.
+    :type label: str
+    :param repeats: number of times to run each case
+    :type repeats: int
+    :param verbose: if True, print each result as it is done
+    :type verbose: bool
+    :return: a dict for each case, with the columns of the results file
+    :rtype: list
+    """
+    import multiprocessing as mp
+
+    if cases is None:
+        cases = benchmark_cases()
+    if label is None:
+        label = git_label()
+    for sub_dir in ('', '/readers', '/output'):
+        os.makedirs(work_dir + sub_dir, exist_ok=True)
+    files = {}
+    readers = {}
+    results = []
+    for case in cases:
+        (kind, file_format, engine) = (case['kind'], case['file_format'].upper(), case['engine'].upper())
+        result = co.OrderedDict([(name, None) for name in result_columns])
+        result.update(label=label, date=datetime.datetime.now().isoformat(timespec='seconds'), kind=kind,
+                      file_format=file_format, engine=engine, output_type=case['output_type'],
+                      num_process=case['num_process'], sample_rate=case['sample_rate'])
+        try:
+            if (kind, file_format) not in files:
+                data_file = work_dir + '/' + kind + {'DELIM': '.csv', 'FLAT': '.dat'}[file_format]
+                files[(kind, file_format)] = (data_file,) + write_data_file(kind, file_format, data_file, size)
+            (data_file, file_rows, file_bytes) = files[(kind, file_format)]
+            if (kind, file_format, engine) not in readers:
+                module_name = 'bench_' + kind + '_' + file_format.lower() + '_' + engine.lower()
+                reader_path = work_dir + '/readers/' + module_name
+                os.makedirs(reader_path + '/data', exist_ok=True)
+                (dictionary, lrecl, string_delim) = make_dictionary(kind, file_format)
+                d.create_reader(dictionary.dictionary, reader_path=reader_path, file_format=file_format, lrecl=lrecl,
+                                string_delim=string_delim, module_name=module_name, engine=engine)
+                readers[(kind, file_format, engine)] = reader_path + '/' + module_name + '.py'
+            run = {'reader_file': readers[(kind, file_format, engine)], 'data_file': data_file,
+                   'output_type': case['output_type'], 'num_process': case['num_process'],
+                   'sample_rate': case['sample_rate'],
+                   'output_file': work_dir + '/output/' + kind + '_' + engine.lower() + '.' + case['output_type']}
+            best = None
+            for repeat in range(repeats):
+                # a new interpreter that is not a daemon, so that multi_process can start its pool
+                context = mp.get_context('spawn')
+                (receive, send) = context.Pipe(False)
+                process = context.Process(target=run_case_process, args=(run, send))
+                process.start()
+                send.close()
+                try:
+                    measured = receive.recv()
+                except EOFError:
+                    measured = None
+                process.join()
+                if measured is None:
+                    raise RuntimeError('the process ended with exit code ' + str(process.exitcode))
+                if isinstance(measured, Exception):
+                    raise measured
+                if (best is None) or (measured['seconds'] < best['seconds']):
+                    best = measured
+            result.update(best)
+            result.update(file_mb=file_bytes / float(1 << 20), file_rows=file_rows,
+                          rows_per_sec=file_rows / best['seconds'],
+                          mb_per_sec=file_bytes / float(1 << 20) / best['seconds'])
+        except Exception as err:
+            result['error'] = type(err).__name__ + ': ' + str(err)
+        results += [result]
+        if verbose:
+            print(format_result(result))
+        if results_file is not None:
+            new_file = not os.path.isfile(results_file)
+            with open(results_file, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=result_columns)
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(result)
+    return results
+
+
+def format_result(result):
+    """
+    One line of text for a result.
+
+    :param result: a result of *run_benchmarks*
+    :type result: dict
+    :return: text
+    :rtype: str
+    """
+    text = '{kind:7s} {file_format:5s} {engine:10s} {output_type:8s} p={num_process} rate={sample_rate}'.format(
+        **result)
+    if result['error'] is not None:
+        return text + '  error: ' + result['error']
+    return text + '  {rows_per_sec:12,.0f} rows/s {mb_per_sec:8.1f} MB/s  peak {peak_rss_mb:8.1f} MB'.format(
+        **result)
+
+
+def read_results(results_file):
+    """
+    Read a results file.
+
+    :param results_file: CSV file of results
+    :type results_file: str
+    :return: a dict for each result
+    :rtype: list
+    """
+    try:
+        with open(results_file, newline='') as f:
+            return list(csv.DictReader(f))
+    except OSError:
+        raise FileNotFoundError('cannot find/open file: ' + results_file)
+
+
+def compare_results(results_file, base_label, label):
+    """
+    Compare the rows/sec of the cases run under two labels.  The fastest run of a case under each label is used.
+
+    :param results_file: CSV file of results
+    :type results_file: str
+    :param base_label: label to compare to
+    :type base_label: str
+    :param label: label to compare
+    :type label: str
+    :return: for each case run under both labels: the case, rows/sec under each label and their ratio
+    :rtype: list
+    """
+    best = {}
+    for result in read_results(results_file):
+        if (result['label'] not in (base_label, label)) or result['error']:
+            continue
+        case = tuple([result[name] for name in ('kind', 'file_format', 'engine', 'output_type', 'num_process',
+                                                'sample_rate')])
+        key = (result['label'], case)
+        best[key] = max(best.get(key, 0.0), float(result['rows_per_sec']))
+    comparison = []
+    for ((run_label, case), rate) in best.items():
+        if (run_label == base_label) and ((label, case) in best):
+            comparison += [(case, rate, best[(label, case)], best[(label, case)] / rate)]
+    return comparison
+
+
+def parse_size(text):
+    """
+    A size such as 2GB, 500MB or 1000000 in bytes.
+
+    :param text: size
+    :type text: str
+    :return: bytes
+    :rtype: int
+    """
+    text = text.strip().upper()
+    for (suffix, scale) in (('GB', 1 << 30), ('MB', 1 << 20), ('KB', 1 << 10), ('B', 1)):
+        if text.endswith(suffix):
+            return int(float(text[0:-len(suffix)]) * scale)
+    return int(text)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the readers created by data_reader.')
+    parser.add_argument('--work-dir', default='data_reader_benchmark', help='directory for data files and readers')
+    parser.add_argument('--size', default='2GB', help='size of each data file, e.g. 2GB or 500MB')
+    parser.add_argument('--kinds', default=','.join(kinds), help='kinds of data dictionary')
+    parser.add_argument('--file-formats', default='delim,flat')
+    parser.add_argument('--engines', default='row,vectorized')
+    parser.add_argument('--output-types', default='pandas,arrays,list,delim,parquet')
+    parser.add_argument('--num-processes', default='1,2,4')
+    parser.add_argument('--sample-rates', default='1,0.1,0.01')
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--results', default=None, help='CSV file to add the results to')
+    parser.add_argument('--label', default=None, help='label of the results; the default is the git commit')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'LABEL'), default=None,
+                        help='compare the results of two labels in --results instead of running')
+    args = parser.parse_args(argv)
+    if args.compare is not None:
+        if args.results is None:
+            parser.error('--compare needs --results')
+        for (case, base_rate, rate, ratio) in compare_results(args.results, args.compare[0], args.compare[1]):
+            print('{0:60s} {1:12,.0f} {2:12,.0f} {3:6.2f}'.format(' '.join(case), base_rate, rate, ratio))
+        return
+    cases = benchmark_cases(kinds=tuple(args.kinds.split(',')), file_formats=tuple(args.file_formats.split(',')),
+                            engines=tuple(args.engines.split(',')), output_types=tuple(args.output_types.split(',')),
+                            num_processes=tuple([int(val) for val in args.num_processes.split(',')]),
+                            sample_rates=tuple([float(val) for val in args.sample_rates.split(',')]))
+    run_benchmarks(args.work_dir, parse_size(args.size), cases, args.results, args.label, args.repeats)
+
+
+if __name__ == '__main__':
+    main()
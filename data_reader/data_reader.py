@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 
 class PopulateCBSAData(object):
     """
@@ -17,44 +18,46 @@ class PopulateCBSAData(object):
     parameters['user_class_init'] = {'check_state': True}  # checks that the state and zip agree
     parameters['user_method'] = 'cbsa_code'                # adds 'cbsa_code' to the output.
     
+    The mapping is shipped as two numpy files built by *build_cbsa_data* from zipCBSA.dat: zipCBSA.npy (zip, index
+    of the CBSA, state; sorted by zip) and CBSA.npy (CBSA code, level and name).  They are memory-mapped read-only
+    once per process, so the processes of *multi_process* share the pages of the files rather than each parsing
+    zipCBSA.dat.  If they are missing, zipCBSA.dat is read instead.
+    
+    The user methods look up one row at a time in a dict built on first use.  *enrich* does a whole pandas
+    DataFrame or dict of arrays with one vectorized lookup.
     """
     
+    # the tables, loaded by the first instance in a process
+    __zips = None
+    __cbsas = None
+    __by_zip = None
+    
     def __init__(self, check_state=False):
         """
         :param check_state:  if true, adds field 'zip_ok' if state and zip are in agreement.
         :type check_state: bool
         """
-        import pkg_resources
-        
-        # this directory stores the built-in values (zips, states, etc)
-        msa__path = pkg_resources.resource_filename('data_reader', 'data/') + 'zipCBSA.dat'
-        fi = open(msa__path)
-        
-        # read in the data needed by this class.
-        zip = []
-        cbsa = []
-        state = []
-        cbsa_level = []
-        cbsa_name = []
-        while True:
-            f = fi.readline()
-            f = f.strip('\n').strip('\r').strip(' ')
-            if not f:
-                break
-            fx = f.split('|')
-            zip += [fx[0]]
-            cbsa += [fx[1].strip(' ')]
-            state += [fx[2].strip(' ')]
-            cbsa_level += [fx[3].strip(' ')]
-            cbsa_name += [fx[4].strip(' ')]
-        fi.close()
-        self.__zip = np.array(zip)
-        self.__cbsa_code = np.array(cbsa)
-        self.__state = np.array(state)
-        self.__cbsa_level = np.array(cbsa_level)
-        self.__cbsa_name = np.array(cbsa_name)
+        if PopulateCBSAData.__zips is None:
+            (PopulateCBSAData.__zips, PopulateCBSAData.__cbsas) = load_cbsa_data()
         self.__check_state = check_state
     
+    def __lookup_row(self, zip_code):
+        """
+        The dict from zip to (cbsa_code, state, cbsa_name) used by the user methods.  It is built on first use.
+        
+        :param zip_code: 5-digit zip
+        :type zip_code: str
+        :return: cbsa_code, state and cbsa_name of the zip or None if the zip is not in the table.
+        :rtype: tuple
+        """
+        if PopulateCBSAData.__by_zip is None:
+            zips = PopulateCBSAData.__zips
+            cbsas = PopulateCBSAData.__cbsas[zips['cbsa']]
+            PopulateCBSAData.__by_zip = dict(zip(zips['zip'].tolist(),
+                                                 zip(cbsas['cbsa_code'].tolist(), zips['state'].tolist(),
+                                                     cbsas['cbsa_name'].tolist())))
+        return PopulateCBSAData.__by_zip.get(zip_code)
+    
     def cbsa_code(self, fx):
         """
         This adds a new field to fx: cbsa_code, the CBSA code for this zip.  If the zip is not in a CBSA,
@@ -72,12 +75,12 @@ class PopulateCBSAData(object):
         # do this within a 'try' in case fx doesn't contain the fields we need or is some wrong data type.
         try:
             if fx['zip'] is not None:
-                chk = np.searchsorted(self.__zip, fx['zip'])
-                if (chk >= self.__zip.shape[0]) or (fx['zip'] != self.__zip[chk]):
+                chk = self.__lookup_row(fx['zip'])
+                if chk is None:
                     fx['cbsa_code'] = None
                     fx['cbsa_name'] = None
                 else:
-                    fx['cbsa_code'] = self.__cbsa_code[chk]
+                    fx['cbsa_code'] = chk[0]
             else:
                 fx['cbsa_code'] = None
         except:
@@ -106,13 +109,13 @@ class PopulateCBSAData(object):
         # do this within a 'try' in case fx doesn't contain the fields we need or is some wrong data type.
         try:
             if fx['zip'] is not None:
-                chk = np.searchsorted(self.__zip, fx['zip'])
-                if (chk >= self.__zip.shape[0]) or (fx['zip'] != self.__zip[chk]):
+                chk = self.__lookup_row(fx['zip'])
+                if chk is None:
                     fx['cbsa_code'] = None
                     fx['cbsa_name'] = None
                 else:
-                    fx['cbsa_code'] = self.__cbsa_code[chk]
-                    fx['cbsa_name'] = self.__cbsa_name[chk]
+                    fx['cbsa_code'] = chk[0]
+                    fx['cbsa_name'] = chk[2]
             else:
                 fx['cbsa_code'] = None
                 fx['cbsa_name'] = None
@@ -134,16 +137,141 @@ class PopulateCBSAData(object):
         try:
             fx['zip_ok'] = True
             if (fx['zip'] is not None) and (fx['state'] is not None):
-                chk = np.searchsorted(self.__zip, fx['zip'])
-                if (chk >= self.__zip.shape[0]) or (fx['zip'] != self.__zip[chk]):
+                chk = self.__lookup_row(fx['zip'])
+                if chk is None:
                     fx['zip_ok'] = False
                 else:
-                    if fx['state'] != self.__state[chk]:
+                    if fx['state'] != chk[1]:
                         fx['zip_ok'] = False
             else:
                 fx['zip_ok'] = False
         except:
             fx['zip_ok'] = False
+    
+    def lookup(self, zips):
+        """
+        Find a block of zips in the zip table with one search.
+        
+        :param zips: 5-digit zips.  None and NaN are not found.
+        :type zips: numpy array, pandas Series or list
+        :return: row of each zip in the zip table and whether the zip is there.  The row of a zip that is not
+                 found is meaningless.
+        :rtype: tuple of numpy arrays
+        """
+        table = PopulateCBSAData.__zips['zip']
+        zips = np.asarray(zips, dtype=object)
+        keys = np.where(pd.isnull(zips), '', zips).astype(str)
+        rows = np.searchsorted(table, keys)
+        rows[rows >= table.shape[0]] = 0
+        found = table[rows] == keys
+        return rows, found
+    
+    def enrich(self, data, names=False):
+        """
+        Add the CBSA fields to a whole block of rows at once: cbsa_code and, if *names* is True, cbsa_name.  These are
+        None for a zip that is not in the table.  If the class was made with check_state=True, zip_ok is added too.
+        
+        This is the batch version of the user methods.  It can be used on the output of reader:
+        
+        df = PopulateCBSAData().enrich(r.reader(parameters), names=True)
+        
+        :param data: the block.  Must contain a field called 'zip', the 5-digit zip, and, for zip_ok, 'state'.
+        :type data: pandas DataFrame or dict of numpy arrays
+        :param names: if true, add cbsa_name.  The default is *False*.
+        :type names: bool
+        :return: *data*, with the new fields
+        :rtype: pandas DataFrame or dict
+        """
+        (rows, found) = self.lookup(data['zip'])
+        zips = PopulateCBSAData.__zips[rows]
+        cbsas = PopulateCBSAData.__cbsas[zips['cbsa']]
+        data['cbsa_code'] = np.where(found, cbsas['cbsa_code'].astype(object), None)
+        if names:
+            data['cbsa_name'] = np.where(found, cbsas['cbsa_name'].astype(object), None)
+        if self.__check_state:
+            state = np.asarray(data['state'], dtype=object)
+            state = np.where(pd.isnull(state), '', state).astype(str)
+            data['zip_ok'] = found & (zips['state'] == state)
+        return data
+
+
+def read_cbsa_data(data_file=None):
+    """
+    Read the zip to CBSA mapping into the two tables used by *PopulateCBSAData*.
+    
+    :param data_file: the mapping, pipe-delimited: zip, CBSA code, state, level, CBSA name.  The default is
+                      zipCBSA.dat in data_reader/data.
+    :type data_file: str
+    :return: zip table (zip, cbsa, state) sorted by zip, where cbsa is the row of the CBSA table, and CBSA table
+             (cbsa_code, cbsa_level, cbsa_name)
+    :rtype: tuple of numpy structured arrays
+    """
+    if data_file is None:
+        import pkg_resources
+        data_file = pkg_resources.resource_filename('data_reader', 'data/') + 'zipCBSA.dat'
+    try:
+        df = pd.read_csv(data_file, sep='|', header=None, dtype=str, keep_default_na=False,
+                         names=['zip', 'cbsa_code', 'state', 'cbsa_level', 'cbsa_name'])
+    except:
+        raise FileNotFoundError('cannot read file: ' + data_file)
+    df = df.apply(lambda col: col.str.strip(' '))
+    df = df.sort_values('zip', kind='stable')
+    (codes, first, cbsa) = np.unique(df['cbsa_code'].to_numpy().astype(str), return_index=True, return_inverse=True)
+    text = lambda col: col.to_numpy().astype(str)
+    zips = np.empty(df.shape[0], dtype=[('zip', text(df['zip']).dtype), ('cbsa', 'i4'),
+                                        ('state', text(df['state']).dtype)])
+    zips['zip'] = text(df['zip'])
+    zips['cbsa'] = cbsa
+    zips['state'] = text(df['state'])
+    cbsas = np.empty(codes.shape[0], dtype=[('cbsa_code', codes.dtype), ('cbsa_level', text(df['cbsa_level']).dtype),
+                                            ('cbsa_name', text(df['cbsa_name']).dtype)])
+    cbsas['cbsa_code'] = codes
+    cbsas['cbsa_level'] = text(df['cbsa_level'])[first]
+    cbsas['cbsa_name'] = text(df['cbsa_name'])[first]
+    return zips, cbsas
+
+
+def build_cbsa_data(data_file=None, data_path=None):
+    """
+    Build the numpy files zipCBSA.npy and CBSA.npy used by *PopulateCBSAData* from the zip to CBSA mapping.  Run
+    this after changing zipCBSA.dat.
+    
+    :param data_file: the mapping.  The default is zipCBSA.dat in data_reader/data.
+    :type data_file: str
+    :param data_path: directory for the files.  The default is data_reader/data.
+    :type data_path: str
+    :return: names of the two files
+    :rtype: list
+    """
+    if data_path is None:
+        import pkg_resources
+        data_path = pkg_resources.resource_filename('data_reader', 'data/')
+    if data_path[-1] != '/':
+        data_path += '/'
+    (zips, cbsas) = read_cbsa_data(data_file)
+    np.save(data_path + 'zipCBSA.npy', zips)
+    np.save(data_path + 'CBSA.npy', cbsas)
+    return [data_path + 'zipCBSA.npy', data_path + 'CBSA.npy']
+
+
+def load_cbsa_data(data_path=None):
+    """
+    Memory-map the tables built by *build_cbsa_data*.  If they are not there, zipCBSA.dat is read.
+    
+    :param data_path: directory of the files.  The default is data_reader/data.
+    :type data_path: str
+    :return: zip table and CBSA table, as returned by *read_cbsa_data*
+    :rtype: tuple of numpy structured arrays
+    """
+    import os
+    if data_path is None:
+        import pkg_resources
+        data_path = pkg_resources.resource_filename('data_reader', 'data/')
+    if data_path[-1] != '/':
+        data_path += '/'
+    if os.path.isfile(data_path + 'zipCBSA.npy') and os.path.isfile(data_path + 'CBSA.npy'):
+        return np.load(data_path + 'zipCBSA.npy', mmap_mode='r'), np.load(data_path + 'CBSA.npy', mmap_mode='r')
+    return read_cbsa_data(data_path + 'zipCBSA.dat')
 
 
 """
@@ -186,6 +314,8 @@ class BuildDataDictionary(object):
         self.__ddict = {}
         # this will count the # of entries that have a field_width/field_start syntax
         self.__num_width_fields = 0
+        # record length of a FLAT file, found by from_sample
+        self.lrecl = None
     
     @property
     def dictionary(self):
@@ -479,83 +609,1173 @@ class BuildDataDictionary(object):
         
         if (self.__num_width_fields > 0) and (self.__num_width_fields != len(self.__ddict)):
             raise ValueError('either no field may have field_start/field_width or all must have it')
+    
+    @classmethod
+    def from_sample(cls, path, file_format='DELIM', delimiter=',', headers=False, sample_rows=10000,
+                    string_delim=None, field_names=None, action='fix', max_legal_values=10, bounds=False):
+        """
+        Build a data dictionary from a sample of a file.  *sample_rows* lines, spread evenly through the file, are
+        read (all of them if the file has no more) and each field gets:
+        
+        - field_type.  DATE if every value is a date in one of the formats that take a separator (MM/DD/CCYY,
+          MM/DD/YY, MM/CCYY, CCYY/MM/DD) or has 8 digits in the format CCYYMMDD or MMDDCCYY.  INT if every value is
+          a whole number with no leading zero, FLOAT if every value is a number.  ZIP if the name has 'zip' in it
+          and every value is a zip.  STATE or STATETERR if every value is a state or territory.  Otherwise STR, which
+          is also what numbers with leading zeros, such as codes, are read as.
+        - field_format for DATE fields.
+        - legal_values for INT and STR fields that have at most *max_legal_values* values, each seen on average
+          10 times or more in the sample.
+        - minimum_value and maximum_value of INT and FLOAT fields, if *bounds*.
+        
+        Empty values are not looked at.  The legal values and bounds are only those of the sample, so a value that
+        is not in the sample fails them and is dealt with by *action*.
+        
+        For a FLAT file, the fields are found from the columns of the records: a field is a run of columns with a
+        character other than a blank in some record, split where every record turns from digits to letters or
+        back.  The blank columns between two fields go to the second field if it is a number (numbers are
+        right-aligned) and to the first otherwise.  The record length is in the *lrecl* of the data dictionary.
+        
+        :param path: file to look at
+        :type path: str
+        :param file_format: format of the file: 'DELIM' or 'FLAT'. Default is 'DELIM'.
+        :type file_format: str
+        :param delimiter: delimiter for file_format = 'DELIM'.  Default is ','.
+        :type delimiter: str
+        :param headers: True if the first line of a DELIM file has the names of the fields
+        :type headers: bool
+        :param sample_rows: number of lines to look at
+        :type sample_rows: int
+        :param string_delim: delimiter for strings.  Default is *None*.
+        :type string_delim: str
+        :param field_names: names of the fields.  The default is the headers or field1, field2, ...
+        :type field_names: list
+        :param action: action of every field, DROP, FIX, FATAL
+        :type action: str
+        :param max_legal_values: most legal values to give a field.  0 gives none.
+        :type max_legal_values: int
+        :param bounds: if True, the smallest and largest numbers of the sample are the minimum_value and
+          maximum_value of INT and FLOAT fields
+        :type bounds: bool
+        :return: data dictionary
+        :rtype: BuildDataDictionary
+        """
+        import csv
+        import mmap
+        
+        def read_values(file):
+            """
+            Read one of the standard files of legal values as a numpy array.
+            """
+            try:
+                with open(cls.__path + file) as f:
+                    return np.array([line.strip('\n') for line in f if line.strip('\n')])
+            except:
+                raise FileNotFoundError('cannot open file: ' + cls.__path + file)
+        
+        def valid_dates(years, months, days):
+            """
+            True if the parts are dates with years from 1800 to 2200.
+            
+            :param years: years, as str
+            :type years: list
+            :param months: months, as str
+            :type months: list
+            :param days: days, as str
+            :type days: list
+            :return: True if they are all dates
+            :rtype: bool
+            """
+            try:
+                years = np.array(years).astype(int)
+                if (years.min() < 1800) or (years.max() > 2200):
+                    return False
+                iso = np.char.add(np.char.add(np.char.add(np.char.zfill(years.astype(str), 4), '-'),
+                                              np.char.add(np.char.zfill(np.array(months), 2), '-')),
+                                  np.char.zfill(np.array(days), 2))
+                np.array(iso, dtype='datetime64[D]')
+            except ValueError:
+                return False
+            return True
+        
+        def date_format_of(values):
+            """
+            The date format of distinct values, or None if they are not dates of one format.
+            
+            :param values: distinct values of a field
+            :type values: numpy array
+            :return: field_format
+            :rtype: str
+            """
+            if np.char.find(values, '/').min() < 0:
+                if (np.char.str_len(values) != 8).any() or not np.char.isdigit(values).all():
+                    return None
+                values = values.tolist()
+                if valid_dates([v[0:4] for v in values], [v[4:6] for v in values], [v[6:8] for v in values]):
+                    return 'CCYYMMDD'
+                if valid_dates([v[4:8] for v in values], [v[0:2] for v in values], [v[2:4] for v in values]):
+                    return 'MMDDCCYY'
+                return None
+            parts = [v.split('/') for v in values.tolist()]
+            num_parts = len(parts[0])
+            if any([(len(p) != num_parts) or not all([x.isdigit() for x in p]) for p in parts]):
+                return None
+            if num_parts == 2:
+                if all([(len(p[0]) <= 2) and (len(p[1]) == 4) for p in parts]) and \
+                        valid_dates([p[1] for p in parts], [p[0] for p in parts], ['1'] * len(parts)):
+                    return 'MM/CCYY'
+            elif num_parts == 3:
+                if all([(len(p[0]) == 4) and (len(p[1]) <= 2) and (len(p[2]) <= 2) for p in parts]):
+                    if valid_dates([p[0] for p in parts], [p[1] for p in parts], [p[2] for p in parts]):
+                        return 'CCYY/MM/DD'
+                elif all([(len(p[0]) <= 2) and (len(p[1]) <= 2) and (len(p[2]) == 4) for p in parts]):
+                    if valid_dates([p[2] for p in parts], [p[0] for p in parts], [p[1] for p in parts]):
+                        return 'MM/DD/CCYY'
+                elif all([(len(p[0]) <= 2) and (len(p[1]) <= 2) and (len(p[2]) == 2) for p in parts]):
+                    if valid_dates(['20' + p[2] for p in parts], [p[0] for p in parts], [p[1] for p in parts]):
+                        return 'MM/DD/YY'
+            return None
+        
+        def infer(col, name):
+            """
+            The field_type and other arguments of add_field of a field from its values in the sample.
+            
+            :param col: values of the field, stripped of blanks
+            :type col: numpy array
+            :param name: name of the field
+            :type name: str
+            :return: field_type, other arguments of add_field
+            :rtype: str, dict
+            """
+            values = col[col != '']
+            if values.shape[0] == 0:
+                return 'STR', {}
+            distinct = np.unique(values)
+            date_format = date_format_of(distinct)
+            if date_format is not None:
+                return 'DATE', {'field_format': date_format}
+            field_type = 'STR'
+            numbers = None
+            unsigned = np.char.lstrip(distinct, '+-')
+            if np.char.isdigit(unsigned).all():
+                if (name.upper().find('ZIP') >= 0) and (np.char.str_len(distinct) == 5).all() and \
+                        np.isin(distinct, zips).all():
+                    return 'ZIP', {}
+                # a leading zero marks a code, which is kept as it is
+                if not ((np.char.str_len(unsigned) > 1) & np.char.startswith(unsigned, '0')).any():
+                    try:
+                        numbers = distinct.astype(np.int64)
+                        field_type = 'INT'
+                    except (ValueError, OverflowError):
+                        pass
+            else:
+                try:
+                    numbers = distinct.astype(float)
+                    if np.isfinite(numbers).all():
+                        field_type = 'FLOAT'
+                    else:
+                        numbers = None
+                except ValueError:
+                    pass
+            if field_type == 'STR':
+                if np.isin(distinct, states).all():
+                    return 'STATE', {}
+                if np.isin(distinct, territories).all():
+                    return 'STATETERR', {}
+            options = {}
+            if (field_type in ('INT', 'STR')) and (distinct.shape[0] <= max_legal_values) and \
+                    (values.shape[0] >= 10 * distinct.shape[0]):
+                if field_type == 'INT':
+                    options['legal_values'] = numbers.tolist()
+                else:
+                    options['legal_values'] = distinct.tolist()
+            if bounds and (numbers is not None):
+                if field_type == 'INT':
+                    (options['minimum_value'], options['maximum_value']) = (int(numbers.min()), int(numbers.max()))
+                else:
+                    (options['minimum_value'], options['maximum_value']) = (float(numbers.min()), float(numbers.max()))
+            return field_type, options
+        
+        file_format = file_format.upper()
+        if file_format not in ('DELIM', 'FLAT'):
+            raise ValueError('file_format must be either DELIM or FLAT')
+        if sample_rows < 1:
+            raise ValueError('sample_rows must be positive')
+        zips = read_values('zips.dat')
+        states = read_values('states.dat')
+        territories = np.append(states, read_values('territories.dat'))
+        
+        # read the sample: every line of a small file, or a line at each of sample_rows places spread through it
+        try:
+            fi = open(path, 'rb')
+        except:
+            raise FileNotFoundError('cannot find/open file: ' + path)
+        try:
+            m = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            fi.close()
+            raise ValueError('file is empty: ' + path)
+        first = 0
+        header = None
+        if headers and (file_format == 'DELIM'):
+            first = m.find(b'\n') + 1
+            if first == 0:
+                first = len(m)
+            header = m[0:first].decode().strip('\n').strip('\r')
+        if (len(m) - first <= (1 << 26)) and (m[first:len(m)].count(b'\n') <= sample_rows):
+            lines = m[first:len(m)].split(b'\n')
+        else:
+            lines = []
+            last = -1
+            for place in np.linspace(first, len(m), sample_rows, endpoint=False).astype(np.int64).tolist():
+                if place > first:
+                    place = m.find(b'\n', place - 1) + 1
+                if (place == 0) or (place <= last) or (place >= len(m)):
+                    continue
+                end = m.find(b'\n', place)
+                if end < 0:
+                    end = len(m)
+                lines += [m[place:end]]
+                last = place
+        m.close()
+        fi.close()
+        lines = [line for line in lines if line.strip(b'\r')]
+        if len(lines) == 0:
+            raise ValueError('no rows to look at in: ' + path)
+        
+        if file_format == 'DELIM':
+            lines = [line.decode(errors='replace').rstrip('\r') for line in lines]
+            if string_delim is None:
+                rows = [line.split(delimiter) for line in lines]
+                if header is not None:
+                    header = header.split(delimiter)
+            else:
+                rows = list(csv.reader(lines, delimiter=delimiter, quotechar=string_delim))
+                if header is not None:
+                    header = next(csv.reader([header], delimiter=delimiter, quotechar=string_delim))
+            if header is not None:
+                num_fields = len(header)
+            else:
+                num_fields = int(np.bincount([len(row) for row in rows]).argmax())
+            rows = [row for row in rows if len(row) == num_fields]
+            table = np.char.strip(np.array(rows, dtype=str).reshape(len(rows), num_fields))
+            columns = [table[:, ind] for ind in range(num_fields)]
+            places = [None] * num_fields
+        else:
+            # the records are the lines of the length most of them have
+            lrecl = int(np.bincount([len(line) for line in lines]).argmax())
+            lines = [line for line in lines if len(line) == lrecl]
+            records = np.frombuffer(b''.join(lines), dtype=np.uint8).reshape(len(lines), lrecl)
+            width = lrecl
+            if (records[:, -1] == 13).all():
+                width -= 1
+            records = records[:, 0:width]
+            used = ~(records == 32).all(axis=0)
+            digit = (records >= 48) & (records <= 57)
+            letter = ((records >= 65) & (records <= 90)) | ((records >= 97) & (records <= 122))
+            # runs of columns used by some record, split where every record turns from digits to letters or back
+            places = []
+            for col in range(width):
+                if not used[col]:
+                    continue
+                if (col > 0) and used[col - 1] and not (digit[:, col - 1] & letter[:, col]).all() and \
+                        not (letter[:, col - 1] & digit[:, col]).all():
+                    places[-1][1] = col + 1
+                else:
+                    places += [[col, col + 1]]
+            if len(places) == 0:
+                raise ValueError('no fields found in: ' + path)
+            columns = [np.char.strip(np.char.decode(np.ascontiguousarray(records[:, start:end]).view('S' + str(end - start))
+                                                    .ravel(), errors='replace')) for (start, end) in places]
+            num_fields = len(places)
+        
+        if field_names is None:
+            if header is not None:
+                field_names = [name.strip(' ') for name in header]
+            else:
+                field_names = ['field' + str(ind + 1) for ind in range(num_fields)]
+        if len(field_names) != num_fields:
+            raise ValueError('there are ' + str(num_fields) + ' fields but ' + str(len(field_names)) + ' field_names')
+        fields = [infer(col, name) for (col, name) in zip(columns, field_names)]
+        if file_format == 'FLAT':
+            # the blank columns between fields go to the next field if it is a number and to the field before if not
+            places[0][0] = 0
+            for ind in range(num_fields - 1):
+                if fields[ind + 1][0] in ('INT', 'FLOAT'):
+                    places[ind + 1][0] = places[ind][1]
+                else:
+                    places[ind][1] = places[ind + 1][0]
+            if fields[-1][0] not in ('INT', 'FLOAT'):
+                places[-1][1] = width
+        
+        dictionary = cls()
+        for (ind, (name, (field_type, options))) in enumerate(zip(field_names, fields)):
+            if places[ind] is not None:
+                options = dict(options, field_start=places[ind][0] + 1, field_width=places[ind][1] - places[ind][0])
+            dictionary.add_field(name, field_type, action=action, **options)
+        if file_format == 'FLAT':
+            dictionary.lrecl = lrecl + 1
+        return dictionary
+
+
+def shared_worker(args):
+    """
+    Run a reader in one of the processes of *multi_process* with shared_memory=True.  The reader's *iter_batches*
+    is run and the int, float and date columns of each batch are written to this process's rows of the shared memory
+    block as the batch comes, so that the process never holds more than a batch of them.  The other columns (str,
+    bytes, zip, state and any a user function adds) cannot go in a block of fixed-width values: their batches are
+    put together and returned, so they are pickled back to the main process.
+    
+    :param args: reader, its parameters, name of the shared memory block, dict of (offset, dtype) of each column in
+      the block, number of rows in the block, first row of the block for this process, number of rows for this process
+    :type args: tuple
+    :return: number of rows read, names of the columns (*None* if no rows were kept), dict of the columns not in the
+      block, ReaderStats of the reader if params has stats=True
+    :rtype: int, list, dict, ReaderStats
+    """
+    import sys
+    from multiprocessing.shared_memory import SharedMemory
+    
+    (reader, params, shm_name, layout, total_rows, row0, max_rows) = args
+    module = sys.modules[reader.__module__]
+    stats = None
+    if params.get('stats') is True:
+        stats = module.ReaderStats()
+        params = dict(params, stats=stats)
+    shm = SharedMemory(name=shm_name)
+    block = {}
+    for (name, (offset, dtype)) in layout.items():
+        block[name] = (np.ndarray((total_rows,), dtype=dtype, buffer=shm.buf, offset=offset),
+                       np.ndarray((total_rows,), dtype=bool, buffer=shm.buf, offset=offset + 8 * total_rows))
+    names = None
+    num_rows = 0
+    # the batches of each column that is not in the block
+    others = {}
+    try:
+        for batch in module.iter_batches(params, params.get('block_rows') or 100000):
+            names = list(batch.keys())
+            size = batch[names[0]].shape[0]
+            if num_rows + size > max_rows:
+                raise ValueError('read ' + str(num_rows + size) + ' rows but counted at most ' + str(max_rows))
+            start = row0 + num_rows
+            for name in names:
+                col = batch[name]
+                if (name not in block) or (name in others):
+                    others.setdefault(name, []).append(col)
+                    continue
+                (values, nulls) = block[name]
+                try:
+                    if col.dtype == object:
+                        nulls[start:start + size] = np.equal(col, None)
+                    else:
+                        nulls[start:start + size] = False
+                    keep = ~nulls[start:start + size]
+                    values[start:start + size][keep] = col[keep].astype(values.dtype)
+                except (TypeError, ValueError):
+                    # a user function put something in the column that is not of its type: the rows of it already
+                    # in the block are taken back out and the column is returned with the others
+                    done = values[row0:start].astype(object)
+                    done[nulls[row0:start]] = None
+                    others[name] = [done, col]
+            num_rows += size
+    finally:
+        block = values = nulls = None
+        shm.close()
+    others = dict([(name, np.concatenate(pieces)) for (name, pieces) in others.items()])
+    return num_rows, names, others, stats
 
 
-def multi_process(reader, params, num_process):
+def multi_process(reader, params, num_process, shared_memory=False, chunk_size=None, stream=False, pool=None,
+                  columns=None):
     """
     Function to read a file in multi-process mode.
     
+    The file is cut into tasks that a pool of *num_process* processes works through, each process taking the next
+    task as it finishes the last.  By default there is one task per process.  With *chunk_size*, there is a task
+    for every *chunk_size* bytes of the file so that a slow part of the file does not leave the other processes
+    idle.
+    
+    If *params* has a *row_index* built by *build_index*, the file is split among the processes by rows and
+    *first_row* and *last_row* are honored.  Otherwise the file is split by bytes.
+    
+    A compressed *data_file* (see *input_compression* of the reader) is split by bytes of the decompressed data into
+    no more tasks than it has blocks, using the block index built by *build_block_index*.  The index is built first
+    if there isn't one that matches the file.
+    
+    With *sample_rate*, each task draws its sample from a stream of its own (*sample_stream* of the reader), so the
+    samples of the tasks are independent and, with a *seed*, the same each time.
+    
+    With *reject_file* in *params* (see the reader), each task writes a reject file of its own, numbered as the
+    output files are, and *max_errors* is the number of FATAL errors each task may have.  The reject files can be
+    put back together by *write_rejects* of the reader module.
+    
+    With *stats* in *params* (see the reader), each task clocks and counts what it does and the stats of the tasks
+    are added up: into the ReaderStats given as *stats*, or into one that is returned with the output, as
+    (output, stats), if *stats* is True.  With *stream*, each output is (output, stats) of its task if *stats* is
+    True.
+    
+    With *shared_memory*, the processes write their int, float and date columns into one shared memory block that is
+    sized by counting the rows first, a batch of *block_rows* rows (see the reader) at a time as it is read.  Only the
+    other columns are pickled back.  The block is then turned into the output in one step.  *reader* must have been created by a version of *create_reader* that writes *field_types*
+    into its module.
+    
     :param reader: reader function created by create_reader
     :type reader: function
     :param params: parameters to reader function
     :type params: dict
     :param num_process: number of processes to use to read the file
     :type num_process: int
-    :return: data read by reader, if not output to a file
-    :rtype: list, numpy, pandas or None
+    :param shared_memory: if True, gather the output of the processes through shared memory
+    :type shared_memory: bool
+    :param chunk_size: approximate number of bytes of the file in each task.  The default is *None*: one task per
+      process.
+    :type chunk_size: int
+    :param stream: if True, return an iterator over the output of each task, in the order the tasks finish
+    :type stream: bool
+    :param pool: pool of processes to run the tasks in.  The default is *None*: start a pool of *num_process*
+      processes for this call.  *ReaderPool* passes its own pool here.
+    :type pool: multiprocessing.Pool
+    :param columns: names of the fields to read.  The default is *None*: the *columns* in *params*, if any.
+    :type columns: list
+    :return: data read by reader, if not output to a file.  With stats=True in *params*, the data and the stats.
+    :rtype: list, numpy, pandas, dict of numpy arrays, iterator, None or tuple
     """
     import os
+    import sys
+    import mmap
+    import collections as co
     import multiprocessing as mp
     
+    def count_rows(px):
+        """
+        An upper bound on the number of rows that reader will return with parameters *px*.
+        
+        :param px: parameters of one process
+        :type px: dict
+        :return: upper bound on the number of rows
+        :rtype: int
+        """
+        first_row = px.get('first_row')
+        if first_row is None:
+            first_row = 1
+        if px.get('last_row') is not None:
+            return max(int(px['last_row']) - max(int(first_row), 1) + 1, 0)
+        # otherwise, count the lines between start_byte and end_byte
+        start = int(px.get('start_byte') or 0)
+        if blocks is not None:
+            # the newlines of the blocks that hold any of the bytes
+            end = int(blocks[-1, 1])
+            if px.get('end_byte') is not None:
+                end = min(int(px['end_byte']) + 1, end)
+            first = max(int(np.searchsorted(blocks[0:-1, 1], start, side='right')) - 1, 0)
+            last = int(np.searchsorted(blocks[0:-1, 1], end, side='left'))
+            return int(blocks[first:last, 2].sum()) + 1
+        end = len(m)
+        if px.get('end_byte') is not None:
+            end = min(int(px['end_byte']) + 1, len(m))
+        num_rows = 1
+        for place in range(start, end, 1 << 26):
+            num_rows += m[place:min(place + (1 << 26), end)].count(b'\n')
+        return num_rows
+    
+    def column(name, dtype):
+        """
+        Gather a column from the output of all the processes.
+        
+        :param name: name of the column
+        :type name: str
+        :param dtype: numpy type of the column in the shared memory block.  None if it is not in the block.
+        :type dtype: str
+        :return: the column
+        :rtype: numpy array
+        """
+        pieces = []
+        for (ind, (num_rows, names, others, task_stats)) in enumerate(results):
+            if num_rows == 0:
+                continue
+            if name in others:
+                pieces += [others[name]]
+                continue
+            (offset, dtype) = layout[name]
+            values = np.ndarray((total_rows,), dtype=dtype, buffer=shm.buf, offset=offset)
+            nulls = np.ndarray((total_rows,), dtype=bool, buffer=shm.buf, offset=offset + 8 * total_rows)
+            pieces += [(values[row0[ind]:row0[ind] + num_rows], nulls[row0[ind]:row0[ind] + num_rows])]
+        if len(pieces) == 0:
+            return np.array([])
+        if all([str(type(piece)).find('tuple') >= 0 for piece in pieces]):
+            values = np.concatenate([piece[0] for piece in pieces])
+            nulls = np.concatenate([piece[1] for piece in pieces])
+            if dtype == 'datetime64[D]':
+                values = values.astype(object)
+            if nulls.any():
+                values = values.astype(object)
+                values[nulls] = None
+            return values
+        # a mix of pieces in the block and pickled pieces
+        for (ind, piece) in enumerate(pieces):
+            if str(type(piece)).find('tuple') >= 0:
+                values = piece[0].astype(object)
+                values[piece[1]] = None
+                pieces[ind] = values
+            elif piece.dtype.kind in 'US':
+                pieces[ind] = piece.astype(object)
+        return np.concatenate(pieces)
+    
+    def add_stats(task_stats):
+        """
+        Add up the stats of the tasks, into the ReaderStats in *params* if there is one.
+        
+        :param task_stats: ReaderStats of each task
+        :type task_stats: list
+        :return: the stats added up
+        :rtype: ReaderStats
+        """
+        if stats is True:
+            (total, task_stats) = (task_stats[0], task_stats[1:])
+        else:
+            total = stats
+        for one in task_stats:
+            total.merge(one)
+        return total
+    
+    def stream_results(pool, tasks, own_pool):
+        """
+        Yield the output of the tasks as they finish.
+        
+        :param pool: pool of processes
+        :type pool: multiprocessing.Pool
+        :param tasks: parameters of each task
+        :type tasks: tuple
+        :param own_pool: True if the pool was started for this call and is to be shut down at the end
+        :type own_pool: bool
+        :return: output of each task
+        :rtype: list, numpy, pandas, dict of numpy arrays or None
+        """
+        try:
+            for result in pool.imap_unordered(reader, tasks):
+                if (stats is not None) and (stats is not True):
+                    stats.merge(result[1])
+                    result = result[0]
+                yield result
+        finally:
+            if own_pool:
+                pool.terminate()
+    
+    if num_process < 1:
+        raise ValueError('num_process must be positive')
+    if stream and shared_memory:
+        raise ValueError('stream and shared_memory cannot both be True')
+    if params.get('sample_size') is not None:
+        raise ValueError('sample_size cannot be used with multi_process')
+    if columns is not None:
+        params = params.copy()
+        params['columns'] = columns
+    
     # get the size of the file so it can be chunked up
     try:
-        sz = float(os.stat(params['data_file']).st_size) / float(num_process)
+        file_size = os.stat(params['data_file']).st_size
     except:
         raise FileNotFoundError('cannot find file: ' + params['data_file'])
+    try:
+        row_index = params['row_index']
+    except:
+        row_index = None
+    
+    # a compressed file is split by bytes of the decompressed data, at most one task per block
+    blocks = None
+    compression = data_compression(params['data_file'], params.get('input_compression'))
+    if compression is not None:
+        if row_index is not None:
+            raise ValueError('row_index cannot be used with a compressed data_file')
+        block_index = params.get('block_index')
+        if block_index is None:
+            block_index = params['data_file'] + '.blocks.npy'
+        try:
+            blocks = np.load(block_index)
+            if int(blocks[-1, 0]) != file_size:
+                blocks = None
+        except:
+            blocks = None
+        if blocks is None:
+            blocks = np.load(build_block_index(params['data_file'], block_index, compression))
+        params = params.copy()
+        params['block_index'] = block_index
+        file_size = int(blocks[-1, 1])
     
-    # create a tuple of parameters for the num_process calls.  The differences between the parameters for each
+    num_tasks = num_process
+    if chunk_size is not None:
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be positive')
+        num_tasks = max(int(np.ceil(file_size / chunk_size)), 1)
+    if blocks is not None:
+        num_tasks = max(min(num_tasks, blocks.shape[0] - 1), 1)
+    sz = float(file_size) / float(num_tasks)
+    
+    # create a tuple of parameters for the num_tasks calls.  The differences between the parameters for each
     # call are:
     #    start_byte
     #    end_byte
+    #    first_row, last_row if there is a row index
     #    output_file, if the user has specified to write a file of the output.
     p = ()
-    start_byte = 0
-    end_byte = sz - 1
-    version_string = 'abcdefghijklmnopqrstuvqxyz'
-    if num_process > 25:
-        raise ValueError('number of processes cannot exceed 26')
-    for ind in range(num_process):
-        px = params.copy()
-        px['start_byte'] = start_byte
-        px['end_byte'] = end_byte
-        # honor any start_row for the first process.
-        px['last_row'] = None
-        # if the output are files, number them if there are more than 1.
-        if (num_process > 1) and (params['output_type'].upper() in ['DELIM', 'TFRECORDS']):
-            if px['output_file'].find('.') > 0:
-                px['output_file'] = px['output_file'].replace('.', version_string[ind] + '.')
-            else:
-                px['output_file'] = px['output_file'] + str(ind)
-        p += (px,)
-        params['first_row'] = None
-        start_byte = end_byte
-        end_byte += sz
-    
-    # run reader as multi-process affair
-    pool = mp.Pool()
-    results = pool.map(reader, p)
-    pool.close()
+    if row_index is None:
+        start_byte = 0
+        end_byte = sz - 1
+        for ind in range(num_tasks):
+            px = params.copy()
+            px['start_byte'] = start_byte
+            px['end_byte'] = end_byte
+            # honor any start_row for the first task.
+            if ind > 0:
+                px['first_row'] = None
+            px['last_row'] = None
+            p += (px,)
+            start_byte = end_byte
+            end_byte += sz
+    else:
+        try:
+            index = np.load(row_index, mmap_mode='r')
+        except:
+            raise FileNotFoundError('cannot find file: ' + row_index)
+        if int(index[1]) != os.stat(params['data_file']).st_size:
+            raise ValueError('row_index ' + row_index + ' does not match data_file')
+        every = int(index[0])
+        offsets = index[3:]
+        first_row = params.get('first_row')
+        if first_row is None:
+            first_row = 1
+        first_row = max(int(first_row), 1)
+        last_row = params.get('last_row')
+        if last_row is None:
+            last_row = int(index[2])
+        last_row = min(int(last_row), int(index[2]))
+        if first_row > last_row:
+            p = (params.copy(),)
+        else:
+            # each task starts at an entry of the index.  row0 is the number of rows before that entry.
+            rows = first_row - 1 + np.arange(num_tasks) * (last_row - first_row + 1) // num_tasks
+            entries = np.unique(rows // every)
+            for (ind, entry) in enumerate(entries):
+                px = params.copy()
+                row0 = int(entry) * every
+                # reading starts at the line after start_byte, so point at the newline that ends the row before
+                px['start_byte'] = max(int(offsets[entry]) - 1, 0)
+                px['end_byte'] = None
+                px['first_row'] = max(first_row - row0, 1)
+                if ind + 1 < len(entries):
+                    px['last_row'] = int(entries[ind + 1]) * every - row0
+                else:
+                    px['last_row'] = last_row - row0
+                p += (px,)
+    # if the output are files, number them if there are more than 1, and the reject files too.  The numbers are
+    # zero-padded so that the files sort in the order of the data.  Each task samples from a stream of its own.
+    # With stats, each task returns its stats with its output and they are added up here.
+    stats = params.get('stats')
+    if stats is False:
+        stats = None
+    for (ind, px) in enumerate(p):
+        px['sample_stream'] = ind
+        if stats is not None:
+            px['stats'] = True
+        if len(p) == 1:
+            continue
+        names = []
+        if params['output_type'].upper() in ['DELIM', 'TFRECORDS', 'PARQUET', 'ARROW']:
+            names += ['output_file']
+        if px.get('reject_file') is not None:
+            names += ['reject_file']
+        for name in names:
+            slash = px[name].rfind('/')
+            dot = px[name].rfind('.')
+            if dot <= slash + 1:
+                dot = len(px[name])
+            number = str(ind).zfill(len(str(len(p) - 1)))
+            px[name] = px[name][0:dot] + number + px[name][dot:]
     
-    # aggregate the data from the runs.  If the output is a file, there is no output here.
-    if params['output_type'].upper() == 'PANDAS':
-        output = results[0]
-        for ind in (range(1, num_process)):
-            output = output.append(results[ind])
-        return output
-    if params['output_type'].upper() == 'NUMPY':
-        output = results[0]
-        for r in (range(1, num_process)):
-            output = np.append(output, results[ind], axis=0)
-        return output
-    if params['output_type'].upper() == 'LIST':
-        output = []
-        for r in results:
-            output += r
+    output_type = params['output_type'].upper()
+    own_pool = pool is None
+    if stream:
+        if own_pool:
+            pool = mp.Pool(num_process)
+        return stream_results(pool, p, own_pool)
+    if not shared_memory:
+        # run reader as multi-process affair. chunksize=1 hands out the tasks one at a time as processes free up.
+        if own_pool:
+            pool = mp.Pool(num_process)
+        results = pool.map(reader, p, chunksize=1)
+        if own_pool:
+            pool.close()
+        if stats is not None:
+            total = add_stats([r[1] for r in results])
+            results = [r[0] for r in results]
+        
+        # aggregate the data from the runs in one step.  If the output is a file, there is no output here.
+        output = None
+        if output_type == 'PANDAS':
+            output = pd.concat(results)
+        elif output_type == 'NUMPY':
+            results = [r for r in results if r.size > 0] or results[0:1]
+            output = np.concatenate(results, axis=0)
+        elif output_type == 'ARRAYS':
+            output = co.OrderedDict([(name, np.concatenate([r[name] for r in results])) for name in results[0]])
+        elif output_type == 'LIST':
+            output = []
+            for r in results:
+                output += r
+        if stats is True:
+            return output, total
         return output
+    
+    from multiprocessing.shared_memory import SharedMemory
+    
+    if output_type not in ['LIST', 'NUMPY', 'PANDAS', 'ARRAYS']:
+        raise ValueError('shared_memory can only be used with output_type list, numpy, pandas or arrays')
+    try:
+        field_names = sys.modules[reader.__module__].field_names
+        field_types = sys.modules[reader.__module__].field_types
+    except (KeyError, AttributeError):
+        raise ValueError('reader has no field_types: create it again to use shared_memory')
+    
+    # row count pass: an upper bound on the rows from each process gives each process its own slot in the block
+    if blocks is None:
+        fi = open(params['data_file'], 'rb')
+        m = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)
+        counts = [count_rows(px) for px in p]
+        m.close()
+        fi.close()
+    else:
+        counts = [count_rows(px) for px in p]
+    row0 = [int(sum(counts[0:ind])) for ind in range(len(counts))]
+    total_rows = max(int(sum(counts)), 1)
+    
+    # each int, float and date column has 8 bytes of values and 1 byte of null indicator per row
+    dtypes = {'INT': 'int64', 'FLOAT': 'float64', 'DATE': 'datetime64[D]'}
+    layout = {}
+    size = 0
+    columns = params.get('columns')
+    if str(type(columns)).find('str') >= 0:
+        columns = [columns]
+    for (name, field_type) in zip(field_names, field_types):
+        if (field_type in dtypes) and ((columns is None) or (name in columns) or (name == params.get('partition'))):
+            layout[name] = (size, dtypes[field_type])
+            size += 8 * total_rows + 8 * ((total_rows + 7) // 8)
+    shm = SharedMemory(create=True, size=max(size, 1))
+    try:
+        tasks = ()
+        for (ind, px) in enumerate(p):
+            px = px.copy()
+            px['output_type'] = 'ARRAYS'
+            tasks += ((reader, px, shm.name, layout, total_rows, row0[ind], counts[ind]),)
+        if own_pool:
+            pool = mp.Pool(num_process)
+        results = pool.map(shared_worker, tasks, chunksize=1)
+        if own_pool:
+            pool.close()
+        
+        names = [r[1] for r in results if r[1] is not None]
+        if len(names) == 0:
+            # no task kept a row, so none of them has the names of the columns.  Read the first again for them.
+            px = dict(tasks[0][1], stats=None, reject_file=None)
+            names = [list(reader(px).keys())]
+        columns = co.OrderedDict()
+        for name in names[0]:
+            columns[name] = column(name, layout.get(name, (0, None))[1])
+    finally:
+        shm.close()
+        shm.unlink()
+    if output_type == 'ARRAYS':
+        output = columns
+    elif output_type == 'PANDAS':
+        output = pd.DataFrame(columns).infer_objects()
+    else:
+        output = [list(row) for row in zip(*[col.tolist() for col in columns.values()])]
+        if output_type == 'NUMPY':
+            output = np.matrix(output)
+    if stats is not None:
+        total = add_stats([r[3] for r in results])
+        if stats is True:
+            return output, total
+    return output
+
+
+def warm_worker(reader, module_path):
+    """
+    Start-up of each process of a *ReaderPool*: read the column names and legal values of *reader* so that they
+    are ready for every file the process reads.
+    
+    :param reader: reader function created by create_reader
+    :type reader: function
+    :param module_path: path to the reader module
+    :type module_path: str
+    :return: <none>
+    """
+    import sys
+    
+    try:
+        load_setup = sys.modules[reader.__module__].load_setup
+    except (KeyError, AttributeError):
+        # readers created before load_setup read their setup on each call
+        return
+    load_setup(module_path)
+
+
+class ReaderPool(object):
+    """
+    A pool of processes that stay up to run one reader over many files.  The processes start once, with the reader
+    module loaded and its column names and legal values read, rather than once for each file.
+    
+    pool = ReaderPool(r.reader, 8, module_path='/my/reader/')
+    
+    outputs = pool.map([params1, params2, params3])   # one file per process at a time
+    
+    output = pool.multi_process(params4, chunk_size=100000000)   # one file split across the processes
+    
+    pool.close()
+    
+    A ReaderPool can also be used in a *with* statement.
+    """
+    
+    def __init__(self, reader, num_process, module_path=None):
+        """
+        :param reader: reader function created by create_reader
+        :type reader: function
+        :param num_process: number of processes
+        :type num_process: int
+        :param module_path: path to the reader module.  Default is the reader subdirectory of data_reader.
+        :type module_path: str
+        """
+        import multiprocessing as mp
+        from multiprocessing import resource_tracker
+        
+        if num_process < 1:
+            raise ValueError('num_process must be positive')
+        self.__reader = reader
+        self.__num_process = num_process
+        # the processes must share this process's resource tracker so that shared memory used by multi_process
+        # is not seen as leaked when a process exits
+        resource_tracker.ensure_running()
+        self.__pool = mp.Pool(num_process, initializer=warm_worker, initargs=(reader, module_path))
+    
+    def submit(self, params):
+        """
+        Read one file in the background.
+        
+        :param params: parameters to reader function
+        :type params: dict
+        :return: the pending output of reader.  Its get() method waits for and returns the output.
+        :rtype: multiprocessing.pool.AsyncResult
+        """
+        return self.__pool.apply_async(self.__reader, (params,))
+    
+    def map(self, params_list):
+        """
+        Read a file for each entry of *params_list*.
+        
+        :param params_list: parameters to reader function for each file
+        :type params_list: list
+        :return: output of reader for each file, in order
+        :rtype: list
+        """
+        return self.__pool.map(self.__reader, params_list, chunksize=1)
+    
+    def imap_unordered(self, params_list):
+        """
+        Read a file for each entry of *params_list*, returning the outputs as they finish.
+        
+        :param params_list: parameters to reader function for each file
+        :type params_list: list
+        :return: output of reader for each file, in the order they finish
+        :rtype: iterator
+        """
+        return self.__pool.imap_unordered(self.__reader, params_list)
+    
+    def multi_process(self, params, shared_memory=False, chunk_size=None, stream=False, columns=None):
+        """
+        Read one file with all the processes of the pool.  See function *multi_process*.
+        
+        :param params: parameters to reader function
+        :type params: dict
+        :param shared_memory: if True, gather the output of the processes through shared memory
+        :type shared_memory: bool
+        :param chunk_size: approximate number of bytes of the file in each task
+        :type chunk_size: int
+        :param stream: if True, return an iterator over the output of each task
+        :type stream: bool
+        :param columns: names of the fields to read
+        :type columns: list
+        :return: data read by reader, if not output to a file
+        :rtype: list, numpy, pandas, dict of numpy arrays, iterator or None
+        """
+        return multi_process(self.__reader, params, self.__num_process, shared_memory=shared_memory,
+                             chunk_size=chunk_size, stream=stream, pool=self.__pool, columns=columns)
+    
+    def close(self):
+        """
+        Wait for the work submitted to finish and shut down the processes.
+        """
+        self.__pool.close()
+        self.__pool.join()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.__pool.terminate()
+
+
+def build_index(data_file, index_file=None, every=10000, headers=False):
+    """
+    Build a row index of a delimited file.  The index is a numpy uint64 array saved with np.save.  The first three
+    entries are *every*, the size of *data_file* in bytes and the number of data rows.  After these come the byte
+    offsets of data rows 1, 1 + *every*, 1 + 2 * *every*, ...
+    
+    A reader given the index as parameter *row_index* goes straight to *first_row* rather than reading every line
+    before it.  *multi_process* uses the index to split the file among the processes by rows rather than by bytes.
+    The index must be rebuilt if *data_file* changes.
+    
+    :param data_file: delimited file to index
+    :type data_file: str
+    :param index_file: file to save the index in.  The default is *data_file* + '.idx.npy'
+    :type index_file: str
+    :param every: number of rows between entries of the index.  The default is 10000.
+    :type every: int
+    :param headers: True means the first line of *data_file* is headers.  The default is *False*.
+    :type headers: bool
+    :return: name of the index file
+    :rtype: str
+    """
+    import os
+    import mmap
+    
+    if every < 1:
+        raise ValueError('every must be positive')
+    if index_file is None:
+        index_file = data_file + '.idx.npy'
+    try:
+        fi = open(data_file, 'rb')
+    except:
+        raise FileNotFoundError('cannot find file: ' + data_file)
+    size = os.fstat(fi.fileno()).st_size
+    offsets = []
+    num_rows = 0
+    if size > 0:
+        m = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)
+        start = 0
+        if headers:
+            start = m.find(b'\n') + 1
+            if start == 0:
+                start = size
+        if start < size:
+            offsets += [np.array([start], dtype=np.uint64)]
+            num_rows = 1
+        # every newline that is not the last byte of the file starts a row.  Find them a chunk at a time.
+        chunk = 1 << 26
+        place = start
+        while place < size:
+            buf = np.frombuffer(m[place:place + chunk], dtype=np.uint8)
+            starts = np.flatnonzero(buf == 10) + (place + 1)
+            starts = starts[starts < size]
+            offsets += [starts[(-num_rows) % every::every].astype(np.uint64)]
+            num_rows += starts.shape[0]
+            place += chunk
+        m.close()
+    fi.close()
+    index = np.concatenate([np.array([every, size, num_rows], dtype=np.uint64)] + offsets)
+    try:
+        fo = open(index_file, 'wb')
+    except:
+        raise FileNotFoundError('could not open file: ' + index_file)
+    np.save(fo, index)
+    fo.close()
+    return index_file
+
+
+def data_compression(data_file, compression=None):
+    """
+    The compression of *data_file*: GZIP, BZ2, XZ, ZSTD or *None* for an uncompressed file.
+    
+    :param data_file: file to read
+    :type data_file: str
+    :param compression: gzip, bz2, xz, zstd or none.  The default is *None*: go by the extension of *data_file*.
+    :type compression: str
+    :return: compression
+    :rtype: str
+    """
+    if compression is None:
+        extensions = {'gz': 'GZIP', 'bgz': 'GZIP', 'bz2': 'BZ2', 'xz': 'XZ', 'zst': 'ZSTD'}
+        return extensions.get(data_file[data_file.rfind('.') + 1:].lower())
+    compression = compression.upper()
+    if compression == 'NONE':
+        return None
+    if compression not in ('GZIP', 'BZ2', 'XZ', 'ZSTD'):
+        raise ValueError('input_compression must be one of: gzip, bz2, xz, zstd, none')
+    return compression
+
+
+def decompressor(compression):
+    """
+    A decompressor for one block (gzip member, bz2 or xz stream, zstd frame) of a compressed file.
+    
+    :param compression: GZIP, BZ2, XZ or ZSTD
+    :type compression: str
+    :return: decompressor with method decompress and attributes eof and unused_data
+    :rtype: object
+    """
+    if compression == 'GZIP':
+        import zlib
+        return zlib.decompressobj(31)
+    if compression == 'BZ2':
+        import bz2
+        return bz2.BZ2Decompressor()
+    if compression == 'XZ':
+        import lzma
+        return lzma.LZMADecompressor()
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('reading zstd files requires zstandard')
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def build_block_index(data_file, index_file=None, compression=None):
+    """
+    Build the block index of a compressed file.  The blocks are the pieces of the file that decompress on their own:
+    gzip members (BGZF files and files written by parallel gzip tools are many of them), bz2 and xz streams and zstd
+    frames.  The index is a numpy int64 array saved with np.save.  It has a row for each block: the byte of
+    *data_file* where the block starts, the byte of the decompressed data where it starts and the number of newlines
+    in it.  The last row has the size of *data_file*, the size of the decompressed data and the number of newlines.
+    
+    With the index, a reader given *start_byte* decompresses from the block holding it rather than from the start of
+    the file, and *multi_process* splits the file among as many processes as there are blocks.  *multi_process*
+    builds the index itself if there isn't one.  The index must be rebuilt if *data_file* changes.
+    
+    :param data_file: compressed file to index
+    :type data_file: str
+    :param index_file: file to save the index in.  The default is *data_file* + '.blocks.npy'
+    :type index_file: str
+    :param compression: gzip, bz2, xz or zstd.  The default is *None*: go by the extension of *data_file*.
+    :type compression: str
+    :return: name of the index file
+    :rtype: str
+    """
+    import os
+    
+    compression = data_compression(data_file, compression)
+    if compression is None:
+        raise ValueError('data_file is not compressed: ' + data_file)
+    if index_file is None:
+        index_file = data_file + '.blocks.npy'
+    try:
+        fi = open(data_file, 'rb')
+    except:
+        raise FileNotFoundError('cannot find file: ' + data_file)
+    blocks = []
+    dec = None
+    # pending are the bytes of the file not yet decompressed, starting at byte place of the file
+    pending = b''
+    place = 0
+    size = 0
+    while True:
+        if not pending:
+            pending = fi.read(1 << 20)
+            if not pending:
+                break
+        if dec is None:
+            dec = decompressor(compression)
+            blocks += [[place, size, 0]]
+        out = dec.decompress(pending)
+        size += len(out)
+        blocks[-1][2] += out.count(b'\n')
+        if dec.eof:
+            place += len(pending) - len(dec.unused_data)
+            pending = dec.unused_data
+            dec = None
+        else:
+            place += len(pending)
+            pending = b''
+    fi.close()
+    if dec is not None:
+        raise ValueError('compressed file ends in the middle of a block: ' + data_file)
+    blocks += [[os.stat(data_file).st_size, size, sum([block[2] for block in blocks])]]
+    index = np.array(blocks, dtype=np.int64)
+    try:
+        fo = open(index_file, 'wb')
+    except:
+        raise FileNotFoundError('could not open file: ' + index_file)
+    np.save(fo, index)
+    fo.close()
+    return index_file
+
+
+def legal_array(legal_values, field_type, field_name):
+    """
+    Put legal values in a sorted numpy array of the type of the field, ready to save with np.save.
+    
+    :param legal_values: legal values of the field
+    :type legal_values: numpy array
+    :param field_type: field_type of the field
+    :type field_type: str
+    :param field_name: name of the field
+    :type field_name: str
+    :return: legal values
+    :rtype: numpy array
+    """
+    try:
+        if field_type == 'INT':
+            lv = np.array([int(float(val)) for val in legal_values], dtype=np.int64)
+        elif field_type == 'FLOAT':
+            lv = np.array([float(val) for val in legal_values], dtype=np.float64)
+        elif field_type == 'DATE':
+            lv = np.array([str(val) for val in legal_values], dtype='datetime64[D]')
+        elif field_type == 'BYTES':
+            lv = np.array([val if str(type(val)).find('byte') >= 0 else str(val).encode() for val in legal_values],
+                          dtype=bytes)
+        else:
+            lv = np.array([val.decode() if str(type(val)).find('byte') >= 0 else str(val) for val in legal_values],
+                          dtype=str)
+    except (TypeError, ValueError):
+        raise ValueError('Cannot interpret ' + field_name + ' legal values as ' + field_type)
+    lv.sort()
+    return lv
+
+
+def legal_lookup_type(legal_values, field_type, engine):
+    """
+    Choose how a reader looks up values in the legal values of a field:
+    
+    - SET.  A frozenset.  The row engine uses this for all fields.
+    - SORTED.  The sorted legal values, searched with np.searchsorted.  The vectorized engine uses this for strings.
+    - ZIP.  A bitmap over the 100000 5-digit zips, and the sorted legal values that are not 5 digits.  For zip fields
+      in the vectorized engine: a bitmap lookup of tens of thousands of zips is much faster than a binary search.
+    - BITMAP.  A bitmap over the range of the legal values.  For int fields whose range is at most 2**22.
+    - ISIN.  np.isin against the sorted legal values.  For the other fields in the vectorized engine.
+    
+    :param legal_values: legal values of the field
+    :type legal_values: numpy array
+    :param field_type: field_type of the field
+    :type field_type: str
+    :param engine: ROW or VECTORIZED
+    :type engine: str
+    :return: SET, SORTED, ZIP, BITMAP or ISIN
+    :rtype: str
+    """
+    if engine == 'ROW':
+        return 'SET'
+    if field_type == 'ZIP':
+        return 'ZIP'
+    if field_type in ('STR', 'STATE', 'STATETERR', 'BYTES'):
+        return 'SORTED'
+    if (field_type == 'INT') and (len(legal_values) > 0):
+        lv = np.array(legal_values, dtype=np.float64)
+        if lv.max() - lv.min() < 2 ** 22:
+            return 'BITMAP'
+    return 'ISIN'
 
 
 def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',', lrecl=None, string_delim=None, \
-                  remove_char=None, module_name='reader'):
+                  remove_char=None, module_name='reader', engine='row', cache_dir=None):
     """
     Create a module 'reader' which reads in a file.  The output of this function is placed in the directory reader_path.
     If no path is specified, then the output is placed in the reader subdirectory of this module.
@@ -563,9 +1783,10 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     The structure of the created module is:
     
     - reader_path/reader.py.  This is the module created here.
-    - reader_path/data/data?.dat.  These data files contain the legal values for each variable if the user has
-      specified legal values.  The ? increments according to the position of the variable in data_dict.  For example,
-      if the first variable has legal values specified, those values are stored in data0.dat.
+    - reader_path/data/data?.npy.  These data files contain the legal values for each variable if the user has
+      specified legal values, as a sorted numpy array.  The ? increments according to the position of the variable
+      in data_dict.  For example, if the first variable has legal values specified, those values are stored in
+      data0.npy.
     
     readers can be created to read two file formats:
     
@@ -573,6 +1794,22 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     - Flat (file_format = 'FLAT').  These files have a fixed record length as specified by *lrecel*.  The value of
       *lrecl* is the total length of each record including LF, and RET characters.
     
+    readers can use one of two engines:
+    
+    - Row (engine = 'row').  Each line is read, split, converted and validated on its own. This is the default.
+    - Vectorized (engine = 'vectorized').  The file is read in blocks of about *block_rows* lines.  Each block is
+      split in one go and each field is converted and validated with numpy array operations over the whole block.
+      A FLAT file is mapped with np.memmap as an array of records of a numpy structured dtype built from the
+      *field_start* and *field_width* of each field, so the fields of a block are sliced out with no copying.
+      Rows are handed to *user_function*/*user_class* one at a time after that; delim, parquet, arrow and tfrecords
+      output is written a block at a time.  This engine reads DELIM and FLAT files and ignores *window*.
+    
+    If *cache_dir* is given, *reader_path* is ignored.  The reader is kept in a subdirectory of *cache_dir* named for
+    *module_name* and a hash of *data_dict*, the other arguments and this module.  It is built only if that
+    subdirectory does not exist: in a temporary directory, compiled to bytecode and then renamed into place, so that
+    jobs creating the same reader at the same time do not see each other's partly written files.  The reader module
+    is imported and returned.  Calling again with the same arguments returns the module already imported.
+    
     Elements of data_dict.  Each element of data_dict defines a single field.  The key into data_dict is an
     integer: 0, 1, 2.  These define the order of the variables in the file if the file does not have headers.
     If the file has headers, then the order in data_dict does not matter.
@@ -635,8 +1872,12 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     :type remove_char: str
     :param module_name: name of the module to create the reader in (default=reader)
     :type module_name: str
-    :return: No direct return
-    :rtype: <none>
+    :param engine: 'row' or 'vectorized'. Default is 'row'.
+    :type engine: str
+    :param cache_dir: directory of cached readers. Default is *None* (write the reader to *reader_path*).
+    :type cache_dir: str
+    :return: the reader module if *cache_dir* is given, otherwise no direct return
+    :rtype: module
 
   
     The reader function created by this function:
@@ -645,9 +1886,9 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     
     - *data_file* (str).  Name of the file to read.
     
-    - *module_path* (str).  The path to this module.  If this omitted, then it is assumed that this module is in the
-      reader subdirectory of the data_reader module.  The *reader* function needs this path so that it can read legal
-      values from the *data* subdirectory within the *reader* directory.
+    - *module_path* (str).  The path to this module.  If this omitted, then the directory the module was imported from
+      is used.  The *reader* function needs this path so that it can read legal values from the *data* subdirectory
+      within the *reader* directory.
     
     - *output_type* (str).  How to output the data.Choices are:
     
@@ -663,6 +1904,14 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     
     - *output_headers* (bool). If *True*, output a header row. Default value is *True*.
     
+    - *write_buffer* (int). Number of characters of 'delim' output held before they are written.  The default value
+      is 4194304.
+    
+    - *write_thread* (bool). If *True*, 'delim' output is written by a thread of its own while reading goes on.  The
+      default value is *False*.
+    
+    - *max_open_files* (int). Most 'delim' files open at once.  The default value is 128.
+    
     - *headers* (bool).  True means the input file has headers.  The default value is *False*.
     
     - *start_byte* (int).  The byte at which to start reading the file.  The default value is 0.  If the value is
@@ -674,9 +1923,38 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
 
     The above two will generally only be used for reading the file in multiprocessing mode.
     
-    - *sample_rate* (float). The rate at which to sample the file.  The default value is 1.
+    - *sample_rate* (float). The rate at which to sample the file.  The default value is 1.  The rows that are not in
+      the sample are jumped over without being split into fields.
     
-    - *user_function* (function). A user-supplied function that is called as each row is processed.  It can take only
+    - *sample_size* (int). Number of rows of the sample.  Each row is in the sample with the same chance: the rows
+      are held in a reservoir that is cut back to *sample_size* as it goes.  The rows come out in the order of the
+      file.  Only for output_type list, numpy, pandas and arrays, without *batch_rows* or *multi_process*.  The
+      default value is *None*: every row that is kept.
+    
+    - *seed* (int). Seed of the random draws of *sample_rate* and *sample_size*.  The same *seed* gives the same
+      sample.  The default value is *None*: a new seed each time.
+    
+    - *sample_stream* (int). Number of the stream of *seed* to draw from.  Different streams give independent
+      samples.  *multi_process* gives each task a stream of its own.  The default value is 0.
+    
+    - *stats* (bool or ReaderStats). If *True*, the reader clocks each stage of the run (reading, splitting,
+      filters, conversion, validation, user hooks, output) and counts the rows read, filtered, dropped, fixed,
+      rejected and kept and the values that fail each check of each field, and returns (output, stats), where stats
+      is a ReaderStats of the reader module.  A ReaderStats can be given instead, to be added to as the run goes,
+      which is how *iter_batches* gives stats.  *multi_process* adds up the stats of its tasks.  The default value is
+      *None*: no stats.
+    
+    - *reject_file* (str). File to write the rows that fail a check of a field to: the rows dropped or fixed by the
+      action of a field, and the rows of FATAL errors under *max_errors*.  Each line has the byte offset of the row,
+      its row number, the checks it failed and the bytes of the row as read, so that just the rejected rows can be
+      read again once the feed is fixed (see *RejectWriter*, *read_rejects* and *write_rejects* of the reader).  The
+      default value is *None*: no reject file.
+    
+    - *max_errors* (int). Number of values that may fail a check of a field with action FATAL before the run stops
+      with a ValueError.  Until then the rows with those values are dropped, as with action DROP.  The default value
+      is 0: stop at the first.
+    
+    - *user_function* (function). A user-supplied function that is called as each row is processed.  It can take only
       one argument, a dictionary.  The dictionary entries have the form: 'field_name': value.  The function can
       modify or add values to the dictionary.
     
@@ -687,6 +1965,34 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
       
     - window (int). Window for mmap.  If *None* there is no window (fastest).
     
+    - block_rows (int). Approximate number of lines in each block read by the vectorized engine.  The default
+      value is 100000.
+    
+    - row_index (str). Row index of a DELIM *data_file* built by *build_index*.  With it, reading goes straight to
+      *first_row*.  FLAT files go straight to *first_row* without an index.
+    
+    - date_cache_size (int). Number of distinct raw values of each DATE field whose converted date is cached.  The
+      default value is 65536.
+    
+    - columns (list). Names of the fields to read.  The other fields are not converted or checked, so their
+      action does not drop or fix rows, and they are left out of the output.  The *partition* field is always
+      read.  If there is a *user_function* or *user_class*, every field is read so that they can use any of them
+      and the fields not in *columns* are dropped after them.  The default is *None*: read every field.
+    
+    - filters (list). Filters of the form (field name, op, value), where op is one of ==, !=, <, <=, >, >=, in and
+      not in.  A row is kept only if it passes every filter.  The filters are tested first, in order, on the raw
+      values converted to the type of the field (before the field's checks), and a row that fails is not worked on
+      any further.  A value that does not convert fails.
+    
+    - input_compression (str). Compression of *data_file*: gzip, bz2, xz, zstd (needs zstandard) or none.  The
+      default is *None*: go by the extension of *data_file* (.gz, .bgz, .bz2, .xz, .zst).  A compressed file is
+      decompressed a piece at a time as it is read, only from *start_byte* through *end_byte*, which are bytes of
+      the decompressed data.  It is read forward only, so *row_index* cannot be used with it.
+    
+    - block_index (str). Block index of a compressed *data_file* built by *build_block_index*.  With it,
+      decompression starts at the block holding *start_byte*.  The default is *data_file* + '.blocks.npy', if it is
+      there.
+    
     
     - param params. A dictionary of parameters directing the reading of the file.
     - type dict
@@ -694,11 +2000,243 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     
     """
     
+    import io
+    import os
     import pkg_resources
     
+    def reader_digest():
+        """
+        Hash everything the generated reader depends on: the data dictionary, the other arguments of create_reader
+        and the source of this module.  Legal values are hashed as the typed arrays that are saved.
+        
+        :return: hex digest
+        :rtype: str
+        """
+        import hashlib
+        h = hashlib.sha256()
+        with open(__file__, 'rb') as f:
+            h.update(f.read())
+        h.update(repr((file_format.upper(), delimiter, lrecl, string_delim, remove_char, module_name,
+                       engine.upper())).encode())
+        for ind in range(len(data_dict)):
+            for key in sorted(data_dict[ind].keys()):
+                value = data_dict[ind][key]
+                if (key == 'legal_values') and (value is not None):
+                    lv = legal_array(value, data_dict[ind]['field_type'].upper(), data_dict[ind]['field_name'])
+                    h.update((str(ind) + key + lv.dtype.str).encode())
+                    h.update(lv.tobytes())
+                else:
+                    h.update(repr((ind, key, value)).encode())
+        return h.hexdigest()
+    
+    def write_block_action(action, message, replacement, key):
+        """
+        Write what the vectorized engine does with the rows of a block that fail a check.  The generated code has
+        the mask of those rows in *bad*.
+        
+        :param action: FATAL, DROP or FIX
+        :type action: str
+        :param message: code for the message of the ValueError raised if action is FATAL, for the row at position *at*
+        :type message: str
+        :param replacement: replacement value if action is FIX
+        :type replacement: field type
+        :param key: field name and check, the key of the violations of ReaderStats
+        :type key: tuple
+        """
+        failure = repr(':'.join(key + (action.lower(),)))
+        if action == 'FATAL':
+            # a FATAL error drops the rows until there are more than max_errors of them.  The errors are counted once
+            # the block is checked (see first_fatal), so that the read stops where the row engine stops.
+            fo.write('        if bad.any():\n')
+            fo.write('            fatal += [(bad, lambda at, col=col, fields=fields: ' + message + ')]\n')
+            fo.write('            keep &= ~bad\n')
+            if key[1] == 'conversion':
+                # so that the checks that follow skip the value, as in the row engine
+                fo.write('            null |= bad\n')
+            fo.write('            violations[' + repr(key) + '] += int(bad.sum())\n')
+            fo.write('            if rejects is not None:\n')
+            fo.write('                failures += [(bad, ' + failure + ')]\n')
+            return
+        if action == 'DROP':
+            fo.write('        keep &= ~bad\n')
+            if key[1] == 'conversion':
+                fo.write('        null |= bad\n')
+        else:
+            fo.write('        (col, null) = fix_values(col, null, bad, ' + str(replacement) + ')\n')
+            fo.write('        fixed |= bad\n')
+        fo.write('        violations[' + repr(key) + '] += int(bad.sum())\n')
+        fo.write('        if rejects is not None:\n')
+        fo.write('            failures += [(bad, ' + failure + ')]\n')
+    
+    def write_row_action(action, message, replacement, sind, key):
+        """
+        Write what the row engine does with a value that fails a check.
+        
+        :param action: FATAL, DROP or FIX
+        :type action: str
+        :param message: code for the message of the ValueError raised if action is FATAL
+        :type message: str
+        :param replacement: replacement value if action is FIX
+        :type replacement: field type
+        :param sind: code for the position of the field in the row
+        :type sind: str
+        :param key: field name and check, the key of the violations of ReaderStats
+        :type key: tuple
+        """
+        if action == 'FATAL':
+            # a FATAL error drops the row until there are more than max_errors of them
+            fo.write('                errors += 1\n')
+            fo.write('                if errors > max_errors:\n')
+            fo.write('                    raise ValueError(' + message + ')\n')
+        if action == 'FIX':
+            fo.write('                fx[' + sind + '] = ' + str(replacement) + '\n')
+            fo.write('                if fixed_row != row_number:\n')
+            fo.write('                    fixed_row = row_number\n')
+            fo.write('                    count_fixed += 1\n')
+        else:
+            fo.write('                keepx = False\n')
+            if key[1] == 'conversion':
+                # so that the checks that follow do not compare the raw value
+                fo.write('                fx[' + sind + '] = None\n')
+        fo.write('                violations[' + repr(key) + '] += 1\n')
+        fo.write('                failed += [' + repr(':'.join(key + (action.lower(),))) + ']\n')
+    
+    def write_tick(stage, indent):
+        """
+        Write the code that, with *stats*, clocks the end of a stage of ReaderStats.
+        
+        :param stage: read, split, filter, convert, validate, hooks or output
+        :type stage: str
+        :param indent: indentation of the code
+        :type indent: int
+        """
+        stages = ('read', 'split', 'filter', 'convert', 'validate', 'hooks', 'output')
+        fo.write(' ' * indent + 'if timing:\n')
+        fo.write(' ' * indent + '    (t0, t) = (t, clock())\n')
+        fo.write(' ' * indent + '    times[' + str(stages.index(stage)) + '] += t - t0\n')
+    
+    def date_layout(var_format):
+        """
+        Pick the layout of a DATE field from its *field_format*, in the order the reader has always checked them.
+        
+        :param var_format: field_format of the field
+        :type var_format: str
+        :return: key of date_layouts and the code for the adjustment ('E', 'B' or None)
+        :rtype: str, str
+        """
+        for date_format in ('CCYYMMDD', 'CCYYMM', 'YYMM', 'MM/DD/YY', 'MMDDCCYY', 'MM/CCYY', 'CCYY/MM/DD',
+                            'MM/DD/CCYY'):
+            if var_format.upper().find(date_format) >= 0:
+                break
+        if var_format[-1] in ('E', 'B'):
+            adjust = "'" + var_format[-1] + "'"
+        else:
+            adjust = 'None'
+        return date_format, adjust
+    
+    def write_row_output():
+        """
+        Write the part of the loop that passes fx_out through the user hooks and on to the output.
+        Both engines write this once per row that is kept.
+        """
+        fo.write('            if keepx:\n')
+        fo.write('                if user_function is not None:\n')
+        fo.write('                    keepx = user_function(fx_out)\n')
+        fo.write('                if keepx and (user_class is not None):\n')
+        fo.write('                    keepx = user_methodx(fx_out)\n')
+        write_tick('hooks', 16)
+        fo.write('                if keepx:\n')
+        fo.write('                    for name in drop_names:\n')
+        fo.write('                        fx_out.pop(name, None)\n')
+        fo.write('                    if starting:\n')
+        fo.write('                        out_names = list(fx_out.keys())\n')
+        fo.write('                        if partition is not None:\n')
+        fo.write('                            if partition not in fx_out.keys():\n')
+        fo.write('                                raise ValueError("partition variable not in output file")\n')
+        fo.write('                            out_names = [r for r in out_names if r != partition]\n')
+        fo.write("                    if output_type == 'DELIM':\n")
+        fo.write('                        if delim_writer is None:\n')
+        fo.write('                            delim_writer = DelimWriter(output_file, list(fx_out.keys()), output_delim,\n')
+        fo.write('                                                       output_headers, partition, split_file, compression,\n')
+        fo.write('                                                       write_buffer, write_thread, compression_level,\n')
+        fo.write('                                                       compression_threads, max_open_files)\n')
+        fo.write('                            starting = False\n')
+        fo.write('                        delim_writer.write_row(fx_out)\n')
+        fo.write("                    elif output_type == 'TFRECORDS':\n")
+        fo.write('                        if tfrecord_writer is None:\n')
+        fo.write('                            tfrecord_writer = ExampleWriter(output_file, out_names, compression,\n')
+        fo.write('                                                            compression_level)\n')
+        fo.write('                            starting = False\n')
+        fo.write('                        tfrecord_writer.write_row(fx_out)\n')
+        fo.write("                    elif output_type in ('PARQUET', 'ARROW'):\n")
+        fo.write('                        if table_writer is None:\n')
+        fo.write('                            table_writer = TableWriter(output_file, output_type, list(fx_out.keys()), partition,\n')
+        fo.write('                                                       split_file, compression, row_group_rows,\n')
+        fo.write('                                                       compression_level)\n')
+        fo.write('                            starting = False\n')
+        fo.write('                        table_writer.write_row(fx_out)\n')
+        fo.write('                    else:\n')
+        fo.write('                        fx_out = [fx_out[cc] for cc in list(fx_out.keys())]\n')
+        fo.write('                        output_data += [fx_out]\n')
+        fo.write('                        if sample_size is not None:\n')
+        fo.write('                            # the reservoir is cut back to sample_size when it holds twice that\n')
+        fo.write('                            sample_keys += [sampler.key()]\n')
+        fo.write('                            if len(sample_keys) >= 2 * sample_size:\n')
+        fo.write('                                (output_data, sample_keys) = cut_rows(output_data, sample_keys, sample_size)\n')
+        fo.write('                        if (batch_rows is not None) and (len(output_data) >= batch_rows):\n')
+        fo.write('                            yield rows_output(output_data, out_names, output_type)\n')
+        fo.write('                            output_data = []\n')
+        fo.write('                    count_out += 1\n')
+        write_tick('output', 20)
+    
     if (string_delim != None) and (delimiter != ','):
         raise ValueError('string_delim must also have a delim as a comma')
     
+    if cache_dir is not None:
+        import importlib.util
+        import py_compile
+        import shutil
+        import sys
+        import tempfile
+        name = module_name + '_' + reader_digest()[0:16]
+        if name in sys.modules:
+            return sys.modules[name]
+        path = os.path.join(cache_dir, name)
+        if not os.path.isdir(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = tempfile.mkdtemp(prefix='.' + name + '.', dir=cache_dir)
+            try:
+                os.mkdir(tmp_path + '/data')
+                create_reader(data_dict, tmp_path, file_format, delimiter, lrecl, string_delim, remove_char,
+                              module_name, engine)
+                py_compile.compile(tmp_path + '/' + module_name + '.py', doraise=True)
+                os.rename(tmp_path, path)
+            except OSError:
+                # another job put the same reader in place first
+                if not os.path.isdir(path):
+                    raise
+            finally:
+                if os.path.isdir(tmp_path):
+                    shutil.rmtree(tmp_path)
+        spec = importlib.util.spec_from_file_location(name, path + '/' + module_name + '.py')
+        module = importlib.util.module_from_spec(spec)
+        # registered under its own name so that multi_process can pickle its reader
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except:
+            del sys.modules[name]
+            raise
+        return module
+    
+    engine = engine.upper()
+    if engine not in ('ROW', 'VECTORIZED'):
+        raise ValueError("engine must be either ROW or VECTORIZED")
+    if (file_format.upper() == 'FLAT') and (engine == 'VECTORIZED') and (lrecl is not None):
+        for ind in range(len(data_dict)):
+            if data_dict[ind]['field_start'] - 1 + data_dict[ind]['field_width'] > lrecl:
+                raise ValueError('field ' + data_dict[ind]['field_name'] + ' runs past the end of the record')
+    
     if reader_path is None:
         reader_file = pkg_resources.resource_filename('data_reader', 'reader/') + 'reader.py'
     else:
@@ -716,10 +2254,38 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('import numpy as np\n')
     fo.write('import pandas as pd\n')
     fo.write('import collections as co\n')
+    fo.write('import functools\n')
+    fo.write('import itertools\n')
+    fo.write('import operator\n')
     fo.write('import os\n')
-    fo.write('from subprocess import call\n')
+    fo.write('import struct\n')
+    fo.write('import time\n')
     fo.write('import tensorflow as tf\n')
     fo.write('\n')
+    fo.write('# the fields of the data dictionary, in order\n')
+    fo.write('field_names = ' + str([data_dict[ind]['field_name'] for ind in range(len(data_dict))]) + '\n')
+    fo.write('field_types = ' + str([data_dict[ind]['field_type'].upper() for ind in range(len(data_dict))]) + '\n')
+    fo.write('# (date format, adjustment) of each DATE field\n')
+    date_formats = []
+    for ind in range(len(data_dict)):
+        if data_dict[ind]['field_type'].upper() == 'DATE':
+            (date_format, adjust) = date_layout(data_dict[ind]['field_format'])
+            date_formats += ['(' + repr(date_format) + ', ' + adjust + ')']
+        else:
+            date_formats += ['None']
+    fo.write('date_formats = [' + ', '.join(date_formats) + ']\n')
+    fo.write('remove_char = ' + repr(remove_char) + '\n')
+    if (file_format.upper() == 'FLAT') and (engine == 'VECTORIZED') and (lrecl is not None):
+        fo.write('# the layout of a record: each field is a fixed width bytes string\n')
+        fo.write("record_dtype = np.dtype({'names': " + str(['f' + str(ind) for ind in range(len(data_dict))]) + ',\n')
+        fo.write("                         'formats': " +
+                 str(['S' + str(data_dict[ind]['field_width']) for ind in range(len(data_dict))]) + ',\n')
+        fo.write("                         'offsets': " +
+                 str([data_dict[ind]['field_start'] - 1 for ind in range(len(data_dict))]) + ',\n')
+        fo.write("                         'itemsize': " + str(lrecl) + '})\n')
+    fo.write('# column names and legal values read by load_setup\n')
+    fo.write('setup_cache = {}\n')
+    fo.write('\n')
 
     
     if string_delim is not None:
@@ -760,6 +2326,441 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('    return dt\n')
     fo.write('\n')
     fo.write('\n')
+    fo.write('# (year, month, day) positions of each date format.  *None* means the day is the first of the month.\n')
+    fo.write("date_layouts = {'CCYYMMDD': ((0, 4), (4, 6), (6, 8)),\n")
+    fo.write("                'CCYYMM': ((0, 4), (4, 6), None),\n")
+    fo.write("                'YYMM': ((0, 2), (2, 4), None),\n")
+    fo.write("                'MM/DD/YY': ((6, 8), (0, 2), (3, 5)),\n")
+    fo.write("                'MMDDCCYY': ((4, 8), (0, 2), (2, 4)),\n")
+    fo.write("                'MM/CCYY': ((3, 7), (0, 2), None),\n")
+    fo.write("                'CCYY/MM/DD': ((0, 4), (5, 7), (8, 10)),\n")
+    fo.write("                'MM/DD/CCYY': ((6, 10), (0, 2), (3, 5))}\n")
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('def date_decoder(date_format, adjust=None, remove_char=None, cache_size=65536):\n')
+    fo.write('    """\n')
+    fo.write('    Make a function that converts one raw value (str or bytes) to a date.  Dates repeat a great deal, so the\n')
+    fo.write('    results are kept in a cache of the *cache_size* most recent values and each distinct value is converted\n')
+    fo.write('    once.  The function raises ValueError or IndexError if the value is not a date.\n')
+    fo.write('\n')
+    fo.write('    :param date_format: one of the keys of date_layouts\n')
+    fo.write('    :type date_format: str\n')
+    fo.write('    :param adjust: "E" to move to the end of the month, "B" to move to the start of the month\n')
+    fo.write('    :type adjust: str\n')
+    fo.write('    :param remove_char: character to remove from the value before it is converted\n')
+    fo.write('    :type remove_char: str\n')
+    fo.write('    :param cache_size: number of values to keep in the cache\n')
+    fo.write('    :type cache_size: int\n')
+    fo.write('    :return: function of the raw value returning a date\n')
+    fo.write('    :rtype: function\n')
+    fo.write('    """\n')
+    fo.write('    layout = date_layouts[date_format]\n')
+    fo.write("    by_parts = (date_format.find('/') == 2) and (date_format.count('/') == 2)\n")
+    fo.write('\n')
+    fo.write('    @functools.lru_cache(maxsize=cache_size)\n')
+    fo.write('    def decode(raw):\n')
+    fo.write('        if not isinstance(raw, str):\n')
+    fo.write('            raw = raw.decode()\n')
+    fo.write('        if remove_char is not None:\n')
+    fo.write("            raw = raw.replace(remove_char, '')\n")
+    fo.write('        if by_parts:\n')
+    fo.write("            dt = [int(x) for x in re.findall('([^/]+)', raw)]\n")
+    fo.write('            dt = datetime.date(dt[2], dt[0], dt[1])\n')
+    fo.write('        else:\n')
+    fo.write('            sp = [(int(raw[span[0]:span[1]]) if span is not None else 1) for span in layout]\n')
+    fo.write('            dt = datetime.date(sp[0], sp[1], sp[2])\n')
+    fo.write("        if adjust == 'E':\n")
+    fo.write('            dt = to_end_of_month(dt)\n')
+    fo.write("        if adjust == 'B':\n")
+    fo.write('            dt = dt.replace(day=1)\n')
+    fo.write('        return dt\n')
+    fo.write('\n')
+    fo.write('    return decode\n')
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('# filter operators, by the name used in the filters parameter\n')
+    fo.write("filter_ops = {'==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt,\n")
+    fo.write("              '>=': operator.ge}\n")
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('def filter_value(field_type, op, value):\n')
+    fo.write('    """\n')
+    fo.write('    Put the value of a filter in the form it is compared in: a frozenset for "in" and "not in", a date for a\n')
+    fo.write('    DATE field.\n')
+    fo.write('\n')
+    fo.write('    :param field_type: field_type of the field filtered\n')
+    fo.write('    :type field_type: str\n')
+    fo.write('    :param op: ==, !=, <, <=, >, >=, in or not in\n')
+    fo.write('    :type op: str\n')
+    fo.write('    :param value: value of the filter\n')
+    fo.write('    :type value: field type or list\n')
+    fo.write('    :return: value to compare with\n')
+    fo.write('    :rtype: field type or frozenset\n')
+    fo.write('    """\n')
+    fo.write("    if op in ('in', 'not in'):\n")
+    fo.write("        return frozenset([filter_value(field_type, '==', val) for val in value])\n")
+    fo.write("    if (field_type == 'DATE') and (str(type(value)).find('datetime64') >= 0):\n")
+    fo.write("        return np.datetime64(value, 'D').astype(object)\n")
+    fo.write('    return value\n')
+    fo.write('\n')
+    fo.write('\n')
+    if engine == 'ROW':
+        fo.write('def row_filter(ind, op, value, cache_size=65536):\n')
+        fo.write('    """\n')
+        fo.write('    Make a function that tests the raw value of field *ind* (bytes or str, as split from the line) against a filter.\n')
+        fo.write("    The raw value is converted as the field converts it, but it is not checked against the field's minimum, maximum\n")
+        fo.write('    or legal values.  A value that does not convert fails the test.\n')
+        fo.write('\n')
+        fo.write('    :param ind: position of the field in field_names\n')
+        fo.write('    :type ind: int\n')
+        fo.write('    :param op: ==, !=, <, <=, >, >=, in or not in\n')
+        fo.write('    :type op: str\n')
+        fo.write('    :param value: value of the filter\n')
+        fo.write('    :type value: field type or list\n')
+        fo.write('    :param cache_size: size of the cache of converted dates\n')
+        fo.write('    :type cache_size: int\n')
+        fo.write('    :return: function of the raw value returning True if the row passes\n')
+        fo.write('    :rtype: function\n')
+        fo.write('    """\n')
+        fo.write('    field_type = field_types[ind]\n')
+        fo.write('    value = filter_value(field_type, op, value)\n')
+        fo.write("    if field_type == 'DATE':\n")
+        fo.write('        decode = date_decoder(date_formats[ind][0], date_formats[ind][1], remove_char, cache_size)\n')
+        fo.write('\n')
+        fo.write('    def convert(raw):\n')
+        fo.write("        if field_type == 'DATE':\n")
+        fo.write('            return decode(raw)\n')
+        fo.write("        if field_type == 'BYTES':\n")
+        fo.write('            return raw\n')
+        fo.write('        if not isinstance(raw, str):\n')
+        fo.write('            raw = raw.decode()\n')
+        fo.write("        if field_type == 'INT':\n")
+        fo.write("            return int(float(raw.replace(remove_char or '', '')))\n")
+        fo.write("        if field_type == 'FLOAT':\n")
+        fo.write("            return float(raw.replace(remove_char or '', ''))\n")
+        fo.write("        raw = raw.strip('\\n').strip('\\r').strip(' ').replace(remove_char or '', '')\n")
+        fo.write("        if (field_type == 'ZIP') and (len(raw) in (3, 4)):\n")
+        fo.write('            raw = raw.zfill(5)\n')
+        fo.write('        return raw\n')
+        fo.write('\n')
+        fo.write('    def check(raw):\n')
+        fo.write('        try:\n')
+        fo.write("            if op == 'in':\n")
+        fo.write('                return convert(raw) in value\n')
+        fo.write("            if op == 'not in':\n")
+        fo.write('                return convert(raw) not in value\n')
+        fo.write('            return filter_ops[op](convert(raw), value)\n')
+        fo.write('        except (ValueError, IndexError, TypeError):\n')
+        fo.write('            return False\n')
+        fo.write('\n')
+        fo.write('    return check\n')
+        fo.write('\n')
+        fo.write('\n')
+
+    fo.write('def data_compression(data_file, compression=None):\n')
+    fo.write('    """\n')
+    fo.write('    The compression of *data_file*: GZIP, BZ2, XZ, ZSTD or *None* for an uncompressed file.\n')
+    fo.write('\n')
+    fo.write('    :param data_file: file to read\n')
+    fo.write('    :type data_file: str\n')
+    fo.write('    :param compression: gzip, bz2, xz, zstd or none.  The default is *None*: go by the extension of *data_file*.\n')
+    fo.write('    :type compression: str\n')
+    fo.write('    :return: compression\n')
+    fo.write('    :rtype: str\n')
+    fo.write('    """\n')
+    fo.write('    if compression is None:\n')
+    fo.write("        extensions = {'gz': 'GZIP', 'bgz': 'GZIP', 'bz2': 'BZ2', 'xz': 'XZ', 'zst': 'ZSTD'}\n")
+    fo.write("        return extensions.get(data_file[data_file.rfind('.') + 1:].lower())\n")
+    fo.write('    compression = compression.upper()\n')
+    fo.write("    if compression == 'NONE':\n")
+    fo.write('        return None\n')
+    fo.write("    if compression not in ('GZIP', 'BZ2', 'XZ', 'ZSTD'):\n")
+    fo.write("        raise ValueError('input_compression must be one of: gzip, bz2, xz, zstd, none')\n")
+    fo.write('    return compression\n')
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('def decompressor(compression):\n')
+    fo.write('    """\n')
+    fo.write('    A decompressor for one block (gzip member, bz2 or xz stream, zstd frame) of a compressed file.\n')
+    fo.write('\n')
+    fo.write('    :param compression: GZIP, BZ2, XZ or ZSTD\n')
+    fo.write('    :type compression: str\n')
+    fo.write('    :return: decompressor with methods decompress and attributes eof and unused_data\n')
+    fo.write('    :rtype: object\n')
+    fo.write('    """\n')
+    fo.write("    if compression == 'GZIP':\n")
+    fo.write('        import zlib\n')
+    fo.write('        return zlib.decompressobj(31)\n')
+    fo.write("    if compression == 'BZ2':\n")
+    fo.write('        import bz2\n')
+    fo.write('        return bz2.BZ2Decompressor()\n')
+    fo.write("    if compression == 'XZ':\n")
+    fo.write('        import lzma\n')
+    fo.write('        return lzma.LZMADecompressor()\n')
+    fo.write('    try:\n')
+    fo.write('        import zstandard\n')
+    fo.write('    except ImportError:\n')
+    fo.write("        raise ImportError('reading zstd files requires zstandard')\n")
+    fo.write('    return zstandard.ZstdDecompressor().decompressobj()\n')
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('def decompress_stream(fi, compression, piece=1 << 20):\n')
+    fo.write('    """\n')
+    fo.write('    Decompress *fi* from where it is positioned to the end, block after block, a piece at a time.\n')
+    fo.write('\n')
+    fo.write('    :param fi: compressed file, opened "rb"\n')
+    fo.write('    :type fi: file\n')
+    fo.write('    :param compression: GZIP, BZ2, XZ or ZSTD\n')
+    fo.write('    :type compression: str\n')
+    fo.write('    :param piece: number of compressed bytes to decompress at a time\n')
+    fo.write('    :type piece: int\n')
+    fo.write('    :return: decompressed pieces\n')
+    fo.write('    :rtype: iterator of bytes\n')
+    fo.write('    """\n')
+    fo.write('    dec = None\n')
+    fo.write("    pending = b''\n")
+    fo.write('    while True:\n')
+    fo.write('        if not pending:\n')
+    fo.write('            pending = fi.read(piece)\n')
+    fo.write('            if not pending:\n')
+    fo.write('                break\n')
+    fo.write('        if dec is None:\n')
+    fo.write('            dec = decompressor(compression)\n')
+    fo.write('        out = dec.decompress(pending)\n')
+    fo.write('        if dec.eof:\n')
+    fo.write('            # the rest belongs to the next block\n')
+    fo.write('            pending = dec.unused_data\n')
+    fo.write('            dec = None\n')
+    fo.write('        else:\n')
+    fo.write("            pending = b''\n")
+    fo.write('        if out:\n')
+    fo.write('            yield out\n')
+    fo.write('    if dec is not None:\n')
+    fo.write("        raise ValueError('compressed file ends in the middle of a block')\n")
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('class StreamMap(object):\n')
+    fo.write('    """\n')
+    fo.write('    The data of a compressed file, decompressed a piece at a time as it is read.  It has the methods of a memory map\n')
+    fo.write('    that a reader uses (find, rfind, readline, seek, tell, slices and close) at the places the data would have in a\n')
+    fo.write('    memory map of it, so that a compressed file is read as an uncompressed one is.  It only goes forward: it holds the\n')
+    fo.write('    data from the start of the last read on, less *lookback* bytes, and reading before that raises ValueError.\n')
+    fo.write('    """\n')
+    fo.write('    \n')
+    fo.write("    def __init__(self, pieces, head=b'', look=None, lookback=0):\n")
+    fo.write('        """\n')
+    fo.write('        :param pieces: decompressed pieces of the data\n')
+    fo.write('        :type pieces: iterator of bytes\n')
+    fo.write('        :param head: bytes put in front of the data (the headers)\n')
+    fo.write('        :type head: bytes\n')
+    fo.write('        :param look: the data ends at the end of the line holding this byte, or at the end of *pieces* if that line\n')
+    fo.write('          does not end.  The default is *None*: the end of *pieces*.\n')
+    fo.write('        :type look: int\n')
+    fo.write('        :param lookback: number of bytes before the start of each read that are held\n')
+    fo.write('        :type lookback: int\n')
+    fo.write('        """\n')
+    fo.write('        self.pieces = pieces\n')
+    fo.write('        self.data = bytearray(head)\n')
+    fo.write('        # low is the place of the first byte of data, mark the first place that is still needed\n')
+    fo.write('        self.low = 0\n')
+    fo.write('        self.mark = 0\n')
+    fo.write('        self.look = look\n')
+    fo.write('        self.lookback = lookback\n')
+    fo.write('        self.done = False\n')
+    fo.write('        self.place = 0\n')
+    fo.write("        if (look is not None) and (self.data.find(b'\\n', look) >= 0):\n")
+    fo.write("            del self.data[self.data.find(b'\\n', look) + 1:]\n")
+    fo.write('            self.done = True\n')
+    fo.write('    \n')
+    fo.write('    def fill(self, upto):\n')
+    fo.write('        """\n')
+    fo.write('        Decompress until the data through *upto* is held or the data ends.\n')
+    fo.write('        \n')
+    fo.write('        :param upto: place to decompress through\n')
+    fo.write('        :type upto: int\n')
+    fo.write('        :return: end of the data held\n')
+    fo.write('        :rtype: int\n')
+    fo.write('        """\n')
+    fo.write('        while (not self.done) and (self.low + len(self.data) < upto):\n')
+    fo.write('            end = self.low + len(self.data)\n')
+    fo.write('            try:\n')
+    fo.write('                out = next(self.pieces)\n')
+    fo.write('            except StopIteration:\n')
+    fo.write('                self.done = True\n')
+    fo.write('                break\n')
+    fo.write('            if (self.look is not None) and (end + len(out) > self.look):\n')
+    fo.write("                cut = out.find(b'\\n', max(self.look - end, 0))\n")
+    fo.write('                if cut >= 0:\n')
+    fo.write('                    out = out[0:cut + 1]\n')
+    fo.write('                    self.done = True\n')
+    fo.write('            # let go of the bytes before mark once they are half of what is held\n')
+    fo.write('            drop = min(self.mark - self.low, len(self.data) + len(out))\n')
+    fo.write('            if 2 * drop >= len(self.data):\n')
+    fo.write('                out = out[max(drop - len(self.data), 0):]\n')
+    fo.write('                del self.data[0:drop]\n')
+    fo.write('                self.low += drop\n')
+    fo.write('            self.data += out\n')
+    fo.write('        return min(upto, self.low + len(self.data))\n')
+    fo.write('    \n')
+    fo.write('    def read_at(self, start):\n')
+    fo.write('        """\n')
+    fo.write('        Note that the data from *start*, less *lookback* bytes, is still needed and the data before it is not.\n')
+    fo.write('        \n')
+    fo.write('        :param start: place of a read\n')
+    fo.write('        :type start: int\n')
+    fo.write('        """\n')
+    fo.write('        if start < self.low:\n')
+    fo.write("            raise ValueError('cannot go back to byte ' + str(start) + ' of a compressed file')\n")
+    fo.write('        self.mark = max(self.mark, start - self.lookback)\n')
+    fo.write('    \n')
+    fo.write('    def __getitem__(self, key):\n')
+    fo.write('        start = key.start or 0\n')
+    fo.write('        self.read_at(start)\n')
+    fo.write('        if key.stop is None:\n')
+    fo.write('            stop = self.fill(1 << 62)\n')
+    fo.write('        else:\n')
+    fo.write('            stop = self.fill(key.stop)\n')
+    fo.write('        with memoryview(self.data) as view:\n')
+    fo.write('            return bytes(view[start - self.low:max(stop - self.low, 0)])\n')
+    fo.write('    \n')
+    fo.write('    def find(self, sub, start=0, end=None):\n')
+    fo.write('        if start < self.low:\n')
+    fo.write("            raise ValueError('cannot go back to byte ' + str(start) + ' of a compressed file')\n")
+    fo.write('        if end is None:\n')
+    fo.write('            end = 1 << 62\n')
+    fo.write('        held = self.fill(start + len(sub))\n')
+    fo.write('        while True:\n')
+    fo.write('            place = self.data.find(sub, max(start - self.low, 0), end - self.low)\n')
+    fo.write('            if (place >= 0) or self.done or (held >= end):\n')
+    fo.write('                return place if place < 0 else place + self.low\n')
+    fo.write('            # the search goes on from where it got to in the next piece\n')
+    fo.write('            start = max(start, held - len(sub) + 1)\n')
+    fo.write('            held = self.fill(self.low + len(self.data) + 1)\n')
+    fo.write('    \n')
+    fo.write('    def rfind(self, sub, start=0, end=None):\n')
+    fo.write('        if start < self.low:\n')
+    fo.write("            raise ValueError('cannot go back to byte ' + str(start) + ' of a compressed file')\n")
+    fo.write('        if end is None:\n')
+    fo.write('            end = 1 << 62\n')
+    fo.write('        end = self.fill(end)\n')
+    fo.write('        place = self.data.rfind(sub, max(start - self.low, 0), max(end - self.low, 0))\n')
+    fo.write('        return place if place < 0 else place + self.low\n')
+    fo.write('    \n')
+    fo.write('    def readline(self):\n')
+    fo.write("        end = self.find(b'\\n', self.place)\n")
+    fo.write('        if end < 0:\n')
+    fo.write('            end = self.fill(1 << 62)\n')
+    fo.write('        else:\n')
+    fo.write('            end += 1\n')
+    fo.write('        line = self[self.place:end]\n')
+    fo.write('        self.place = end\n')
+    fo.write('        return line\n')
+    fo.write('    \n')
+    fo.write('    def seek(self, place):\n')
+    fo.write('        self.place = place\n')
+    fo.write('    \n')
+    fo.write('    def tell(self):\n')
+    fo.write('        return self.place\n')
+    fo.write('    \n')
+    fo.write('    def close(self):\n')
+    fo.write('        self.data = bytearray()\n')
+    fo.write('        self.pieces = iter(())\n')
+    fo.write('        self.done = True\n')
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('def data_end(m, place):\n')
+    fo.write('    """\n')
+    fo.write('    Where the data of *m* ends if that is before *place*, otherwise *place*.  A StreamMap decompresses through *place*\n')
+    fo.write('    to find out.\n')
+    fo.write('    \n')
+    fo.write('    :param m: map of the data\n')
+    fo.write('    :type m: mmap or StreamMap\n')
+    fo.write('    :param place: place in the data.  *None* is the end of the data.\n')
+    fo.write('    :type place: int\n')
+    fo.write('    :return: the smaller of *place* and the end of the data\n')
+    fo.write('    :rtype: int\n')
+    fo.write('    """\n')
+    fo.write('    if place is None:\n')
+    fo.write('        place = 1 << 62\n')
+    fo.write("    if str(type(m)).find('StreamMap') >= 0:\n")
+    fo.write('        return m.fill(place)\n')
+    fo.write('    return min(place, len(m))\n')
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('def open_data(data_file, compression, start_byte, end_byte, headers, block_index=None, lookback=0):\n')
+    fo.write('    """\n')
+    fo.write('    Open *data_file* to read.  An uncompressed file is memory mapped.  A compressed file is decompressed a piece at\n')
+    fo.write('    a time as it is read (see StreamMap), from *start_byte* through the end of the line at *end_byte*, so that only\n')
+    fo.write('    the pieces being read are held.  The decompression starts at the block holding *start_byte* if there is a block\n')
+    fo.write('    index built by data_reader.build_block_index, otherwise at the start of the file.  With *headers*, the first line\n')
+    fo.write('    of the file is put in front of the data so that it can be read as usual.\n')
+    fo.write('    \n')
+    fo.write('    :param data_file: file to read\n')
+    fo.write('    :type data_file: str\n')
+    fo.write('    :param compression: GZIP, BZ2, XZ, ZSTD or *None*\n')
+    fo.write('    :type compression: str\n')
+    fo.write('    :param start_byte: byte of the (uncompressed) data to start at\n')
+    fo.write('    :type start_byte: int\n')
+    fo.write('    :param end_byte: byte of the (uncompressed) data to stop at, *None* is the end\n')
+    fo.write('    :type end_byte: int\n')
+    fo.write('    :param headers: True means the first line is headers\n')
+    fo.write('    :type headers: bool\n')
+    fo.write('    :param block_index: block index file.  The default is *data_file* + ".blocks.npy", if it is there.\n')
+    fo.write('    :type block_index: str\n')
+    fo.write('    :param lookback: number of bytes before each read of a compressed file that can still be read\n')
+    fo.write('    :type lookback: int\n')
+    fo.write('    :return: the open file, the map of the data and the byte of the data at the start of the map\n')
+    fo.write('    :rtype: file, mmap or StreamMap, int\n')
+    fo.write('    """\n')
+    fo.write('    if compression is None:\n')
+    fo.write('        try:\n')
+    fo.write('            fi = open(data_file, "r")\n')
+    fo.write('        except:\n')
+    fo.write('            raise FileNotFoundError("cannot find/open file: " + data_file)\n')
+    fo.write('        return fi, mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ), 0\n')
+    fo.write('    try:\n')
+    fo.write('        fi = open(data_file, "rb")\n')
+    fo.write('    except:\n')
+    fo.write('        raise FileNotFoundError("cannot find/open file: " + data_file)\n')
+    fo.write('    start_byte = max(int(start_byte), 0)\n')
+    fo.write("    head = b''\n")
+    fo.write('    if headers and (start_byte > 0):\n')
+    fo.write('        for out in decompress_stream(fi, compression):\n')
+    fo.write('            head += out\n')
+    fo.write('            if head.find(b"\\n") >= 0:\n')
+    fo.write('                break\n')
+    fo.write('        if head.find(b"\\n") >= 0:\n')
+    fo.write('            head = head[0:head.find(b"\\n") + 1]\n')
+    fo.write('    # place is the byte of the data at the start of the next piece decompressed\n')
+    fo.write('    place = 0\n')
+    fo.write('    fi.seek(0)\n')
+    fo.write('    if block_index is None:\n')
+    fo.write("        block_index = data_file + '.blocks.npy'\n")
+    fo.write('    if (start_byte > 0) and os.path.exists(block_index):\n')
+    fo.write('        index = np.load(block_index)\n')
+    fo.write('        if int(index[-1, 0]) != os.stat(data_file).st_size:\n')
+    fo.write("            raise ValueError('block_index ' + block_index + ' does not match data_file')\n")
+    fo.write("        block = max(int(np.searchsorted(index[0:-1, 1], start_byte, side='right')) - 1, 0)\n")
+    fo.write('        fi.seek(int(index[block, 0]))\n')
+    fo.write('        place = int(index[block, 1])\n')
+    fo.write('    base = start_byte - len(head)\n')
+    fo.write('    look = None\n')
+    fo.write('    if end_byte is not None:\n')
+    fo.write('        look = max(int(end_byte) - base, 0)\n')
+    fo.write('    \n')
+    fo.write('    def pieces(place):\n')
+    fo.write('        # the pieces from start_byte on.  They are small, so that little more than what is being read is held.\n')
+    fo.write('        for out in decompress_stream(fi, compression, 1 << 16):\n')
+    fo.write('            if place + len(out) > start_byte:\n')
+    fo.write('                yield out[max(start_byte - place, 0):]\n')
+    fo.write('            place += len(out)\n')
+    fo.write('    \n')
+    fo.write('    m = StreamMap(pieces(place), head, look, lookback)\n')
+    fo.write('    if m.fill(1) == 0:\n')
+    fo.write('        raise ValueError("no data to read in " + data_file)\n')
+    fo.write('    return fi, m, base\n')
+    fo.write('\n')
+    fo.write('\n')
 
     fo.write('def make_opf(outfile, partition=None, split_number=None):\n')
     fo.write('    """\n')
@@ -804,6 +2805,1616 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('        opf += str(split_number)\n')
     fo.write('    opf += dotpart\n')
     fo.write('    return opf\n')
+    fo.write('\n')
+    fo.write('\n')
+
+    fo.write('class TableWriter(object):\n')
+    fo.write('    """\n')
+    fo.write('    Write rows to Parquet or Arrow IPC files for output_type="parquet" or "arrow".\n')
+    fo.write('    Rows are gathered into typed row groups of *row_group_rows* rows, so only one row group per file is held in\n')
+    fo.write('    memory.  The schema comes from the field types of the data dictionary.  The types of any fields added by the\n')
+    fo.write('    user are taken from their first row group.\n')
+    fo.write('\n')
+    fo.write('    With *partition*, there is a subdirectory "partition=value" for each value of the partition field, which is\n')
+    fo.write('    not written to the files.  With *split_file*, a new file is started after each *split_file* rows.\n')
+    fo.write('    """\n')
+    fo.write('\n')
+    fo.write('    def __init__(self, output_file, output_type, names, partition=None, split_file=None, compression=None,\n')
+    fo.write('                 row_group_rows=100000, compression_level=None):\n')
+    fo.write('        """\n')
+    fo.write('        :param output_file: name of the output file\n')
+    fo.write('        :type output_file: str\n')
+    fo.write('        :param output_type: PARQUET or ARROW\n')
+    fo.write('        :type output_type: str\n')
+    fo.write('        :param names: names of the fields of each row, including the partition field\n')
+    fo.write('        :type names: list\n')
+    fo.write('        :param partition: name of the field to partition the files on\n')
+    fo.write('        :type partition: str\n')
+    fo.write('        :param split_file: maximum number of rows in each file\n')
+    fo.write('        :type split_file: int\n')
+    fo.write('        :param compression: codec: for parquet snappy (the default), gzip, brotli, zstd, lz4 or none; for arrow\n')
+    fo.write('          none (the default), lz4 or zstd\n')
+    fo.write('        :type compression: str\n')
+    fo.write('        :param row_group_rows: number of rows in each row group\n')
+    fo.write('        :type row_group_rows: int\n')
+    fo.write('        :param compression_level: level of compression.  The default is the default of the codec.\n')
+    fo.write('        :type compression_level: int\n')
+    fo.write('        """\n')
+    fo.write('        try:\n')
+    fo.write('            import pyarrow as pa\n')
+    fo.write('            import pyarrow.parquet as pq\n')
+    fo.write('        except ImportError:\n')
+    fo.write('            raise ImportError(\'output_type "parquet" and "arrow" require pyarrow\')\n')
+    fo.write('        self.pa = pa\n')
+    fo.write('        self.pq = pq\n')
+    fo.write('        self.output_file = output_file\n')
+    fo.write('        self.output_type = output_type\n')
+    fo.write('        self.names = list(names)\n')
+    fo.write('        if (partition is not None) and (partition not in self.names):\n')
+    fo.write('            raise ValueError("partition variable not in output file")\n')
+    fo.write('        self.partition = partition\n')
+    fo.write('        self.out_names = [name for name in self.names if name != partition]\n')
+    fo.write('        self.split_file = split_file\n')
+    fo.write('        if compression is None:\n')
+    fo.write("            if output_type == 'PARQUET':\n")
+    fo.write("                compression = 'snappy'\n")
+    fo.write("        elif compression.upper() == 'NONE':\n")
+    fo.write('            compression = None\n')
+    fo.write('        self.compression = compression\n')
+    fo.write('        self.row_group_rows = row_group_rows\n')
+    fo.write('        self.compression_level = compression_level\n')
+    fo.write("        arrow_types = {'INT': pa.int64(), 'FLOAT': pa.float64(), 'DATE': pa.date32(), 'STR': pa.string(),\n")
+    fo.write("                       'ZIP': pa.string(), 'STATE': pa.string(), 'STATETERR': pa.string(), 'BYTES': pa.binary()}\n")
+    fo.write('        self.types = dict([(name, arrow_types[field_type]) for (name, field_type) in zip(field_names, field_types)])\n')
+    fo.write('        self.schema = None\n')
+    fo.write('        # for each value of the partition field: [rows, tables, number of rows, writer, file number, rows in file]\n')
+    fo.write('        self.outputs = {}\n')
+    fo.write('\n')
+    fo.write('    def write_row(self, row):\n')
+    fo.write('        """\n')
+    fo.write('        Add a row.\n')
+    fo.write('\n')
+    fo.write('        :param row: values of the row, keyed by field name\n')
+    fo.write('        :type row: dict\n')
+    fo.write('        """\n')
+    fo.write('        key = None\n')
+    fo.write('        if self.partition is not None:\n')
+    fo.write('            key = row[self.partition]\n')
+    fo.write('        output = self.output(key)\n')
+    fo.write('        output[0] += [[row[name] for name in self.out_names]]\n')
+    fo.write('        output[2] += 1\n')
+    fo.write('        if output[2] >= self.row_group_rows:\n')
+    fo.write('            self.flush(key)\n')
+    fo.write('\n')
+    fo.write('    def write_columns(self, columns):\n')
+    fo.write('        """\n')
+    fo.write('        Add a block of rows held as one array per field.\n')
+    fo.write('\n')
+    fo.write('        :param columns: values of the fields, in the order of *names*\n')
+    fo.write('        :type columns: list\n')
+    fo.write('        """\n')
+    fo.write('        columns = co.OrderedDict(zip(self.names, columns))\n')
+    fo.write('        if self.partition is None:\n')
+    fo.write('            parts = [(None, columns)]\n')
+    fo.write('        else:\n')
+    fo.write('            values = columns.pop(self.partition)\n')
+    fo.write('            parts = []\n')
+    fo.write('            for key in co.OrderedDict.fromkeys(values.tolist()):\n')
+    fo.write('                mask = values == key\n')
+    fo.write('                parts += [(key, co.OrderedDict([(name, col[mask]) for (name, col) in columns.items()]))]\n')
+    fo.write('        for (key, part) in parts:\n')
+    fo.write('            num_rows = len(part[self.out_names[0]])\n')
+    fo.write('            if num_rows == 0:\n')
+    fo.write('                continue\n')
+    fo.write('            output = self.output(key)\n')
+    fo.write('            output[1] += [self.table([part[name] for name in self.out_names])]\n')
+    fo.write('            output[2] += num_rows\n')
+    fo.write('            if output[2] >= self.row_group_rows:\n')
+    fo.write('                self.flush(key)\n')
+    fo.write('\n')
+    fo.write('    def output(self, key):\n')
+    fo.write('        """\n')
+    fo.write('        The buffers and writer for a value of the partition field.\n')
+    fo.write('\n')
+    fo.write('        :param key: value of the partition field, None if there is no partition\n')
+    fo.write('        :return: [rows, tables, number of rows, writer, file number, rows in file]\n')
+    fo.write('        :rtype: list\n')
+    fo.write('        """\n')
+    fo.write('        if key not in self.outputs:\n')
+    fo.write('            self.outputs[key] = [[], [], 0, None, 0, 0]\n')
+    fo.write('        return self.outputs[key]\n')
+    fo.write('\n')
+    fo.write('    def table(self, columns):\n')
+    fo.write('        """\n')
+    fo.write('        Make a table of the schema from a list of columns.  The schema is set by the first table made.\n')
+    fo.write('\n')
+    fo.write('        :param columns: values of each field of out_names\n')
+    fo.write('        :type columns: list\n')
+    fo.write('        :return: table\n')
+    fo.write('        :rtype: pyarrow.Table\n')
+    fo.write('        """\n')
+    fo.write('        if self.schema is None:\n')
+    fo.write('            fields = []\n')
+    fo.write('            for (name, col) in zip(self.out_names, columns):\n')
+    fo.write('                if name in self.types:\n')
+    fo.write('                    fields += [self.pa.field(name, self.types[name])]\n')
+    fo.write('                else:\n')
+    fo.write('                    arrow_type = self.pa.array(col).type\n')
+    fo.write('                    if arrow_type == self.pa.null():\n')
+    fo.write('                        arrow_type = self.pa.string()\n')
+    fo.write('                    fields += [self.pa.field(name, arrow_type)]\n')
+    fo.write('            self.schema = self.pa.schema(fields)\n')
+    fo.write('        try:\n')
+    fo.write('            arrays = [self.pa.array(col, type=field.type) for (col, field) in zip(columns, self.schema)]\n')
+    fo.write('        except (self.pa.ArrowInvalid, self.pa.ArrowTypeError) as err:\n')
+    fo.write("            raise ValueError('cannot write the output as ' + self.output_type.lower() + ': ' + str(err))\n")
+    fo.write('        return self.pa.Table.from_arrays(arrays, schema=self.schema)\n')
+    fo.write('\n')
+    fo.write('    def flush(self, key):\n')
+    fo.write('        """\n')
+    fo.write('        Write the rows held for a value of the partition field as row groups.\n')
+    fo.write('\n')
+    fo.write('        :param key: value of the partition field, None if there is no partition\n')
+    fo.write('        """\n')
+    fo.write('        output = self.outputs[key]\n')
+    fo.write('        tables = output[1]\n')
+    fo.write('        if len(output[0]) > 0:\n')
+    fo.write('            tables += [self.table([list(col) for col in zip(*output[0])])]\n')
+    fo.write('        output[0] = []\n')
+    fo.write('        output[1] = []\n')
+    fo.write('        output[2] = 0\n')
+    fo.write('        if len(tables) == 0:\n')
+    fo.write('            return\n')
+    fo.write('        table = self.pa.concat_tables(tables)\n')
+    fo.write('        while table.num_rows > 0:\n')
+    fo.write('            if output[3] is None:\n')
+    fo.write('                self.open(key)\n')
+    fo.write('            num_rows = table.num_rows\n')
+    fo.write('            if self.split_file is not None:\n')
+    fo.write('                num_rows = min(num_rows, self.split_file - output[5])\n')
+    fo.write("            if self.output_type == 'PARQUET':\n")
+    fo.write('                output[3].write_table(table.slice(0, num_rows), row_group_size=self.row_group_rows)\n')
+    fo.write('            else:\n')
+    fo.write('                output[3].write_table(table.slice(0, num_rows), max_chunksize=self.row_group_rows)\n')
+    fo.write('            output[5] += num_rows\n')
+    fo.write('            table = table.slice(num_rows)\n')
+    fo.write('            if (self.split_file is not None) and (output[5] >= self.split_file):\n')
+    fo.write('                output[3].close()\n')
+    fo.write('                output[3] = None\n')
+    fo.write('                output[4] += 1\n')
+    fo.write('                output[5] = 0\n')
+    fo.write('\n')
+    fo.write('    def open(self, key):\n')
+    fo.write('        """\n')
+    fo.write('        Start the next file for a value of the partition field.\n')
+    fo.write('\n')
+    fo.write('        :param key: value of the partition field, None if there is no partition\n')
+    fo.write('        """\n')
+    fo.write('        output = self.outputs[key]\n')
+    fo.write('        split_number = None\n')
+    fo.write('        if self.split_file is not None:\n')
+    fo.write('            split_number = output[4]\n')
+    fo.write('        if self.partition is None:\n')
+    fo.write('            if split_number is None:\n')
+    fo.write('                opf = self.output_file\n')
+    fo.write('            else:\n')
+    fo.write('                opf = make_opf(self.output_file, None, split_number)\n')
+    fo.write('        else:\n')
+    fo.write("            opf = make_opf(self.output_file, self.partition + '=' + str(key), split_number)\n")
+    fo.write('        try:\n')
+    fo.write("            if self.output_type == 'PARQUET':\n")
+    fo.write('                compression = self.compression\n')
+    fo.write('                if compression is None:\n')
+    fo.write("                    compression = 'NONE'\n")
+    fo.write('                output[3] = self.pq.ParquetWriter(opf, self.schema, compression=compression,\n')
+    fo.write('                                                  compression_level=self.compression_level)\n')
+    fo.write('            else:\n')
+    fo.write('                codec = self.compression\n')
+    fo.write('                if (codec is not None) and (self.compression_level is not None):\n')
+    fo.write('                    codec = self.pa.Codec(codec, self.compression_level)\n')
+    fo.write('                options = self.pa.ipc.IpcWriteOptions(compression=codec)\n')
+    fo.write('                output[3] = self.pa.ipc.new_file(opf, self.schema, options=options)\n')
+    fo.write('        except (OSError, self.pa.ArrowInvalid):\n')
+    fo.write("            raise FileNotFoundError('cannot open file: ' + opf)\n")
+    fo.write('        output[5] = 0\n')
+    fo.write('\n')
+    fo.write('    def close(self):\n')
+    fo.write('        """\n')
+    fo.write('        Write the rows that are left and close the files.\n')
+    fo.write('        """\n')
+    fo.write('        for key in list(self.outputs.keys()):\n')
+    fo.write('            self.flush(key)\n')
+    fo.write('            if self.outputs[key][3] is not None:\n')
+    fo.write('                self.outputs[key][3].close()\n')
+    fo.write('                self.outputs[key][3] = None\n')
+    fo.write('\n')
+    fo.write('\n')
+
+    fo.write('def compressor(compression, level=None):\n')
+    fo.write('    """\n')
+    fo.write('    A function that compresses a piece of bytes into a block that stands on its own: a gzip member, a bz2 or xz stream\n')
+    fo.write('    or a zstd frame.  A file of such blocks one after another decompresses as one.\n')
+    fo.write('\n')
+    fo.write('    :param compression: GZIP, BZ2, XZ or ZSTD\n')
+    fo.write('    :type compression: str\n')
+    fo.write('    :param level: level of compression.  The default is the default of the codec.\n')
+    fo.write('    :type level: int\n')
+    fo.write('    :return: function from bytes to compressed bytes\n')
+    fo.write('    :rtype: function\n')
+    fo.write('    """\n')
+    fo.write("    if compression == 'GZIP':\n")
+    fo.write('        import zlib\n')
+    fo.write('        if level is None:\n')
+    fo.write('            level = 6\n')
+    fo.write('\n')
+    fo.write('        def compress(data):\n')
+    fo.write('            gz = zlib.compressobj(level, zlib.DEFLATED, 31)\n')
+    fo.write('            return gz.compress(data) + gz.flush()\n')
+    fo.write('\n')
+    fo.write('        return compress\n')
+    fo.write("    if compression == 'BZ2':\n")
+    fo.write('        import bz2\n')
+    fo.write('        if level is None:\n')
+    fo.write('            level = 9\n')
+    fo.write('        return functools.partial(bz2.compress, compresslevel=level)\n')
+    fo.write("    if compression == 'XZ':\n")
+    fo.write('        import lzma\n')
+    fo.write('        if level is None:\n')
+    fo.write('            level = 6\n')
+    fo.write('        return functools.partial(lzma.compress, preset=level)\n')
+    fo.write("    if compression == 'ZSTD':\n")
+    fo.write('        try:\n')
+    fo.write('            import zstandard\n')
+    fo.write('        except ImportError:\n')
+    fo.write("            raise ImportError('zstd compression requires zstandard')\n")
+    fo.write('        if level is None:\n')
+    fo.write('            level = 3\n')
+    fo.write('\n')
+    fo.write('        def compress(data):\n')
+    fo.write('            return zstandard.ZstdCompressor(level=level).compress(data)\n')
+    fo.write('\n')
+    fo.write('        return compress\n')
+    fo.write("    raise ValueError('compression of delim output must be one of: gzip, bz2, xz, zstd, none')\n")
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('class DelimWriter(object):\n')
+    fo.write('    """\n')
+    fo.write('    Write rows to delimited files for output_type="delim".\n')
+    fo.write('    Each row is made into a line with a single join, and a block of rows into lines a column at a time.  The lines\n')
+    fo.write('    are held until there are *write_buffer* characters in all, then the files holding the most are written out\n')
+    fo.write('    until half of that is left.  With *write_thread*, the writing is done by a thread of its own so that reading goes\n')
+    fo.write('    on while the files are written.\n')
+    fo.write('\n')
+    fo.write('    With *compression*, each piece of text written is compressed on its own (see *compressor*) as it goes out, so the\n')
+    fo.write('    files are made of blocks that data_reader.build_block_index can index.  With *compression_threads*, that many\n')
+    fo.write('    pieces are compressed at once by a pool of threads and written in order.\n')
+    fo.write('\n')
+    fo.write('    With *partition*, there is a file for each value of the partition field, which is not written to the files.\n')
+    fo.write('    No more than *max_open_files* files are open at once: when another is needed, the one written least recently\n')
+    fo.write('    is closed, to be opened again to append if there is more for it.  The files written and their rows are kept in\n')
+    fo.write('    *manifest* and, with *partition*, written to the manifest file (see *manifest_file*) on close.\n')
+    fo.write('    With *split_file*, a new file is started after each *split_file* rows.\n')
+    fo.write('    """\n')
+    fo.write('\n')
+    fo.write("    def __init__(self, output_file, names, output_delim=',', output_headers=True, partition=None, split_file=None,\n")
+    fo.write('                 compression=None, write_buffer=1 << 22, write_thread=False, compression_level=None,\n')
+    fo.write('                 compression_threads=0, max_open_files=128):\n')
+    fo.write('        """\n')
+    fo.write('        :param output_file: name of the output file\n')
+    fo.write('        :type output_file: str\n')
+    fo.write('        :param names: names of the fields of each row, including the partition field\n')
+    fo.write('        :type names: list\n')
+    fo.write('        :param output_delim: delimiter of the fields\n')
+    fo.write('        :type output_delim: str\n')
+    fo.write('        :param output_headers: if True, the first line of each file is the field names, unless there is a partition\n')
+    fo.write('        :type output_headers: bool\n')
+    fo.write('        :param partition: name of the field to partition the files on\n')
+    fo.write('        :type partition: str\n')
+    fo.write('        :param split_file: maximum number of rows in each file\n')
+    fo.write('        :type split_file: int\n')
+    fo.write('        :param compression: gzip, bz2, xz, zstd or none (the default)\n')
+    fo.write('        :type compression: str\n')
+    fo.write('        :param write_buffer: number of characters held before they are written\n')
+    fo.write('        :type write_buffer: int\n')
+    fo.write('        :param write_thread: if True, write in a thread of its own\n')
+    fo.write('        :type write_thread: bool\n')
+    fo.write('        :param compression_level: level of compression.  The default is the default of the codec.\n')
+    fo.write('        :type compression_level: int\n')
+    fo.write('        :param compression_threads: number of threads compressing at once.  The default is 0: compress as written.\n')
+    fo.write('        :type compression_threads: int\n')
+    fo.write('        :param max_open_files: most files open at once\n')
+    fo.write('        :type max_open_files: int\n')
+    fo.write('        """\n')
+    fo.write('        self.output_file = output_file\n')
+    fo.write('        self.names = list(names)\n')
+    fo.write('        if (partition is not None) and (partition not in self.names):\n')
+    fo.write('            raise ValueError("partition variable not in output file")\n')
+    fo.write('        self.partition = partition\n')
+    fo.write('        self.out_names = [name for name in self.names if name != partition]\n')
+    fo.write('        self.output_delim = output_delim\n')
+    fo.write('        self.header = None\n')
+    fo.write('        if output_headers and (partition is None):\n')
+    fo.write('            self.header = output_delim.join(self.out_names) + "\\n"\n')
+    fo.write('        self.split_file = split_file\n')
+    fo.write('        self.compress = None\n')
+    fo.write("        self.extension = ''\n")
+    fo.write("        if (compression is not None) and (compression.upper() != 'NONE'):\n")
+    fo.write('            self.compress = compressor(compression.upper(), compression_level)\n')
+    fo.write("            self.extension = {'GZIP': '.gz', 'BZ2': '.bz2', 'XZ': '.xz', 'ZSTD': '.zst'}[compression.upper()]\n")
+    fo.write('        self.pool = None\n')
+    fo.write('        # pending are the pieces sent but not yet written when there is no writing thread\n')
+    fo.write('        self.pending = co.deque()\n')
+    fo.write('        self.ahead = 0\n')
+    fo.write('        if (self.compress is not None) and (compression_threads > 0):\n')
+    fo.write('            from concurrent.futures import ThreadPoolExecutor\n')
+    fo.write('            self.pool = ThreadPoolExecutor(compression_threads)\n')
+    fo.write('            self.ahead = 2 * compression_threads\n')
+    fo.write('        self.write_buffer = max(int(write_buffer), 1)\n')
+    fo.write('        self.max_open_files = max(int(max_open_files), 1)\n')
+    fo.write('        # for each value of the partition field: [pieces of text, file name, rows in file, file number, characters held]\n')
+    fo.write('        self.outputs = {}\n')
+    fo.write('        self.buffered = 0\n')
+    fo.write('        # rows written to each file: file name -> [value of the partition field, rows]\n')
+    fo.write('        self.manifest = co.OrderedDict()\n')
+    fo.write('        # the open files, least recently written first, and the names of the files opened before.  These belong to\n')
+    fo.write('        # the writing thread if there is one.\n')
+    fo.write('        self.handles = co.OrderedDict()\n')
+    fo.write('        self.opened = set()\n')
+    fo.write('        self.error = None\n')
+    fo.write('        self.queue = None\n')
+    fo.write('        if write_thread:\n')
+    fo.write('            import threading\n')
+    fo.write('            import queue\n')
+    fo.write('            # a short queue: reading waits for the writing rather than piling up text\n')
+    fo.write('            self.queue = queue.Queue(4 + self.ahead)\n')
+    fo.write('            self.thread = threading.Thread(target=self.run, daemon=True)\n')
+    fo.write('            self.thread.start()\n')
+    fo.write('\n')
+    fo.write('    def write_row(self, row):\n')
+    fo.write('        """\n')
+    fo.write('        Add a row.\n')
+    fo.write('\n')
+    fo.write('        :param row: values of the row, keyed by field name\n')
+    fo.write('        :type row: dict\n')
+    fo.write('        """\n')
+    fo.write('        key = None\n')
+    fo.write('        if self.partition is not None:\n')
+    fo.write('            key = row[self.partition]\n')
+    fo.write('        line = self.output_delim.join([str(row[name]) for name in self.out_names])\n')
+    fo.write('        output = self.outputs.get(key)\n')
+    fo.write('        if (output is None) or (output[1] is None) or \\\n')
+    fo.write('                ((self.split_file is not None) and (output[2] + 1 >= self.split_file)):\n')
+    fo.write('            self.add(key, [line])\n')
+    fo.write('            return\n')
+    fo.write('        # the usual case: the file is started and the line does not end it\n')
+    fo.write('        line += "\\n"\n')
+    fo.write('        output[0].append(line)\n')
+    fo.write('        output[2] += 1\n')
+    fo.write('        output[4] += len(line)\n')
+    fo.write('        self.buffered += len(line)\n')
+    fo.write('        if self.buffered >= self.write_buffer:\n')
+    fo.write('            self.flush()\n')
+    fo.write('\n')
+    fo.write('    def write_columns(self, columns):\n')
+    fo.write('        """\n')
+    fo.write('        Add a block of rows held as one array per field.\n')
+    fo.write('\n')
+    fo.write('        :param columns: values of the fields, in the order of *names*\n')
+    fo.write('        :type columns: list\n')
+    fo.write('        """\n')
+    fo.write('        columns = co.OrderedDict(zip(self.names, columns))\n')
+    fo.write('        if self.partition is None:\n')
+    fo.write('            parts = [(None, columns)]\n')
+    fo.write('        else:\n')
+    fo.write('            values = columns.pop(self.partition)\n')
+    fo.write('            # the rows of each value in one pass, rather than a pass for each of perhaps thousands of values\n')
+    fo.write('            rows = co.OrderedDict()\n')
+    fo.write('            for (ind, key) in enumerate(values.tolist()):\n')
+    fo.write('                rows.setdefault(key, []).append(ind)\n')
+    fo.write('            parts = []\n')
+    fo.write('            for (key, ind) in rows.items():\n')
+    fo.write('                ind = np.array(ind)\n')
+    fo.write('                parts += [(key, co.OrderedDict([(name, col[ind]) for (name, col) in columns.items()]))]\n')
+    fo.write('        for (key, part) in parts:\n')
+    fo.write('            text = [list(map(str, part[name].tolist())) for name in self.out_names]\n')
+    fo.write('            lines = list(map(self.output_delim.join, zip(*text)))\n')
+    fo.write('            if len(lines) > 0:\n')
+    fo.write('                self.add(key, lines)\n')
+    fo.write('\n')
+    fo.write('    def add(self, key, lines):\n')
+    fo.write('        """\n')
+    fo.write('        Add lines to the file for a value of the partition field, starting new files as *split_file* says.\n')
+    fo.write('\n')
+    fo.write('        :param key: value of the partition field, None if there is no partition\n')
+    fo.write('        :param lines: rows made into text, without the newline\n')
+    fo.write('        :type lines: list\n')
+    fo.write('        """\n')
+    fo.write('        output = self.outputs.get(key)\n')
+    fo.write('        if output is None:\n')
+    fo.write('            output = [[], None, 0, 0, 0]\n')
+    fo.write('            self.outputs[key] = output\n')
+    fo.write('        while len(lines) > 0:\n')
+    fo.write('            if output[1] is None:\n')
+    fo.write('                self.open(key)\n')
+    fo.write('            num_rows = len(lines)\n')
+    fo.write('            if self.split_file is not None:\n')
+    fo.write('                num_rows = min(num_rows, self.split_file - output[2])\n')
+    fo.write('            if num_rows == len(lines):\n')
+    fo.write('                text = "\\n".join(lines) + "\\n"\n')
+    fo.write('                lines = []\n')
+    fo.write('            else:\n')
+    fo.write('                text = "\\n".join(lines[0:num_rows]) + "\\n"\n')
+    fo.write('                lines = lines[num_rows:]\n')
+    fo.write('            output[0].append(text)\n')
+    fo.write('            output[2] += num_rows\n')
+    fo.write('            output[4] += len(text)\n')
+    fo.write('            self.buffered += len(text)\n')
+    fo.write('            if (self.split_file is not None) and (output[2] >= self.split_file):\n')
+    fo.write('                self.done(key)\n')
+    fo.write('        if self.buffered >= self.write_buffer:\n')
+    fo.write('            self.flush()\n')
+    fo.write('\n')
+    fo.write('    def open(self, key):\n')
+    fo.write('        """\n')
+    fo.write('        Start the next file for a value of the partition field.  The file itself is opened when it is written.\n')
+    fo.write('\n')
+    fo.write('        :param key: value of the partition field, None if there is no partition\n')
+    fo.write('        """\n')
+    fo.write('        output = self.outputs[key]\n')
+    fo.write('        split_number = None\n')
+    fo.write('        if self.split_file is not None:\n')
+    fo.write('            split_number = output[3]\n')
+    fo.write('        if self.partition is None:\n')
+    fo.write('            if split_number is None:\n')
+    fo.write('                opf = self.output_file\n')
+    fo.write('            else:\n')
+    fo.write('                opf = make_opf(self.output_file, None, split_number)\n')
+    fo.write('        else:\n')
+    fo.write('            opf = make_opf(self.output_file, self.partition + "=" + str(key), split_number)\n')
+    fo.write('        opf += self.extension\n')
+    fo.write('        output[1] = opf\n')
+    fo.write('        output[2] = 0\n')
+    fo.write('        output[3] += 1\n')
+    fo.write('        if self.header is not None:\n')
+    fo.write('            output[0].append(self.header)\n')
+    fo.write('            output[4] += len(self.header)\n')
+    fo.write('            self.buffered += len(self.header)\n')
+    fo.write('\n')
+    fo.write('    def flush(self):\n')
+    fo.write('        """\n')
+    fo.write('        Write out the text held for the files holding the most until no more than half of *write_buffer* is held.\n')
+    fo.write('        """\n')
+    fo.write('        for output in sorted(self.outputs.values(), key=lambda output: output[4], reverse=True):\n')
+    fo.write('            if (self.buffered <= self.write_buffer // 2) or (output[4] == 0):\n')
+    fo.write('                break\n')
+    fo.write('            self.send((output[1], "".join(output[0]), False))\n')
+    fo.write('            self.buffered -= output[4]\n')
+    fo.write('            output[0] = []\n')
+    fo.write('            output[4] = 0\n')
+    fo.write('\n')
+    fo.write('    def done(self, key):\n')
+    fo.write('        """\n')
+    fo.write('        Write out the text held for the file of a value of the partition field and close it.\n')
+    fo.write('\n')
+    fo.write('        :param key: value of the partition field, None if there is no partition\n')
+    fo.write('        """\n')
+    fo.write('        output = self.outputs[key]\n')
+    fo.write('        self.send((output[1], "".join(output[0]), True))\n')
+    fo.write('        self.buffered -= output[4]\n')
+    fo.write('        self.manifest[output[1]] = [key, output[2]]\n')
+    fo.write('        output[0] = []\n')
+    fo.write('        output[1] = None\n')
+    fo.write('        output[4] = 0\n')
+    fo.write('\n')
+    fo.write('    def send(self, task):\n')
+    fo.write('        """\n')
+    fo.write('        Write text to a file and then, if told to, close the file.  The work is passed to the writing thread if there\n')
+    fo.write('        is one.  With a pool, the text is handed to it to compress first.  Compressed text is cut at the newlines into\n')
+    fo.write('        pieces of about *write_buffer* characters, each compressed on its own, so that the pieces can be compressed\n')
+    fo.write('        at the same time and the file can be read a block at a time.\n')
+    fo.write('\n')
+    fo.write('        :param task: file name, text, True to close the file\n')
+    fo.write('        :type task: tuple\n')
+    fo.write('        """\n')
+    fo.write('        (opf, text, last) = task\n')
+    fo.write('        if self.compress is not None:\n')
+    fo.write('            start = 0\n')
+    fo.write('            while len(text) - start > self.write_buffer:\n')
+    fo.write('                cut = text.find("\\n", start + self.write_buffer - 1)\n')
+    fo.write('                if (cut < 0) or (cut == len(text) - 1):\n')
+    fo.write('                    break\n')
+    fo.write('                self.put((opf, text[start:cut + 1], False))\n')
+    fo.write('                start = cut + 1\n')
+    fo.write('            task = (opf, text[start:], last)\n')
+    fo.write('        self.put(task)\n')
+    fo.write('\n')
+    fo.write('    def put(self, task):\n')
+    fo.write('        """\n')
+    fo.write('        Pass a task of *send* on to be done.\n')
+    fo.write('\n')
+    fo.write('        :param task: file name, text, True to close the file\n')
+    fo.write('        :type task: tuple\n')
+    fo.write('        """\n')
+    fo.write('        if (self.pool is not None) and (len(task[1]) > 0):\n')
+    fo.write('            task = (task[0], self.pool.submit(self.compress, task[1].encode()), task[2])\n')
+    fo.write('        if self.queue is None:\n')
+    fo.write('            self.pending.append(task)\n')
+    fo.write('            while len(self.pending) > self.ahead:\n')
+    fo.write('                self.work(self.pending.popleft())\n')
+    fo.write('            return\n')
+    fo.write('        if self.error is not None:\n')
+    fo.write('            raise self.error\n')
+    fo.write('        self.queue.put(task)\n')
+    fo.write('\n')
+    fo.write('    def handle(self, opf):\n')
+    fo.write('        """\n')
+    fo.write('        The open file for a file name.  A file opened before is opened to append, as are the files of a partition.\n')
+    fo.write('        If *max_open_files* are open, the one written least recently is closed.\n')
+    fo.write('\n')
+    fo.write('        :param opf: file name\n')
+    fo.write('        :type opf: str\n')
+    fo.write('        :return: the open file\n')
+    fo.write('        :rtype: file\n')
+    fo.write('        """\n')
+    fo.write('        fo = self.handles.pop(opf, None)\n')
+    fo.write('        if fo is None:\n')
+    fo.write('            mode = "w"\n')
+    fo.write('            if (self.partition is not None) or (opf in self.opened):\n')
+    fo.write('                mode = "a"\n')
+    fo.write('            if self.compress is not None:\n')
+    fo.write('                mode += "b"\n')
+    fo.write('            while len(self.handles) >= self.max_open_files:\n')
+    fo.write('                self.handles.popitem(last=False)[1].close()\n')
+    fo.write('            try:\n')
+    fo.write('                fo = open(opf, mode)\n')
+    fo.write('            except:\n')
+    fo.write('                raise FileNotFoundError("cannot open file: " + opf)\n')
+    fo.write('            self.opened.add(opf)\n')
+    fo.write('        self.handles[opf] = fo\n')
+    fo.write('        return fo\n')
+    fo.write('\n')
+    fo.write('    def work(self, task):\n')
+    fo.write('        """\n')
+    fo.write('        Do a task of *send*.\n')
+    fo.write('\n')
+    fo.write('        :param task: file name, text, True to close the file\n')
+    fo.write('        :type task: tuple\n')
+    fo.write('        """\n')
+    fo.write('        (opf, text, last) = task\n')
+    fo.write("        if str(type(text)).find('Future') >= 0:\n")
+    fo.write('            text = text.result()\n')
+    fo.write('        elif (self.compress is not None) and (len(text) > 0):\n')
+    fo.write('            text = self.compress(text.encode())\n')
+    fo.write('        if len(text) > 0:\n')
+    fo.write('            self.handle(opf).write(text)\n')
+    fo.write('        if last and (opf in self.handles):\n')
+    fo.write('            self.handles.pop(opf).close()\n')
+    fo.write('\n')
+    fo.write('    def run(self):\n')
+    fo.write('        """\n')
+    fo.write('        The writing thread: do the tasks of *send* until told to stop by *None*.  After an error, the tasks are only\n')
+    fo.write('        taken off the queue so that *send* never waits for ever.\n')
+    fo.write('        """\n')
+    fo.write('        while True:\n')
+    fo.write('            task = self.queue.get()\n')
+    fo.write('            if task is None:\n')
+    fo.write('                return\n')
+    fo.write('            if self.error is None:\n')
+    fo.write('                try:\n')
+    fo.write('                    self.work(task)\n')
+    fo.write('                except Exception as err:\n')
+    fo.write('                    self.error = err\n')
+    fo.write('\n')
+    fo.write('    def manifest_file(self):\n')
+    fo.write('        """\n')
+    fo.write('        The name of the manifest file: *output_file* with ".manifest.csv" in place of its extension, or\n')
+    fo.write('        "manifest.csv" in *output_file* if it has no extension (a directory, as for *make_opf*).\n')
+    fo.write('\n')
+    fo.write('        :return: file name\n')
+    fo.write('        :rtype: str\n')
+    fo.write('        """\n')
+    fo.write('        dot = self.output_file.rfind(".")\n')
+    fo.write('        if dot < 0:\n')
+    fo.write('            if self.output_file[-1] != "/":\n')
+    fo.write('                return self.output_file + "/manifest.csv"\n')
+    fo.write('            return self.output_file + "manifest.csv"\n')
+    fo.write('        return self.output_file[0:dot] + ".manifest.csv"\n')
+    fo.write('\n')
+    fo.write('    def close(self):\n')
+    fo.write('        """\n')
+    fo.write('        Write the rows that are left and close the files.  With *partition*, write the manifest: a line for each file\n')
+    fo.write('        with the value of the partition field, the file name and the number of rows.\n')
+    fo.write('        """\n')
+    fo.write('        for key in list(self.outputs.keys()):\n')
+    fo.write('            if self.outputs[key][1] is not None:\n')
+    fo.write('                self.done(key)\n')
+    fo.write('        while len(self.pending) > 0:\n')
+    fo.write('            self.work(self.pending.popleft())\n')
+    fo.write('        if self.pool is not None:\n')
+    fo.write('            self.pool.shutdown()\n')
+    fo.write('        if self.queue is not None:\n')
+    fo.write('            self.queue.put(None)\n')
+    fo.write('            self.thread.join()\n')
+    fo.write('            if self.error is not None:\n')
+    fo.write('                raise self.error\n')
+    fo.write('        for fo in self.handles.values():\n')
+    fo.write('            fo.close()\n')
+    fo.write('        self.handles.clear()\n')
+    fo.write('        if self.partition is not None:\n')
+    fo.write('            import csv\n')
+    fo.write('            try:\n')
+    fo.write('                with open(self.manifest_file(), "w", newline="") as fm:\n')
+    fo.write('                    writer = csv.writer(fm)\n')
+    fo.write('                    writer.writerow([self.partition, "file", "rows"])\n')
+    fo.write('                    for (opf, (key, rows)) in self.manifest.items():\n')
+    fo.write('                        writer.writerow([key, opf, rows])\n')
+    fo.write('            except OSError:\n')
+    fo.write('                raise FileNotFoundError("cannot open file: " + self.manifest_file())\n')
+    fo.write('\n')
+    fo.write('\n')
+
+    fo.write('def varint(value):\n')
+    fo.write('    """\n')
+    fo.write('    The protobuf varint of an int64: 7 bits a byte, low bits first.  A negative value takes 10 bytes.\n')
+    fo.write('\n')
+    fo.write('    :param value: value to encode\n')
+    fo.write('    :type value: int\n')
+    fo.write('    :return: encoded value\n')
+    fo.write('    :rtype: bytes\n')
+    fo.write('    """\n')
+    fo.write('    if 0 <= value < 128:\n')
+    fo.write('        return small_varints[value]\n')
+    fo.write('    value &= 0xFFFFFFFFFFFFFFFF\n')
+    fo.write('    out = bytearray()\n')
+    fo.write('    while value > 127:\n')
+    fo.write('        out.append((value & 127) | 128)\n')
+    fo.write('        value >>= 7\n')
+    fo.write('    out.append(value)\n')
+    fo.write('    return bytes(out)\n')
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('small_varints = [bytes([value]) for value in range(128)]\n')
+    fo.write('# one character of a str feature as an entry of a BytesList\n')
+    fo.write("char_entries = [b'\\x0a\\x01' + bytes([value]) for value in range(128)]\n")
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('def feature_encoder(name, field_type):\n')
+    fo.write('    """\n')
+    fo.write('    A function that encodes a value of a field as an entry of the feature map of a tf.train.Example, in the\n')
+    fo.write('    protobuf wire format.  The kind of feature is fixed by the field type:\n')
+    fo.write('\n')
+    fo.write('    - INT: int64_list of the value\n')
+    fo.write('    - FLOAT: float_list of the value\n')
+    fo.write('    - DATE: int64_list of year, month and day\n')
+    fo.write('    - STR, ZIP, STATE, STATETERR: bytes_list of the characters of the value\n')
+    fo.write('    - BYTES: bytes_list of the value\n')
+    fo.write('\n')
+    fo.write('    A field type of *None* (a field not in the data dictionary) goes by the type of each value.  A value of *None*\n')
+    fo.write('    is left out of the record, so that tf.io.parse_example gives it the default of its feature.\n')
+    fo.write('\n')
+    fo.write('    :param name: name of the field\n')
+    fo.write('    :type name: str\n')
+    fo.write('    :param field_type: data dictionary field_type or None\n')
+    fo.write('    :type field_type: str\n')
+    fo.write('    :return: function from a value to bytes\n')
+    fo.write('    :rtype: function\n')
+    fo.write('    """\n')
+    fo.write('    key = name.encode()\n')
+    fo.write("    key = b'\\x0a' + varint(len(key)) + key\n")
+    fo.write('\n')
+    fo.write('    def entry(feature):\n')
+    fo.write("        value = b'\\x12' + varint(len(feature)) + feature\n")
+    fo.write("        return b'\\x0a' + varint(len(key) + len(value)) + key + value\n")
+    fo.write('\n')
+    fo.write('    def int64_list(body):\n')
+    fo.write("        body = b'\\x0a' + varint(len(body)) + body\n")
+    fo.write("        return b'\\x1a' + varint(len(body)) + body\n")
+    fo.write('\n')
+    fo.write('    def bytes_list(body):\n')
+    fo.write("        return b'\\x0a' + varint(len(body)) + body\n")
+    fo.write('\n')
+    fo.write("    if field_type == 'FLOAT':\n")
+    fo.write("        pack = struct.Struct('<f').pack\n")
+    fo.write('        # a float feature is always the same length: the head is made once\n')
+    fo.write("        head = entry(b'\\x12\\x06\\x0a\\x04' + pack(0.0))[0:-4]\n")
+    fo.write('\n')
+    fo.write('        def encode(value):\n')
+    fo.write('            if value is None:\n')
+    fo.write("                return b''\n")
+    fo.write('            return head + pack(value)\n')
+    fo.write('\n')
+    fo.write("    elif field_type == 'INT':\n")
+    fo.write('        def encode(value):\n')
+    fo.write('            if value is None:\n')
+    fo.write("                return b''\n")
+    fo.write('            return entry(int64_list(varint(int(value))))\n')
+    fo.write('\n')
+    fo.write("    elif field_type == 'DATE':\n")
+    fo.write('        def encode(value):\n')
+    fo.write('            if value is None:\n')
+    fo.write("                return b''\n")
+    fo.write('            return entry(int64_list(varint(value.year) + varint(value.month) + varint(value.day)))\n')
+    fo.write('\n')
+    fo.write("    elif field_type in ('STR', 'ZIP', 'STATE', 'STATETERR'):\n")
+    fo.write('        def encode(value):\n')
+    fo.write('            if value is None:\n')
+    fo.write("                return b''\n")
+    fo.write('            if value.isascii():\n')
+    fo.write("                return entry(bytes_list(b''.join([char_entries[ch] for ch in value.encode()])))\n")
+    fo.write('            chars = [ch.encode() for ch in value]\n')
+    fo.write("            return entry(bytes_list(b''.join([b'\\x0a' + varint(len(ch)) + ch for ch in chars])))\n")
+    fo.write('\n')
+    fo.write("    elif field_type == 'BYTES':\n")
+    fo.write('        def encode(value):\n')
+    fo.write('            if value is None:\n')
+    fo.write("                return b''\n")
+    fo.write("            return entry(bytes_list(b'\\x0a' + varint(len(value)) + value))\n")
+    fo.write('\n')
+    fo.write('    else:\n')
+    fo.write('        encoders = {}\n')
+    fo.write('\n')
+    fo.write('        def encode(value):\n')
+    fo.write('            kind = str(type(value))\n')
+    fo.write("            if kind.find('float') >= 0:\n")
+    fo.write("                kind = 'FLOAT'\n")
+    fo.write("            elif kind.find('str') >= 0:\n")
+    fo.write("                kind = 'STR'\n")
+    fo.write("            elif kind.find('int') >= 0:\n")
+    fo.write("                kind = 'INT'\n")
+    fo.write("            elif kind.find('bytes') >= 0:\n")
+    fo.write("                kind = 'BYTES'\n")
+    fo.write("            elif kind.find('date') >= 0:\n")
+    fo.write("                kind = 'DATE'\n")
+    fo.write('            else:\n')
+    fo.write("                return b''\n")
+    fo.write('            if kind not in encoders:\n')
+    fo.write('                encoders[kind] = feature_encoder(name, kind)\n')
+    fo.write('            return encoders[kind](value)\n')
+    fo.write('\n')
+    fo.write('    return encode\n')
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('class ExampleWriter(object):\n')
+    fo.write('    """\n')
+    fo.write('    Write rows to a TFRecords file of tf.train.Example for output_type="tfrecords".\n')
+    fo.write('    Each field has an encoder made once from its field type (see *feature_encoder*), so a row is serialized by joining\n')
+    fo.write('    the encoded fields, with no Example built.  A block of rows is serialized a column at a time.  The records are\n')
+    fo.write('    the same as those of tf.train.Example.SerializeToString, up to the order of the features.\n')
+    fo.write('    """\n')
+    fo.write('\n')
+    fo.write('    def __init__(self, output_file, names, compression=None, compression_level=None):\n')
+    fo.write('        """\n')
+    fo.write('        :param output_file: name of the output file\n')
+    fo.write('        :type output_file: str\n')
+    fo.write('        :param names: names of the fields of each row\n')
+    fo.write('        :type names: list\n')
+    fo.write('        :param compression: gzip, zlib or none (the default)\n')
+    fo.write('        :type compression: str\n')
+    fo.write('        :param compression_level: level of compression.  The default is the default of zlib.\n')
+    fo.write('        :type compression_level: int\n')
+    fo.write('        """\n')
+    fo.write('        self.names = list(names)\n')
+    fo.write('        kinds = dict(zip(field_names, field_types))\n')
+    fo.write('        self.encoders = [feature_encoder(name, kinds.get(name)) for name in self.names]\n')
+    fo.write('        options = None\n')
+    fo.write("        if (compression is not None) and (compression.upper() != 'NONE'):\n")
+    fo.write("            if compression.upper() not in ('GZIP', 'ZLIB'):\n")
+    fo.write("                raise ValueError('compression of tfrecords output must be one of: gzip, zlib, none')\n")
+    fo.write('            options = tf.io.TFRecordOptions(compression_type=compression.upper(), compression_level=compression_level)\n')
+    fo.write('        try:\n')
+    fo.write('            self.writer = tf.io.TFRecordWriter(output_file, options)\n')
+    fo.write('        except:\n')
+    fo.write('            raise FileNotFoundError("cannot open file: " + output_file)\n')
+    fo.write('\n')
+    fo.write('    def write_row(self, row):\n')
+    fo.write('        """\n')
+    fo.write('        Add a row.\n')
+    fo.write('\n')
+    fo.write('        :param row: values of the row, keyed by field name\n')
+    fo.write('        :type row: dict\n')
+    fo.write('        """\n')
+    fo.write("        features = b''.join([encode(row[name]) for (name, encode) in zip(self.names, self.encoders)])\n")
+    fo.write("        self.writer.write(b'\\x0a' + varint(len(features)) + features)\n")
+    fo.write('\n')
+    fo.write('    def write_columns(self, columns):\n')
+    fo.write('        """\n')
+    fo.write('        Add a block of rows held as one array per field.\n')
+    fo.write('\n')
+    fo.write('        :param columns: values of the fields, in the order of *names*\n')
+    fo.write('        :type columns: list\n')
+    fo.write('        """\n')
+    fo.write('        encoded = [list(map(encode, col.tolist())) for (encode, col) in zip(self.encoders, columns)]\n')
+    fo.write("        for features in map(b''.join, zip(*encoded)):\n")
+    fo.write("            self.writer.write(b'\\x0a' + varint(len(features)) + features)\n")
+    fo.write('\n')
+    fo.write('    def close(self):\n')
+    fo.write('        """\n')
+    fo.write('        Close the file.\n')
+    fo.write('        """\n')
+    fo.write('        self.writer.close()\n')
+    fo.write('\n')
+    fo.write('\n')
+
+    fo.write('class Sampler(object):\n')
+    fo.write('    """\n')
+    fo.write('    The random draws of *sample_rate* and *sample_size*, from a generator of their own.  The generator is seeded by\n')
+    fo.write('    *seed* and *stream*: the same seed and stream give the same sample, and each stream of a seed is independent of\n')
+    fo.write('    the others, so that the processes of multi_process each draw their own sample.  With no seed, the seed is new\n')
+    fo.write('    each time.\n')
+    fo.write('\n')
+    fo.write('    With *sample_rate*, each row is in the sample with that probability.  A reader reading a row at a time draws\n')
+    fo.write('    the number of rows to jump over before the next row in the sample (*gap*), so the rows not in the sample are\n')
+    fo.write('    not split into fields.  A reader reading blocks draws a row at a time for the whole block (*mask*).\n')
+    fo.write('\n')
+    fo.write('    With *sample_size*, each row kept gets a random key (*key*, *keys*) and the rows with the *sample_size* smallest\n')
+    fo.write('    keys are the sample (*smallest*): a reservoir that can be cut back to *sample_size* at any time.\n')
+    fo.write('    """\n')
+    fo.write('\n')
+    fo.write('    def __init__(self, sample_rate=1, seed=None, stream=0):\n')
+    fo.write('        """\n')
+    fo.write('        :param sample_rate: probability that a row is in the sample\n')
+    fo.write('        :type sample_rate: float\n')
+    fo.write('        :param seed: seed of the generator.  The default is None: a new seed each time.\n')
+    fo.write('        :type seed: int\n')
+    fo.write('        :param stream: number of the stream of *seed* to draw from\n')
+    fo.write('        :type stream: int\n')
+    fo.write('        """\n')
+    fo.write('        self.sample_rate = sample_rate\n')
+    fo.write('        self.rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(int(stream),)))\n')
+    fo.write('\n')
+    fo.write('    def gap(self):\n')
+    fo.write('        """\n')
+    fo.write('        The number of rows not in the sample before the next row that is.\n')
+    fo.write('\n')
+    fo.write('        :return: number of rows\n')
+    fo.write('        :rtype: int\n')
+    fo.write('        """\n')
+    fo.write('        if self.sample_rate >= 1:\n')
+    fo.write('            return 0\n')
+    fo.write('        return int(self.rng.geometric(self.sample_rate)) - 1\n')
+    fo.write('\n')
+    fo.write('    def mask(self, n):\n')
+    fo.write('        """\n')
+    fo.write('        Which of *n* rows are in the sample.\n')
+    fo.write('\n')
+    fo.write('        :param n: number of rows\n')
+    fo.write('        :type n: int\n')
+    fo.write('        :return: True for the rows in the sample\n')
+    fo.write('        :rtype: numpy array\n')
+    fo.write('        """\n')
+    fo.write('        return self.rng.random(n) < self.sample_rate\n')
+    fo.write('\n')
+    fo.write('    def key(self):\n')
+    fo.write('        """\n')
+    fo.write('        The reservoir key of a row.\n')
+    fo.write('\n')
+    fo.write('        :return: key\n')
+    fo.write('        :rtype: float\n')
+    fo.write('        """\n')
+    fo.write('        return self.rng.random()\n')
+    fo.write('\n')
+    fo.write('    def keys(self, n):\n')
+    fo.write('        """\n')
+    fo.write('        The reservoir keys of *n* rows.\n')
+    fo.write('\n')
+    fo.write('        :param n: number of rows\n')
+    fo.write('        :type n: int\n')
+    fo.write('        :return: keys\n')
+    fo.write('        :rtype: numpy array\n')
+    fo.write('        """\n')
+    fo.write('        return self.rng.random(n)\n')
+    fo.write('\n')
+    fo.write('    @staticmethod\n')
+    fo.write('    def smallest(keys, size):\n')
+    fo.write('        """\n')
+    fo.write('        The positions of the *size* smallest keys, in order.\n')
+    fo.write('\n')
+    fo.write('        :param keys: keys of the rows\n')
+    fo.write('        :type keys: numpy array\n')
+    fo.write('        :param size: number of rows to keep\n')
+    fo.write('        :type size: int\n')
+    fo.write('        :return: positions of the rows to keep\n')
+    fo.write('        :rtype: numpy array\n')
+    fo.write('        """\n')
+    fo.write('        if keys.shape[0] <= size:\n')
+    fo.write('            return np.arange(keys.shape[0])\n')
+    fo.write('        return np.sort(np.argpartition(keys, size)[0:size])\n')
+    fo.write('\n')
+    fo.write('\n')
+
+    fo.write('def cut_rows(output_data, sample_keys, size):\n')
+    fo.write('    """\n')
+    fo.write('    Cut the rows held for *sample_size* back to the *size* rows with the smallest keys, in the order read.\n')
+    fo.write('\n')
+    fo.write('    :param output_data: rows held\n')
+    fo.write('    :type output_data: list\n')
+    fo.write('    :param sample_keys: key of each row held\n')
+    fo.write('    :type sample_keys: list\n')
+    fo.write('    :param size: number of rows to keep\n')
+    fo.write('    :type size: int\n')
+    fo.write('    :return: rows kept, their keys\n')
+    fo.write('    :rtype: list, list\n')
+    fo.write('    """\n')
+    fo.write('    pick = Sampler.smallest(np.array(sample_keys), size).tolist()\n')
+    fo.write('    return [output_data[pos] for pos in pick], [sample_keys[pos] for pos in pick]\n')
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('def cut_blocks(block_values, block_nulls, sample_keys, size, fields):\n')
+    fo.write('    """\n')
+    fo.write('    Cut the blocks held for *sample_size* back to the *size* rows with the smallest keys, in the order read.  The\n')
+    fo.write('    blocks of each field become one block.\n')
+    fo.write('\n')
+    fo.write('    :param block_values: blocks of values of each field\n')
+    fo.write('    :type block_values: list\n')
+    fo.write('    :param block_nulls: blocks of null indicators of each field\n')
+    fo.write('    :type block_nulls: list\n')
+    fo.write('    :param sample_keys: blocks of keys of the rows\n')
+    fo.write('    :type sample_keys: list\n')
+    fo.write('    :param size: number of rows to keep\n')
+    fo.write('    :type size: int\n')
+    fo.write('    :param fields: positions of the fields held\n')
+    fo.write('    :type fields: list\n')
+    fo.write('    :return: the keys of the rows kept, as a list of one block\n')
+    fo.write('    :rtype: list\n')
+    fo.write('    """\n')
+    fo.write('    keys = np.concatenate(sample_keys)\n')
+    fo.write('    pick = Sampler.smallest(keys, size)\n')
+    fo.write('    for ind in fields:\n')
+    fo.write('        block_values[ind] = [np.concatenate(block_values[ind])[pick]]\n')
+    fo.write('        block_nulls[ind] = [np.concatenate(block_nulls[ind])[pick]]\n')
+    fo.write('    return [keys[pick]]\n')
+    fo.write('\n')
+    fo.write('\n')
+
+    fo.write('class ReaderStats(object):\n')
+    fo.write('    """\n')
+    fo.write('    What reader runs did, for the *stats* parameter: the wall time of each stage, the number of rows, and the number\n')
+    fo.write('    of values that failed each check of each field.\n')
+    fo.write('\n')
+    fo.write('    The stages are: read (reading the lines or records from the file), split (into fields), filter (*filters*),\n')
+    fo.write('    convert (to the type of each field), validate (the minimum, maximum and legal value checks), hooks\n')
+    fo.write('    (*user_function* and *user_class*) and output (writing or holding the rows).  The row engine converts and checks\n')
+    fo.write('    a field at once, so its convert holds validate as well.  total is the wall time of the whole run.\n')
+    fo.write('\n')
+    fo.write('    The rows are: read (rows split into fields), filtered (failed a filter), dropped (dropped by the action of a\n')
+    fo.write('    field), fixed (had a value fixed by the action of a field), rejected (by *user_function* or *user_class*) and kept.\n')
+    fo.write('\n')
+    fo.write('    violations counts the values that failed, keyed by (field name, check), where the check is conversion, minimum,\n')
+    fo.write('    maximum or legal.  *merge* adds up the stats of several runs, as multi_process does for its tasks.\n')
+    fo.write('    """\n')
+    fo.write('\n')
+    fo.write("    stages = ('read', 'split', 'filter', 'convert', 'validate', 'hooks', 'output')\n")
+    fo.write('\n')
+    fo.write('    def __init__(self):\n')
+    fo.write('        self.runs = 0\n')
+    fo.write("        self.times = co.OrderedDict([(stage, 0.0) for stage in self.stages + ('total',)])\n")
+    fo.write("        self.rows = co.OrderedDict([(name, 0) for name in ('read', 'filtered', 'dropped', 'fixed', 'rejected',\n")
+    fo.write("                                                           'kept')])\n")
+    fo.write('        self.violations = co.Counter()\n')
+    fo.write('\n')
+    fo.write('    def record(self, times, total, counts, violations):\n')
+    fo.write('        """\n')
+    fo.write('        Add a run.\n')
+    fo.write('\n')
+    fo.write('        :param times: seconds spent in each stage, in the order of *stages*\n')
+    fo.write('        :type times: list\n')
+    fo.write('        :param total: seconds of the whole run\n')
+    fo.write('        :type total: float\n')
+    fo.write('        :param counts: rows read, filtered, dropped, fixed and kept\n')
+    fo.write('        :type counts: list\n')
+    fo.write('        :param violations: values that failed, keyed by (field name, check)\n')
+    fo.write('        :type violations: collections.Counter\n')
+    fo.write('        """\n')
+    fo.write('        self.runs += 1\n')
+    fo.write('        for (stage, seconds) in zip(self.stages, times):\n')
+    fo.write('            self.times[stage] += seconds\n')
+    fo.write("        self.times['total'] += total\n")
+    fo.write('        (read, filtered, dropped, fixed, kept) = counts\n')
+    fo.write("        for (name, count) in (('read', read), ('filtered', filtered), ('dropped', dropped), ('fixed', fixed),\n")
+    fo.write("                              ('rejected', read - filtered - dropped - kept), ('kept', kept)):\n")
+    fo.write('            self.rows[name] += count\n')
+    fo.write('        self.violations.update(+violations)\n')
+    fo.write('\n')
+    fo.write('    def merge(self, other):\n')
+    fo.write('        """\n')
+    fo.write('        Add the stats of other runs.\n')
+    fo.write('\n')
+    fo.write('        :param other: stats to add\n')
+    fo.write('        :type other: ReaderStats\n')
+    fo.write('        :return: self\n')
+    fo.write('        :rtype: ReaderStats\n')
+    fo.write('        """\n')
+    fo.write('        self.runs += other.runs\n')
+    fo.write('        for (stage, seconds) in other.times.items():\n')
+    fo.write('            self.times[stage] += seconds\n')
+    fo.write('        for (name, count) in other.rows.items():\n')
+    fo.write('            self.rows[name] += count\n')
+    fo.write('        self.violations.update(other.violations)\n')
+    fo.write('        return self\n')
+    fo.write('\n')
+    fo.write('    def __repr__(self):\n')
+    fo.write("        times = [stage + ' ' + format(seconds, '.3f') for (stage, seconds) in self.times.items()]\n")
+    fo.write("        rows = [name + ' ' + str(count) for (name, count) in self.rows.items()]\n")
+    fo.write("        lines = ['runs: ' + str(self.runs), 'seconds: ' + ', '.join(times), 'rows: ' + ', '.join(rows)]\n")
+    fo.write('        for ((name, check), count) in sorted(self.violations.items()):\n')
+    fo.write("            lines += ['violations of ' + name + ' ' + check + ': ' + str(count)]\n")
+    fo.write("        return '\\n'.join(lines)\n")
+    fo.write('\n')
+    fo.write('\n')
+
+    fo.write('class RejectWriter(object):\n')
+    fo.write('    """\n')
+    fo.write('    Write the rows that fail a check of a field to a reject file, for the *reject_file* parameter.  These are the\n')
+    fo.write('    rows dropped or fixed by the action of a field, and the rows of FATAL errors under *max_errors*.  Each line is\n')
+    fo.write('\n')
+    fo.write('        offset<TAB>row<TAB>failures<TAB>record\n')
+    fo.write('\n')
+    fo.write('    where offset is the byte of data_file at which the row starts, row is its row number (counted from *start_byte*),\n')
+    fo.write('    failures are the checks it failed, as field:check:action separated by commas (check is conversion, minimum,\n')
+    fo.write('    maximum or legal), and record is the row exactly as it is in data_file.  The first line holds the names of the\n')
+    fo.write('    columns.  *write_rejects* makes a file of just the records, to be read again once the feed is fixed.\n')
+    fo.write('    """\n')
+    fo.write('\n')
+    fo.write('    def __init__(self, reject_file):\n')
+    fo.write('        """\n')
+    fo.write('        :param reject_file: name of the reject file\n')
+    fo.write('        :type reject_file: str\n')
+    fo.write('        """\n')
+    fo.write('        try:\n')
+    fo.write("            self.f = open(reject_file, 'wb')\n")
+    fo.write('        except:\n')
+    fo.write("            raise FileNotFoundError('cannot open file: ' + reject_file)\n")
+    fo.write("        self.f.write(b'offset\\trow\\tfailures\\trecord\\n')\n")
+    fo.write('\n')
+    fo.write('    def write_row(self, offset, row, failures, record):\n')
+    fo.write('        """\n')
+    fo.write('        Add a row.\n')
+    fo.write('\n')
+    fo.write('        :param offset: byte of data_file at which the row starts\n')
+    fo.write('        :type offset: int\n')
+    fo.write('        :param row: row number of the row\n')
+    fo.write('        :type row: int\n')
+    fo.write('        :param failures: field:check:action of each check it failed\n')
+    fo.write('        :type failures: list\n')
+    fo.write('        :param record: the row as read\n')
+    fo.write('        :type record: bytes\n')
+    fo.write('        """\n')
+    fo.write("        if not record.endswith(b'\\n'):\n")
+    fo.write("            record += b'\\n'\n")
+    fo.write("        self.f.write(b'%d\\t%d\\t%s\\t%s' % (offset, row, ','.join(failures).encode(), record))\n")
+    fo.write('\n')
+    fo.write('    def close(self):\n')
+    fo.write('        """\n')
+    fo.write('        Close the file.\n')
+    fo.write('        """\n')
+    fo.write('        self.f.close()\n')
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('def read_rejects(reject_file):\n')
+    fo.write('    """\n')
+    fo.write('    Read a reject file written by *RejectWriter*.\n')
+    fo.write('\n')
+    fo.write('    :param reject_file: name of the reject file\n')
+    fo.write('    :type reject_file: str\n')
+    fo.write('    :return: offset, row, failures and record of each row.  failures is a list of (field, check, action).\n')
+    fo.write('    :rtype: list\n')
+    fo.write('    """\n')
+    fo.write('    try:\n')
+    fo.write("        f = open(reject_file, 'rb')\n")
+    fo.write('    except:\n')
+    fo.write("        raise FileNotFoundError('cannot find/open file: ' + reject_file)\n")
+    fo.write('    rejects = []\n')
+    fo.write('    f.readline()\n')
+    fo.write('    for line in f:\n')
+    fo.write("        (offset, row, failures, record) = line.split(b'\\t', 3)\n")
+    fo.write("        failures = [tuple(failure.split(':')) for failure in failures.decode().split(',')]\n")
+    fo.write('        rejects += [(int(offset), int(row), failures, record)]\n')
+    fo.write('    f.close()\n')
+    fo.write('    return rejects\n')
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('def write_rejects(reject_files, data_file, header=None):\n')
+    fo.write('    """\n')
+    fo.write('    Write the records of reject files to a data file that can be read again, in the order of the rows.  The reject\n')
+    fo.write('    files of the tasks of multi_process can be given together.\n')
+    fo.write('\n')
+    fo.write('    :param reject_files: name of a reject file, or a list of them\n')
+    fo.write('    :type reject_files: str or list\n')
+    fo.write('    :param data_file: name of the file to write\n')
+    fo.write('    :type data_file: str\n')
+    fo.write('    :param header: first line to write, such as the header line of the file the rows came from\n')
+    fo.write('    :type header: bytes\n')
+    fo.write('    :return: number of records written\n')
+    fo.write('    :rtype: int\n')
+    fo.write('    """\n')
+    fo.write("    if str(type(reject_files)).find('str') >= 0:\n")
+    fo.write('        reject_files = [reject_files]\n')
+    fo.write('    rejects = []\n')
+    fo.write('    for reject_file in reject_files:\n')
+    fo.write('        rejects += read_rejects(reject_file)\n')
+    fo.write('    rejects.sort(key=lambda reject: reject[0])\n')
+    fo.write('    try:\n')
+    fo.write("        f = open(data_file, 'wb')\n")
+    fo.write('    except:\n')
+    fo.write("        raise FileNotFoundError('cannot open file: ' + data_file)\n")
+    fo.write('    if header is not None:\n')
+    fo.write("        if not header.endswith(b'\\n'):\n")
+    fo.write("            header += b'\\n'\n")
+    fo.write('        f.write(header)\n')
+    fo.write('    for reject in rejects:\n')
+    fo.write('        f.write(reject[3])\n')
+    fo.write('    f.close()\n')
+    fo.write('    return len(rejects)\n')
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('def rows_output(output_data, out_names, output_type):\n')
+    fo.write('    """\n')
+    fo.write('    Put rows of data in the form asked for by *output_type*.\n')
+    fo.write('\n')
+    fo.write('    :param output_data: rows of data\n')
+    fo.write('    :type output_data: list\n')
+    fo.write('    :param out_names: names of the fields in each row\n')
+    fo.write('    :type out_names: list\n')
+    fo.write('    :param output_type: LIST, NUMPY, PANDAS or ARRAYS\n')
+    fo.write('    :type output_type: str\n')
+    fo.write('    :return: list, numpy matrix, pandas DataFrame or dict of numpy arrays\n')
+    fo.write('    """\n')
+    fo.write("    if output_type == 'LIST':\n")
+    fo.write('        return output_data\n')
+    fo.write("    elif output_type == 'NUMPY':\n")
+    fo.write('        return np.matrix(output_data)\n')
+    fo.write("    elif output_type == 'PANDAS':\n")
+    fo.write('        return pd.DataFrame(output_data, columns=out_names)\n')
+    fo.write('    else:\n')
+    fo.write('        if len(output_data) == 0:\n')
+    fo.write('            return co.OrderedDict([(name, np.array([])) for name in out_names])\n')
+    fo.write('        return co.OrderedDict(zip(out_names, [np.array(col) for col in zip(*output_data)]))\n')
+    fo.write('\n')
+    fo.write('\n')
+
+    if file_format.upper() == 'DELIM':
+        fo.write('def seek_row(index_file, first_row, file_size, headers):\n')
+        fo.write('    """\n')
+        fo.write('    Use a row index built by data_reader.build_index to find where to start reading to get to *first_row*.\n')
+        fo.write('\n')
+        fo.write('    :param index_file: row index of the file\n')
+        fo.write('    :type index_file: str\n')
+        fo.write('    :param first_row: first row to read\n')
+        fo.write('    :type first_row: int\n')
+        fo.write('    :param file_size: size of the file in bytes\n')
+        fo.write('    :type file_size: int\n')
+        fo.write('    :param headers: True if the file has headers\n')
+        fo.write('    :type headers: bool\n')
+        fo.write('    :return: number of rows skipped, byte offset of the first row not skipped\n')
+        fo.write('    :rtype: int, int\n')
+        fo.write('    """\n')
+        fo.write('    try:\n')
+        fo.write("        index = np.load(index_file, mmap_mode='r')\n")
+        fo.write('    except:\n')
+        fo.write("        raise FileNotFoundError('cannot find/open file: ' + index_file)\n")
+        fo.write('    if int(index[1]) != file_size:\n')
+        fo.write("        raise ValueError('row_index ' + index_file + ' does not match data_file')\n")
+        fo.write('    every = int(index[0])\n')
+        fo.write('    offsets = index[3:]\n')
+        fo.write('    if offsets.shape[0] == 0:\n')
+        fo.write('        return 0, file_size\n')
+        fo.write('    if bool(headers) != (int(offsets[0]) > 0):\n')
+        fo.write("        raise ValueError('row_index was not built with headers=' + str(bool(headers)))\n")
+        fo.write('    entry = min(max(first_row - 1, 0) // every, offsets.shape[0] - 1)\n')
+        fo.write('    return entry * every, int(offsets[entry])\n')
+        fo.write('\n')
+        fo.write('\n')
+
+    if engine == 'VECTORIZED':
+        # helpers that work on a whole block of rows at a time
+        fo.write('def columns_output(columns, out_names, output_type):\n')
+        fo.write('    """\n')
+        fo.write('    Put columns of data in the form asked for by *output_type*.\n')
+        fo.write('\n')
+        fo.write('    :param columns: one array per field\n')
+        fo.write('    :type columns: list\n')
+        fo.write('    :param out_names: names of the fields\n')
+        fo.write('    :type out_names: list\n')
+        fo.write('    :param output_type: LIST, NUMPY, PANDAS or ARRAYS\n')
+        fo.write('    :type output_type: str\n')
+        fo.write('    :return: list, numpy matrix, pandas DataFrame or dict of numpy arrays\n')
+        fo.write('    """\n')
+        fo.write("    if output_type == 'PANDAS':\n")
+        fo.write('        return pd.DataFrame(co.OrderedDict(zip(out_names, columns))).infer_objects()\n')
+        fo.write("    if output_type == 'ARRAYS':\n")
+        fo.write('        return co.OrderedDict(zip(out_names, columns))\n')
+        fo.write('    output_data = [list(row) for row in zip(*[col.tolist() for col in columns])]\n')
+        fo.write('    return rows_output(output_data, out_names, output_type)\n')
+        fo.write('\n')
+        fo.write('\n')
+        fo.write('def take_rows(blocks, num_rows):\n')
+        fo.write('    """\n')
+        fo.write('    Take the first *num_rows* rows off a list of blocks.\n')
+        fo.write('\n')
+        fo.write('    :param blocks: blocks of values\n')
+        fo.write('    :type blocks: list\n')
+        fo.write('    :param num_rows: number of rows to take\n')
+        fo.write('    :type num_rows: int\n')
+        fo.write('    :return: the first *num_rows* values, list with one block of the values that are left\n')
+        fo.write('    :rtype: numpy array, list\n')
+        fo.write('    """\n')
+        fo.write('    values = np.concatenate(blocks)\n')
+        fo.write('    return values[0:num_rows], [values[num_rows:]]\n')
+        fo.write('\n')
+        fo.write('\n')
+        fo.write('def split_block(text, delim):\n')
+        fo.write('    """\n')
+        fo.write('    Split a block of whole lines into a 2-D array of fields in one shot.\n')
+        fo.write('    The lines are joined on the delimiter and split once.  If the rows do not all have the same\n')
+        fo.write('    number of fields, the rows are split one at a time and padded with empty strings.\n')
+        fo.write('\n')
+        fo.write('    :param text: decoded block of lines, each ending in "\\\\n"\n')
+        fo.write('    :type text: str\n')
+        fo.write('    :param delim: field delimiter\n')
+        fo.write('    :type delim: str\n')
+        fo.write('    :return: array of fields, one row per line\n')
+        fo.write('    :rtype: numpy array\n')
+        fo.write('    """\n')
+        fo.write('    lines = text.split("\\n")\n')
+        fo.write('    if not lines[-1]:\n')
+        fo.write('        lines.pop()\n')
+        fo.write('    if len(lines) == 0:\n')
+        fo.write('        return np.empty((0, 0), dtype=object)\n')
+        fo.write('    num_fields = lines[0].count(delim) + 1\n')
+        fo.write('    fields = delim.join(lines).split(delim)\n')
+        fo.write('    if len(fields) == len(lines) * num_fields:\n')
+        fo.write('        return np.array(fields, dtype=object).reshape(len(lines), num_fields)\n')
+        fo.write('    rows = [line.split(delim) for line in lines]\n')
+        fo.write('    return pad_rows(rows)\n')
+        fo.write('\n')
+        fo.write('\n')
+        fo.write('def pad_rows(rows):\n')
+        fo.write('    """\n')
+        fo.write('    Stack a list of rows of fields into a 2-D array, padding short rows with empty strings.\n')
+        fo.write('\n')
+        fo.write('    :param rows: rows of fields\n')
+        fo.write('    :type rows: list\n')
+        fo.write('    :return: array of fields, one row per line\n')
+        fo.write('    :rtype: numpy array\n')
+        fo.write('    """\n')
+        fo.write('    num_fields = max([len(row) for row in rows])\n')
+        fo.write('    fields = np.full((len(rows), num_fields), "", dtype=object)\n')
+        fo.write('    for (ind, row) in enumerate(rows):\n')
+        fo.write('        fields[ind, 0:len(row)] = row\n')
+        fo.write('    return fields\n')
+        fo.write('\n')
+        fo.write('\n')
+        if string_delim is not None:
+            fo.write('def parse_block(text):\n')
+            fo.write('    """\n')
+            fo.write('    Parse a block of lines that may have strings delimited by *str_delim*.\n')
+            fo.write('    This uses the Python module csv on the whole block at once.\n')
+            fo.write('\n')
+            fo.write('    :param text: decoded block of lines, each ending in "\\\\n"\n')
+            fo.write('    :type text: str\n')
+            fo.write('    :return: array of fields, one row per line\n')
+            fo.write('    :rtype: numpy array\n')
+            fo.write('    """\n')
+            fo.write('    from csv import reader as r\n')
+            fo.write('    if text.endswith("\\n"):\n')
+            fo.write('        text = text[:-1]\n')
+            fo.write('    return pad_rows(list(r(text.split("\\n"))))\n')
+            fo.write('\n')
+            fo.write('\n')
+        fo.write('def in_sorted(col, lookup):\n')
+        fo.write('    """\n')
+        fo.write('    Check a column of strings against sorted legal values, with a binary search for each value.\n')
+        fo.write('\n')
+        fo.write('    :param col: values\n')
+        fo.write('    :type col: numpy array\n')
+        fo.write('    :param lookup: legal values, sorted\n')
+        fo.write('    :type lookup: numpy array\n')
+        fo.write('    :return: True where the value is legal\n')
+        fo.write('    :rtype: numpy array\n')
+        fo.write('    """\n')
+        fo.write('    if lookup.shape[0] == 0:\n')
+        fo.write('        return np.zeros(col.shape[0], dtype=bool)\n')
+        fo.write('    place = np.searchsorted(lookup, col)\n')
+        fo.write('    place[place == lookup.shape[0]] = 0\n')
+        fo.write('    return lookup[place] == col\n')
+        fo.write('\n')
+        fo.write('\n')
+        fo.write('def in_bitmap(col, lookup):\n')
+        fo.write('    """\n')
+        fo.write('    Check a column of integers against a bitmap of legal values.\n')
+        fo.write('\n')
+        fo.write('    :param col: values\n')
+        fo.write('    :type col: numpy array\n')
+        fo.write('    :param lookup: smallest legal value, bitmap that is True at (legal value - smallest legal value)\n')
+        fo.write('    :type lookup: tuple\n')
+        fo.write('    :return: True where the value is legal\n')
+        fo.write('    :rtype: numpy array\n')
+        fo.write('    """\n')
+        fo.write('    (low, bitmap) = lookup\n')
+        fo.write('    inside = (col >= low) & (col < low + bitmap.shape[0])\n')
+        fo.write('    return inside & bitmap[np.where(inside, col - low, 0).astype(np.int64)]\n')
+        fo.write('\n')
+        fo.write('\n')
+        fo.write('def in_zips(col, lookup):\n')
+        fo.write('    """\n')
+        fo.write('    Check a column of zips against legal zips.  A 5-digit zip is made an integer from its character codes and\n')
+        fo.write('    looked up in a bitmap.  Any other value is looked up in the legal values that are not 5 digits.\n')
+        fo.write('\n')
+        fo.write('    :param col: values\n')
+        fo.write('    :type col: numpy array\n')
+        fo.write('    :param lookup: bitmap that is True at each legal 5-digit zip, sorted legal values that are not 5 digits\n')
+        fo.write('    :type lookup: tuple\n')
+        fo.write('    :return: True where the value is legal\n')
+        fo.write('    :rtype: numpy array\n')
+        fo.write('    """\n')
+        fo.write('    (bitmap, others) = lookup\n')
+        fo.write("    codes = col.astype('U5').view(np.uint32).reshape(col.shape[0], 5).astype(np.int64) - 48\n")
+        fo.write('    five = (np.char.str_len(col) == 5) & ((codes >= 0) & (codes <= 9)).all(axis=1)\n')
+        fo.write('    legal = five & in_bitmap((codes * 10 ** np.arange(4, -1, -1)).sum(axis=1), (0, bitmap))\n')
+        fo.write('    if not five.all():\n')
+        fo.write('        legal[~five] = in_sorted(col[~five], others)\n')
+        fo.write('    return legal\n')
+        fo.write('\n')
+        fo.write('\n')
+        fo.write('def to_float(col):\n')
+        fo.write('    """\n')
+        fo.write('    Convert a column of strings to float.  Values that will not convert are set to nan.\n')
+        fo.write('\n')
+        fo.write('    :param col: raw values\n')
+        fo.write('    :type col: numpy array\n')
+        fo.write('    :return: converted values, True where the value did not convert\n')
+        fo.write('    :rtype: numpy array, numpy array\n')
+        fo.write('    """\n')
+        fo.write('    try:\n')
+        fo.write('        return col.astype(np.float64), np.zeros(col.shape[0], dtype=bool)\n')
+        fo.write('    except ValueError:\n')
+        fo.write('        pass\n')
+        fo.write('    values = np.empty(col.shape[0], dtype=np.float64)\n')
+        fo.write('    bad = np.zeros(col.shape[0], dtype=bool)\n')
+        fo.write('    for (ind, val) in enumerate(col):\n')
+        fo.write('        try:\n')
+        fo.write('            values[ind] = float(val)\n')
+        fo.write('        except ValueError:\n')
+        fo.write('            values[ind] = np.nan\n')
+        fo.write('            bad[ind] = True\n')
+        fo.write('    return values, bad\n')
+        fo.write('\n')
+        fo.write('\n')
+        fo.write('def to_date(col, date_format, adjust=None):\n')
+        fo.write('    """\n')
+        fo.write('    Convert a column of strings or bytes to datetime64[D].\n')
+        fo.write('    Values laid out exactly as *date_format* are converted with array arithmetic on the character codes.\n')
+        fo.write('    Any others are converted one at a time by date_decoder, as the row engine does it.  Values that will\n')
+        fo.write('    not convert are NaT.\n')
+        fo.write('\n')
+        fo.write('    :param col: raw values\n')
+        fo.write('    :type col: numpy array\n')
+        fo.write('    :param date_format: one of the keys of date_layouts\n')
+        fo.write('    :type date_format: str\n')
+        fo.write('    :param adjust: "E" to move to the end of the month, "B" to move to the start of the month\n')
+        fo.write('    :type adjust: str\n')
+        fo.write('    :return: converted values, True where the value did not convert\n')
+        fo.write('    :rtype: numpy array, numpy array\n')
+        fo.write('    """\n')
+        fo.write('    layout = date_layouts[date_format]\n')
+        fo.write('    width = max([span[1] for span in layout if span is not None])\n')
+        fo.write("    if col.dtype.kind == 'S':\n")
+        fo.write('        text = col\n')
+        fo.write("        codes = text.astype('S' + str(width)).view(np.uint8)\n")
+        fo.write('    else:\n')
+        fo.write('        text = col.astype(str)\n')
+        fo.write("        codes = text.astype('U' + str(width)).view(np.uint32)\n")
+        fo.write('    codes = codes.reshape(text.shape[0], width).astype(np.int64) - 48\n')
+        fo.write('    ok = np.ones(text.shape[0], dtype=bool)\n')
+        fo.write('    parts = []\n')
+        fo.write('    for span in layout:\n')
+        fo.write('        if span is None:\n')
+        fo.write('            parts += [np.ones(text.shape[0], dtype=np.int64)]\n')
+        fo.write('            continue\n')
+        fo.write('        digits = codes[:, span[0]:span[1]]\n')
+        fo.write('        ok &= ((digits >= 0) & (digits <= 9)).all(axis=1)\n')
+        fo.write('        parts += [(digits * 10 ** np.arange(span[1] - span[0] - 1, -1, -1)).sum(axis=1)]\n')
+        fo.write('    (yr, mo, day) = parts\n')
+        fo.write('    for pos in range(width):\n')
+        fo.write("        if date_format[pos] == '/':\n")
+        fo.write("            ok &= codes[:, pos] == ord('/') - 48\n")
+        fo.write('    ok &= (yr >= 1) & (mo >= 1) & (mo <= 12) & (day >= 1)\n')
+        fo.write("    month = ((yr - 1970) * 12 + np.where(ok, mo, 1) - 1).astype('datetime64[M]')\n")
+        fo.write("    ok &= day <= ((month + 1).astype('datetime64[D]') - month.astype('datetime64[D]')).astype(np.int64)\n")
+        fo.write("    if adjust == 'E':\n")
+        fo.write("        values = (month + 1).astype('datetime64[D]') - 1\n")
+        fo.write("    elif adjust == 'B':\n")
+        fo.write("        values = month.astype('datetime64[D]')\n")
+        fo.write('    else:\n')
+        fo.write("        values = month.astype('datetime64[D]') + (day - 1)\n")
+        fo.write('    bad = np.zeros(text.shape[0], dtype=bool)\n')
+        fo.write('    decode = None\n')
+        fo.write('    for ind in np.flatnonzero(~ok):\n')
+        fo.write('        if decode is None:\n')
+        fo.write('            decode = date_decoder(date_format, adjust)\n')
+        fo.write('        try:\n')
+        fo.write("            values[ind] = np.datetime64(decode(text[ind]), 'D')\n")
+        fo.write('        except (ValueError, IndexError):\n')
+        fo.write("            values[ind] = np.datetime64('NaT')\n")
+        fo.write('            bad[ind] = True\n')
+        fo.write('    return values, bad\n')
+        fo.write('\n')
+        fo.write('\n')
+        fo.write('def fix_values(values, null, mask, replacement):\n')
+        fo.write('    """\n')
+        fo.write('    Apply action FIX to a block: replace the values where *mask* is True.\n')
+        fo.write('\n')
+        fo.write('    :param values: values of the field\n')
+        fo.write('    :type values: numpy array\n')
+        fo.write('    :param null: True where the value is None\n')
+        fo.write('    :type null: numpy array\n')
+        fo.write('    :param mask: True where the value failed validation\n')
+        fo.write('    :type mask: numpy array\n')
+        fo.write('    :param replacement: replacement value\n')
+        fo.write('    :type replacement: field type\n')
+        fo.write('    :return: values, null\n')
+        fo.write('    :rtype: numpy array, numpy array\n')
+        fo.write('    """\n')
+        fo.write('    if not mask.any():\n')
+        fo.write('        return values, null\n')
+        fo.write('    if replacement is None:\n')
+        fo.write('        return values, null | mask\n')
+        fo.write("    if values.dtype.kind == 'M':\n")
+        fo.write("        replacement = np.datetime64(replacement, 'D')\n")
+        fo.write('    return np.where(mask, replacement, values), null & ~mask\n')
+        fo.write('\n')
+        fo.write('\n')
+        fo.write('def block_failures(failures):\n')
+        fo.write('    """\n')
+        fo.write('    The rows of a block that failed a check of a field, for the reject file.\n')
+        fo.write('\n')
+        fo.write('    :param failures: for each check, the mask of the rows that failed it and its field:check:action\n')
+        fo.write('    :type failures: list\n')
+        fo.write('    :return: positions of the rows that failed any check, and the field:check:action of the checks each failed\n')
+        fo.write('    :rtype: numpy array, list\n')
+        fo.write('    """\n')
+        fo.write('    flagged = failures[0][0].copy()\n')
+        fo.write('    for (bad, failure) in failures[1:]:\n')
+        fo.write('        flagged |= bad\n')
+        fo.write('    at = np.flatnonzero(flagged)\n')
+        fo.write('    failed = [[] for pos in range(at.shape[0])]\n')
+        fo.write('    for (bad, failure) in failures:\n')
+        fo.write('        for pos in np.flatnonzero(bad[at]).tolist():\n')
+        fo.write('            failed[pos] += [failure]\n')
+        fo.write('    return at, failed\n')
+        fo.write('\n')
+        fo.write('\n')
+        fo.write('def first_fatal(fatal, allowed):\n')
+        fo.write('    """\n')
+        fo.write('    Count the FATAL errors of a block as the row engine meets them, by row and then by check within the row,\n')
+        fo.write('    and find the one past the number allowed.\n')
+        fo.write('\n')
+        fo.write('    :param fatal: for each FATAL check, the mask of the rows that failed it and a function from the position\n')
+        fo.write('      of a row to the message of its error\n')
+        fo.write('    :type fatal: list\n')
+        fo.write('    :param allowed: number of errors allowed in the block\n')
+        fo.write('    :type allowed: int\n')
+        fo.write('    :return: number of errors, position of the row of the first error past *allowed* (*None* if there is\n')
+        fo.write('      none) and its message\n')
+        fo.write('    :rtype: tuple\n')
+        fo.write('    """\n')
+        fo.write('    bad = np.array([mask for (mask, message) in fatal])\n')
+        fo.write('    count = np.cumsum(bad.sum(axis=0))\n')
+        fo.write('    if count[-1] <= allowed:\n')
+        fo.write('        return int(count[-1]), None, None\n')
+        fo.write("    at = int(np.searchsorted(count, allowed, side='right'))\n")
+        fo.write('    if at > 0:\n')
+        fo.write('        allowed -= int(count[at - 1])\n')
+        fo.write('    check = int(np.flatnonzero(bad[:, at])[allowed])\n')
+        fo.write('    return int(count[-1]), at, fatal[check][1](at)\n')
+        fo.write('\n')
+        fo.write('\n')
+        fo.write('def line_starts(block):\n')
+        fo.write('    """\n')
+        fo.write('    Where each line of a block of a DELIM file starts.  The last entry is the end of the block.\n')
+        fo.write('\n')
+        fo.write('    :param block: bytes of the block\n')
+        fo.write('    :type block: bytes\n')
+        fo.write('    :return: offset in the block of each line, then the length of the block\n')
+        fo.write('    :rtype: numpy array\n')
+        fo.write('    """\n')
+        fo.write('    ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10) + 1\n')
+        fo.write('    if (ends.shape[0] == 0) or (ends[-1] < len(block)):\n')
+        fo.write('        ends = np.append(ends, len(block))\n')
+        fo.write('    return np.concatenate(([0], ends))\n')
+        fo.write('\n')
+        fo.write('\n')
+        fo.write('def block_filter(col, ind, op, value):\n')
+        fo.write('    """\n')
+        fo.write('    Test a raw column of field *ind* (str for DELIM, bytes for FLAT) against a filter.  The values are converted as\n')
+        fo.write("    the field converts them, but they are not checked against the field's minimum, maximum or legal values.  Values\n")
+        fo.write('    that do not convert fail the test.\n')
+        fo.write('\n')
+        fo.write('    :param col: raw values\n')
+        fo.write('    :type col: numpy array\n')
+        fo.write('    :param ind: position of the field in field_names\n')
+        fo.write('    :type ind: int\n')
+        fo.write('    :param op: ==, !=, <, <=, >, >=, in or not in\n')
+        fo.write('    :type op: str\n')
+        fo.write('    :param value: value of the filter\n')
+        fo.write('    :type value: field type or list\n')
+        fo.write('    :return: True where the row passes\n')
+        fo.write('    :rtype: numpy array\n')
+        fo.write('    """\n')
+        fo.write('    field_type = field_types[ind]\n')
+        fo.write('    value = filter_value(field_type, op, value)\n')
+        fo.write('    bad = np.zeros(col.shape[0], dtype=bool)\n')
+        fo.write("    if field_type == 'BYTES':\n")
+        fo.write("        if col.dtype.kind != 'S':\n")
+        fo.write('            col = np.char.encode(col.astype(str))\n')
+        fo.write('    else:\n')
+        fo.write("        if col.dtype.kind == 'S':\n")
+        fo.write('            col = np.char.decode(col)\n')
+        fo.write('        else:\n')
+        fo.write('            col = col.astype(str)\n')
+        fo.write("        if field_type in ('INT', 'FLOAT', 'DATE'):\n")
+        fo.write('            if remove_char is not None:\n')
+        fo.write("                col = np.char.replace(col, remove_char, '')\n")
+        fo.write("            if field_type == 'DATE':\n")
+        fo.write('                (col, bad) = to_date(col, date_formats[ind][0], date_formats[ind][1])\n')
+        fo.write("                if op in ('in', 'not in'):\n")
+        fo.write("                    value = np.array([np.datetime64(val, 'D') for val in value], dtype='datetime64[D]')\n")
+        fo.write('                else:\n')
+        fo.write("                    value = np.datetime64(value, 'D')\n")
+        fo.write('            else:\n')
+        fo.write('                (col, bad) = to_float(col)\n')
+        fo.write("                if field_type == 'INT':\n")
+        fo.write('                    col = np.trunc(col)\n')
+        fo.write('        else:\n')
+        fo.write("            col = np.char.strip(col, ' \\r\\n')\n")
+        fo.write('            if remove_char is not None:\n')
+        fo.write("                col = np.char.replace(col, remove_char, '')\n")
+        fo.write("            if field_type == 'ZIP':\n")
+        fo.write('                lens = np.char.str_len(col)\n')
+        fo.write('                col = np.where((lens == 3) | (lens == 4), np.char.zfill(col, 5), col)\n')
+        fo.write("    if op in ('in', 'not in'):\n")
+        fo.write("        if (field_type != 'DATE') and (col.dtype.kind in 'USO'):\n")
+        fo.write("            kind = 'bytes' if col.dtype.kind == 'S' else 'str'\n")
+        fo.write('            lookup = [val for val in value if str(type(val)).find(kind) >= 0]\n')
+        fo.write('            mask = in_sorted(col, np.sort(np.array(lookup, dtype=col.dtype.kind)))\n')
+        fo.write('        else:\n')
+        fo.write('            mask = np.isin(col, list(value))\n')
+        fo.write("        if op == 'not in':\n")
+        fo.write('            mask = ~mask\n')
+        fo.write('    else:\n')
+        fo.write('        mask = filter_ops[op](col, value)\n')
+        fo.write('    return mask & ~bad\n')
+        fo.write('\n')
+        fo.write('\n')
+        fo.write('def stack(values, nulls, field_type):\n')
+        fo.write('    """\n')
+        fo.write('    Stack the blocks of a field into one array of the output type.\n')
+        fo.write('\n')
+        fo.write('    :param values: blocks of values\n')
+        fo.write('    :type values: list\n')
+        fo.write('    :param nulls: blocks of null indicators\n')
+        fo.write('    :type nulls: list\n')
+        fo.write('    :param field_type: data dictionary field_type\n')
+        fo.write('    :type field_type: str\n')
+        fo.write('    :return: values with None where null\n')
+        fo.write('    :rtype: numpy array\n')
+        fo.write('    """\n')
+        fo.write('    if len(values) == 0:\n')
+        fo.write('        return np.array([], dtype=object)\n')
+        fo.write('    values = np.concatenate(values)\n')
+        fo.write('    null = np.concatenate(nulls)\n')
+        fo.write("    if field_type == 'INT':\n")
+        fo.write('        values[null] = 0\n')
+        fo.write('        values = values.astype(np.int64)\n')
+        fo.write("    if field_type == 'DATE':\n")
+        fo.write('        values = values.astype(object)\n')
+        fo.write('    if null.any():\n')
+        fo.write('        out = np.empty(values.shape[0], dtype=object)\n')
+        fo.write('        out[~null] = values[~null].tolist()\n')
+        fo.write('        values = out\n')
+        fo.write('    return values\n')
+        fo.write('\n')
+        fo.write('\n')
 
     # reader function
     fo.write('def reader(params):\n')
@@ -826,8 +4437,11 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('        - list.  A list of lists where each sublist is a row of data.\n')
     fo.write('        - numpy. A numpy matrix.\n')
     fo.write('        - pandas. A pandas DataFrame. This is the default value.\n')
+    fo.write('        - arrays. A dict of numpy arrays, one for each field.\n')
     fo.write('        - delim. A delimited file.\n')
     fo.write('        - tfrecords. A TensorFlow TFRecord file\n')
+    fo.write('        - parquet. A Parquet file, written a row group at a time (needs pyarrow).\n')
+    fo.write('        - arrow. An Arrow IPC file, written a record batch at a time (needs pyarrow).\n')
     fo.write('    \n')
     fo.write('    - *output_file* (str). The name of the output file. If "delim" is chosen, then the data_file is\n')
     fo.write('      output to output_file line by line so the entire dataset is never in memory.  Not needed unless\n')
@@ -839,9 +4453,34 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('    \n')
     fo.write('    - *split_file* (int) If > 0, splits the file into sets of *split_file* rows. Must be at least 10\n')
     fo.write('    \n')
+    fo.write('    - *write_buffer* (int) Number of characters of "delim" output held before they are written.  The\n')
+    fo.write('      default value is 4194304.\n')
+    fo.write('    \n')
+    fo.write('    - *write_thread* (bool) If *True*, "delim" output is written by a thread of its own while reading goes\n')
+    fo.write('      on.  Default value is *False*.\n')
+    fo.write('    \n')
     fo.write('    - *partition* (str) If not None, name of field to partition the data on.\n')
     fo.write('    \n')
-    fo.write('    - *gzip* (bool) If *True*, gzip *output_file*. Default value is *False*.\n')
+    fo.write('    - *max_open_files* (int) Most "delim" files open at once.  When another is needed, the one written least\n')
+    fo.write('      recently is closed and later opened again to append.  The default value is 128.  With *partition*, the\n')
+    fo.write('      files written and their rows are listed in *output_file* with ".manifest.csv" in place of its extension.\n')
+    fo.write('    \n')
+    fo.write('    - *gzip* (bool) If *True*, gzip *output_file*. Default value is *False*.  For parquet this is the gzip\n')
+    fo.write('      codec and for arrow the zstd codec.\n')
+    fo.write('    \n')
+    fo.write('    - *compression* (str) Codec for delim (gzip, bz2, xz, zstd, none), parquet (snappy, gzip, brotli, zstd,\n')
+    fo.write('      lz4, none), arrow (lz4, zstd, none) or tfrecords (gzip, zlib, none). The default is none for delim,\n')
+    fo.write('      snappy for parquet and none for arrow and tfrecords.  Delim output is compressed as it is written, a block\n')
+    fo.write('      of *write_buffer* characters at a time, into output_file + ".gz", ".bz2", ".xz" or ".zst".  Tfrecords\n')
+    fo.write('      output is compressed by tf.io.TFRecordOptions: read it with that compression_type.\n')
+    fo.write('    \n')
+    fo.write('    - *compression_level* (int) Level of *compression*.  The default is the default of the codec.\n')
+    fo.write('    \n')
+    fo.write('    - *compression_threads* (int) Number of threads compressing blocks of delim output at once.  The default\n')
+    fo.write('      value is 0: compress each block as it is written.\n')
+    fo.write('    \n')
+    fo.write('    - *row_group_rows* (int) Number of rows in each parquet row group or arrow record batch.  The default\n')
+    fo.write('      value is 100000.\n')
     fo.write('    \n')
     fo.write('    - *headers* (bool).  True means the input file has headers.  The default value is *False*.\n')
     fo.write('    \n')
@@ -849,7 +4488,14 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('    \n')
     fo.write('    - *last_row* (int). The last row of the data to read.\n')
     fo.write('    \n')
-    fo.write('      Note that *first_row* and *last_row* are ignored by function *multi_process*.\n')
+    fo.write('      Note that *first_row* and *last_row* are ignored by function *multi_process* unless there is a\n')
+    fo.write('      *row_index*.\n')
+    fo.write('    \n')
+    if file_format.upper() == 'DELIM':
+        fo.write('    - *row_index* (str). Row index of *data_file* built by data_reader.build_index.  With it, reading\n')
+        fo.write('      goes straight to *first_row* rather than reading every line before it.\n')
+    else:
+        fo.write('    - *row_index* (str). Not needed: reading goes straight to *first_row* for FLAT files.\n')
     fo.write('    \n')
     fo.write('    - *start_byte* (int).  The byte at which to start reading the file.  The default value is 0.\n')
     fo.write('      If the value is greater than 0, then reading begins at the next line ("\\n") after *start_byte*.\n')
@@ -860,7 +4506,33 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('    \n')
     fo.write('    The above two will generally only be used for reading the file in multiprocessing mode.\n')
     fo.write('    \n')
-    fo.write('    - *sample_rate* (float). The rate at which to sample the file.  The default value is 1.\n')
+    fo.write('    - *sample_rate* (float). The rate at which to sample the file.  The default value is 1.  The rows that\n')
+    fo.write('      are not in the sample are jumped over without being split into fields.\n')
+    fo.write('    \n')
+    fo.write('    - *sample_size* (int). Number of rows of the sample.  Each row is in the sample with the same chance:\n')
+    fo.write('      the rows are held in a reservoir that is cut back to *sample_size* as it goes.  The rows come out in\n')
+    fo.write('      the order of the file.  Only for output_type list, numpy, pandas and arrays, without *batch_rows*\n')
+    fo.write('      or *multi_process*.  The default value is *None*: every row that is kept.\n')
+    fo.write('    \n')
+    fo.write('    - *seed* (int). Seed of the random draws of *sample_rate* and *sample_size*.  The same *seed* gives\n')
+    fo.write('      the same sample.  The default value is *None*: a new seed each time.\n')
+    fo.write('    \n')
+    fo.write('    - *sample_stream* (int). Number of the stream of *seed* to draw from.  Different streams give\n')
+    fo.write('      independent samples.  *multi_process* gives each task a stream of its own.  The default value is 0.\n')
+    fo.write('    \n')
+    fo.write('    - *stats* (bool or ReaderStats). If *True*, the run is clocked a stage at a time and its rows and the\n')
+    fo.write('      values that fail each check are counted (see *ReaderStats*), and the return is (output, stats).  A\n')
+    fo.write('      ReaderStats can be given instead, to be added to as the run goes, which is how *iter_batches* gives\n')
+    fo.write('      stats: they are complete when the last batch has been read.  The default value is *None*: no stats.\n')
+    fo.write('    \n')
+    fo.write('    - *reject_file* (str). File to write the rows that fail a check of a field to, with their byte offset, row\n')
+    fo.write('      number, the checks they failed and their bytes as read (see *RejectWriter*).  These are the rows dropped\n')
+    fo.write('      or fixed by the action of a field and the rows of FATAL errors under *max_errors*.  The default value\n')
+    fo.write('      is *None*: no reject file.\n')
+    fo.write('    \n')
+    fo.write('    - *max_errors* (int). Number of values that may fail a check of a field with action FATAL before the\n')
+    fo.write('      run stops with a ValueError.  Until then, the rows with those values are dropped.  The default value\n')
+    fo.write('      is 0: stop at the first.\n')
     fo.write('    \n')
     fo.write('    - *user_function* (function). A user-supplied function that is called as each row is processed.\n')
     fo.write('      It can take only one argument, a dictionary.  The dictionary entries have the form: \n')
@@ -876,9 +4548,62 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('    \n')
     fo.write('    - *window* (int). Window for mmap.  If *None* there is no window (fastest)\n')
     fo.write('    \n')
+    fo.write('    - *date_cache_size* (int). Number of distinct raw values of each DATE field whose converted date is\n')
+    fo.write('      cached.  The default value is 65536.\n')
+    fo.write('    \n')
+    fo.write('    - *columns* (list). Names of the fields to read. The others are not converted or checked and are not\n')
+    fo.write('      output.  The *partition* field is always read.  With a *user_function* or *user_class* every field\n')
+    fo.write('      is read and the fields not in *columns* are dropped after them.  The default is every field.\n')
+    fo.write('    \n')
+    fo.write('    - *filters* (list). Filters (field name, op, value), op one of ==, !=, <, <=, >, >=, in, not in.  A row\n')
+    fo.write('      is kept only if it passes them all.  They are tested before anything else is done to the row, on the\n')
+    fo.write('      raw values converted to the type of the field.  A value that does not convert fails.\n')
+    fo.write('    \n')
+    fo.write('    - *input_compression* (str). Compression of *data_file*: gzip, bz2, xz, zstd (needs zstandard) or none.\n')
+    fo.write('      The default is *None*: go by the extension of *data_file* (.gz, .bgz, .bz2, .xz, .zst).  A compressed\n')
+    fo.write('      file is decompressed a piece at a time as it is read, from *start_byte* through *end_byte*, which are\n')
+    fo.write('      bytes of the decompressed data.  It is read forward only, so *row_index* cannot be used with it.\n')
+    fo.write('    \n')
+    fo.write('    - *block_index* (str). Block index of a compressed *data_file* built by data_reader.build_block_index.\n')
+    fo.write('      With it, decompression starts at the block holding *start_byte*.  The default is *data_file* +\n')
+    fo.write('      ".blocks.npy", if it is there.\n')
+    fo.write('    \n')
+    if engine == 'VECTORIZED':
+        fo.write('    - *block_rows* (int). Approximate number of lines in each block. The default value is 100000.\n')
+        fo.write('    \n')
+    fo.write('    :param params. A dictionary of parameters directing the reading of the file.\n')
+    fo.write('    :type dict\n')
+    fo.write('    :return list, numpy, pandas DataFrame, dict of numpy arrays or None.  With stats=True, the output and a\n')
+    fo.write('    ReaderStats.\n')
+    fo.write('    \n')
+    fo.write('    """\n')
+    fo.write('    result = None\n')
+    fo.write("    if (str(type(params)).find('dict') >= 0) and (params.get('stats') is True):\n")
+    fo.write('        stats = ReaderStats()\n')
+    fo.write('        for result in iter_batches(dict(params, stats=stats), None):\n')
+    fo.write('            pass\n')
+    fo.write('        return result, stats\n')
+    fo.write('    for result in iter_batches(params, None):\n')
+    fo.write('        pass\n')
+    fo.write('    return result\n')
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('def iter_batches(params, batch_rows=100000):\n')
+    fo.write('    """\n')
+    fo.write('    Created by create_reader() of module data_reader.\n')
+    fo.write('    \n')
+    fo.write('    Read the file one batch of *batch_rows* rows at a time so that the whole dataset is never in memory.\n')
+    fo.write('    The parameters are the same as for *reader*.  Each batch is of the *output_type* in params: list,\n')
+    fo.write('    numpy, pandas (the default) or arrays.  The last batch may have fewer than *batch_rows* rows.\n')
+    fo.write('    \n')
+    fo.write('    If *batch_rows* is None, there is a single batch with all the rows.  This is how *reader* works.\n')
+    fo.write('    In that case *output_type* may also be delim, tfrecords, parquet or arrow and nothing is yielded.\n')
+    fo.write('    \n')
     fo.write('    :param params. A dictionary of parameters directing the reading of the file.\n')
     fo.write('    :type dict\n')
-    fo.write('    :return list, numpy, pandas DataFrame, or None.\n')
+    fo.write('    :param batch_rows: number of rows in each batch\n')
+    fo.write('    :type batch_rows: int\n')
+    fo.write('    :return list, numpy, pandas DataFrame or dict of numpy arrays for each batch.\n')
     fo.write('    \n')
     fo.write('    """\n')
     
@@ -900,9 +4625,30 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('        output_delim = ","\n')
     fo.write('        output_headers = True\n')
     fo.write('        gzip = False\n')
+    fo.write('        compression = None\n')
+    fo.write('        row_group_rows = 100000\n')
     fo.write('        split_file = None\n')
     fo.write('        partition = None\n')
     fo.write('        window = None\n')
+    fo.write('        sample_rate = 1\n')
+    fo.write('        sample_size = None\n')
+    fo.write('        seed = None\n')
+    fo.write('        sample_stream = 0\n')
+    fo.write('        stats = None\n')
+    fo.write('        reject_file = None\n')
+    fo.write('        max_errors = 0\n')
+    fo.write('        block_rows = 100000\n')
+    fo.write('        row_index = None\n')
+    fo.write('        date_cache_size = 65536\n')
+    fo.write('        columns = None\n')
+    fo.write('        filters = None\n')
+    fo.write('        input_compression = None\n')
+    fo.write('        block_index = None\n')
+    fo.write('        write_buffer = 1 << 22\n')
+    fo.write('        write_thread = False\n')
+    fo.write('        compression_level = None\n')
+    fo.write('        compression_threads = 0\n')
+    fo.write('        max_open_files = 128\n')
     fo.write('    # parse through the dictionary of parameters\n')
     fo.write('    else:\n')
     fo.write('        try:\n')
@@ -938,6 +4684,16 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('        except:\n')
     fo.write('            gzip = False\n')
     fo.write('        try:\n')
+    fo.write('            compression = params["compression"]\n')
+    fo.write('        except:\n')
+    fo.write('            compression = None\n')
+    fo.write('        try:\n')
+    fo.write('            row_group_rows = int(params["row_group_rows"])\n')
+    fo.write('        except:\n')
+    fo.write('            row_group_rows = 100000\n')
+    fo.write('        if row_group_rows < 1:\n')
+    fo.write('            raise ValueError("row_group_rows must be positive")\n')
+    fo.write('        try:\n')
     fo.write('            output_headers = params["output_headers"]\n')
     fo.write('        except:\n')
     fo.write('            output_headers = True\n')
@@ -960,6 +4716,56 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('        except:\n')
     fo.write('            window = None\n')
     fo.write('        try:\n')
+    fo.write('            block_rows = int(params["block_rows"])\n')
+    fo.write('        except:\n')
+    fo.write('            block_rows = 100000\n')
+    fo.write('        if block_rows < 1:\n')
+    fo.write('            raise ValueError("block_rows must be positive")\n')
+    fo.write('        try:\n')
+    fo.write('            date_cache_size = int(params["date_cache_size"])\n')
+    fo.write('        except:\n')
+    fo.write('            date_cache_size = 65536\n')
+    fo.write('        try:\n')
+    fo.write('            columns = params["columns"]\n')
+    fo.write('        except:\n')
+    fo.write('            columns = None\n')
+    fo.write('        try:\n')
+    fo.write('            filters = params["filters"]\n')
+    fo.write('        except:\n')
+    fo.write('            filters = None\n')
+    fo.write('        try:\n')
+    fo.write('            input_compression = params["input_compression"]\n')
+    fo.write('        except:\n')
+    fo.write('            input_compression = None\n')
+    fo.write('        try:\n')
+    fo.write('            block_index = params["block_index"]\n')
+    fo.write('        except:\n')
+    fo.write('            block_index = None\n')
+    fo.write('        try:\n')
+    fo.write('            write_buffer = int(params["write_buffer"])\n')
+    fo.write('        except:\n')
+    fo.write('            write_buffer = 1 << 22\n')
+    fo.write('        try:\n')
+    fo.write('            write_thread = bool(params["write_thread"])\n')
+    fo.write('        except:\n')
+    fo.write('            write_thread = False\n')
+    fo.write('        try:\n')
+    fo.write('            compression_level = params["compression_level"]\n')
+    fo.write('        except:\n')
+    fo.write('            compression_level = None\n')
+    fo.write('        try:\n')
+    fo.write('            compression_threads = int(params["compression_threads"])\n')
+    fo.write('        except:\n')
+    fo.write('            compression_threads = 0\n')
+    fo.write('        try:\n')
+    fo.write('            max_open_files = int(params["max_open_files"])\n')
+    fo.write('        except:\n')
+    fo.write('            max_open_files = 128\n')
+    fo.write('        try:\n')
+    fo.write('            row_index = params["row_index"]\n')
+    fo.write('        except:\n')
+    fo.write('            row_index = None\n')
+    fo.write('        try:\n')
     fo.write('            sample_rate = params["sample_rate"]\n')
     fo.write('        except:\n')
     fo.write('            sample_rate = 1\n')
@@ -970,6 +4776,49 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('        if (sample_rate <= 0.0) or (sample_rate>1.0):\n')
     fo.write('            raise ValueError("sample_rate is >0 and <=1")\n')
     fo.write('        try:\n')
+    fo.write('            sample_size = params["sample_size"]\n')
+    fo.write('        except:\n')
+    fo.write('            sample_size = None\n')
+    fo.write('        if sample_size is not None:\n')
+    fo.write('            try:\n')
+    fo.write('                sample_size = int(sample_size)\n')
+    fo.write('            except:\n')
+    fo.write('                raise ValueError("sample_size must be an integer")\n')
+    fo.write('            if sample_size < 1:\n')
+    fo.write('                raise ValueError("sample_size must be positive")\n')
+    fo.write('        try:\n')
+    fo.write('            seed = params["seed"]\n')
+    fo.write('        except:\n')
+    fo.write('            seed = None\n')
+    fo.write('        try:\n')
+    fo.write('            sample_stream = int(params["sample_stream"])\n')
+    fo.write('        except:\n')
+    fo.write('            sample_stream = 0\n')
+    fo.write('        try:\n')
+    fo.write('            stats = params["stats"]\n')
+    fo.write('        except:\n')
+    fo.write('            stats = None\n')
+    fo.write('        if stats is True:\n')
+    fo.write('            stats = ReaderStats()\n')
+    fo.write('        elif stats is False:\n')
+    fo.write('            stats = None\n')
+    fo.write("        if (stats is not None) and (str(type(stats)).find('ReaderStats') < 0):\n")
+    fo.write('            raise ValueError("stats must be True, False or a ReaderStats")\n')
+    fo.write('        try:\n')
+    fo.write('            reject_file = params["reject_file"]\n')
+    fo.write('        except:\n')
+    fo.write('            reject_file = None\n')
+    fo.write('        try:\n')
+    fo.write('            max_errors = params["max_errors"]\n')
+    fo.write('        except:\n')
+    fo.write('            max_errors = 0\n')
+    fo.write('        try:\n')
+    fo.write('            max_errors = int(max_errors)\n')
+    fo.write('        except:\n')
+    fo.write('            raise ValueError("max_errors must be an integer")\n')
+    fo.write('        if max_errors < 0:\n')
+    fo.write('            raise ValueError("max_errors must be non-negative")\n')
+    fo.write('        try:\n')
     fo.write('            user_function = params["user_function"]\n')
     fo.write('        except:\n')
     fo.write('            user_function = None\n')
@@ -1012,6 +4861,38 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('            if (first_row is not None) and (first_row > last_row):\n')
     fo.write('                raise ValueError("last_row cannot be less than first_row")\n')
     fo.write('    \n')
+    fo.write("    if output_type not in ('LIST', 'NUMPY', 'PANDAS', 'ARRAYS', 'DELIM', 'TFRECORDS', 'PARQUET', 'ARROW'):\n")
+    fo.write('        raise ValueError("output_type must be one of: list, numpy, pandas, arrays, delim, tfrecords, "\n')
+    fo.write('                         "parquet, arrow")\n')
+    fo.write("    if (batch_rows is not None) and (output_type in ('DELIM', 'TFRECORDS', 'PARQUET', 'ARROW')):\n")
+    fo.write('        raise ValueError("batches can only be output as list, numpy, pandas or arrays")\n')
+    fo.write('    if (batch_rows is not None) and (batch_rows < 1):\n')
+    fo.write('        raise ValueError("batch_rows must be positive")\n')
+    fo.write('    if (sample_size is not None) and ((batch_rows is not None) or\n')
+    fo.write("                                      (output_type not in ('LIST', 'NUMPY', 'PANDAS', 'ARRAYS'))):\n")
+    fo.write('        raise ValueError("sample_size can only be used with output_type list, numpy, pandas or arrays, "\n')
+    fo.write('                         "without batch_rows")\n')
+    fo.write('    # sampler draws the rows of the sample.  gap is the number of rows to jump over before the next row in the\n')
+    fo.write('    # sample and sample_keys the reservoir keys of the rows held for sample_size\n')
+    fo.write('    sampler = Sampler(sample_rate, seed, sample_stream)\n')
+    fo.write('    gap = sampler.gap()\n')
+    fo.write('    sample_keys = []\n')
+    fo.write('    # with stats, times holds the seconds of each stage of ReaderStats, clocked at the end of each stage from\n')
+    fo.write('    # the clock t at the end of the one before.  The counts of rows and violations are always kept.\n')
+    fo.write('    timing = stats is not None\n')
+    fo.write('    clock = time.perf_counter\n')
+    fo.write('    t = start = clock()\n')
+    fo.write('    times = [0.0] * len(ReaderStats.stages)\n')
+    fo.write('    count_read = count_filtered = count_dropped = count_fixed = count_out = 0\n')
+    fo.write('    fixed_row = None\n')
+    fo.write('    violations = co.Counter()\n')
+    fo.write('    # errors counts the values that failed a check of a field with action FATAL.  failed (failures for a\n')
+    fo.write('    # block) holds the checks the row failed, for the reject file rejects\n')
+    fo.write('    errors = 0\n')
+    fo.write('    failed = []\n')
+    fo.write('    rejects = None\n')
+    fo.write('    if reject_file is not None:\n')
+    fo.write('        rejects = RejectWriter(reject_file)\n')
     fo.write('    last_place = start_byte\n')
     fo.write('    # initialize user_class if it has been provided\n')
     fo.write('    if user_class is not None:\n')
@@ -1023,29 +4904,62 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     fo.write('            user_methodx = uc.__getattribute__(user_method)\n')
     fo.write('        except:\n')
     fo.write('            raise ValueError("user_class or user_method not valid")\n')
-    fo.write('    # regular expression to pull out strings within a delimiter\n')
-    fo.write('    # regular expression to separate dates with / in them\n')
-    fo.write('    if partition is not None:\n')
-    fo.write('        outfile_dict = {}\n')
-    fo.write("    parse_date_regexp = '([^/]+)'\n")
-    fo.write('    parse_date = re.compile(parse_date_regexp)\n')
+    if engine == 'ROW':
+        fo.write('    # cached date conversion for each DATE field\n')
+        for ind in range(len(data_dict)):
+            if data_dict[ind]['field_type'].upper() == 'DATE':
+                (date_format, adjust) = date_layout(data_dict[ind]['field_format'])
+                if remove_char is not None:
+                    char = "'" + remove_char + "'"
+                else:
+                    char = 'None'
+                fo.write('    decode_date' + str(ind) + " = date_decoder('" + date_format + "', " + adjust + ', ' + char +
+                         ', date_cache_size)\n')
     fo.write('    file_count = 0\n') # new
-    fo.write('    # open the file we are going to read\n')
-    fo.write('    try:\n')
-    fo.write('        fi = open(data_file, "r" )\n')
-    fo.write('    except:\n')
-    fo.write('        raise FileNotFoundError("cannot find/open file: " + data_file)\n')
-    fo.write('    m = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)\n')
+    fo.write('    # table_writer writes output_type parquet and arrow, delim_writer output_type delim and tfrecord_writer\n')
+    fo.write('    # output_type tfrecords\n')
+    fo.write('    table_writer = None\n')
+    fo.write('    delim_writer = None\n')
+    fo.write('    tfrecord_writer = None\n')
+    fo.write("    if gzip and (compression is None) and (output_type in ('PARQUET', 'ARROW', 'DELIM', 'TFRECORDS')):\n")
+    fo.write("        compression = {'PARQUET': 'gzip', 'ARROW': 'zstd', 'DELIM': 'gzip', 'TFRECORDS': 'gzip'}[output_type]\n")
+    fo.write('    # open the file we are going to read.  m starts at byte base of the data: a compressed file is only\n')
+    fo.write('    # decompressed from start_byte through end_byte, a piece at a time as it is read\n')
+    fo.write('    input_compression = data_compression(data_file, input_compression)\n')
+    fo.write('    if input_compression is not None:\n')
+    fo.write('        if row_index is not None:\n')
+    fo.write('            raise ValueError("row_index cannot be used with a compressed data_file")\n')
+    fo.write('        window = None\n')
+    if file_format.upper() == 'DELIM':
+        fo.write('    (fi, m, base) = open_data(data_file, input_compression, start_byte, end_byte, headers, block_index)\n')
+    else:
+        # a FLAT reject is the record before the one being read
+        fo.write('    (fi, m, base) = open_data(data_file, input_compression, start_byte, end_byte, False, block_index,\n')
+        fo.write('                              2 * ' + str(lrecl) + ')\n')
     fo.write('    if start_byte > 0:\n')
-    fo.write('        st = m.find(b"\\n",int(start_byte))\n')
-    fo.write('        offset = st+1\n')
+    fo.write('        # reading starts after the newline at or after start_byte.  If there is none, there is nothing to read.\n')
+    fo.write('        offset = m.find(b"\\n", int(start_byte) - base) + 1\n')
+    fo.write('        if offset == 0:\n')
+    fo.write('            offset = data_end(m, None)\n')
     fo.write('    else:\n')
     fo.write('        offset = 0\n')
-    fo.write('    if end_byte is not None:\n')
-    fo.write('        eb = end_byte\n')
-    fo.write('        end_byte = m.find(b"\\n", int(end_byte)) + 1\n')
+    fo.write('    if input_compression is not None:\n')
+    fo.write('        # the data of the StreamMap ends at the end of the line at end_byte\n')
+    fo.write('        end_byte = None\n')
+    fo.write('    elif end_byte is not None:\n')
+    fo.write('        # reading stops at the end of the line at end_byte.  A last line with no newline ends at the end of the data.\n')
+    fo.write('        end_byte = m.find(b"\\n", int(end_byte) - base) + 1\n')
     fo.write('        if end_byte == 0:\n')
-    fo.write('            end_byte = eb\n')
+    fo.write('            end_byte = len(m)\n')
+    fo.write('    # skip_rows is the number of rows jumped over to get near first_row\n')
+    fo.write('    skip_rows = 0\n')
+    if file_format.upper() == 'DELIM':
+        fo.write('    if (row_index is not None) and (first_row is not None) and (start_byte == 0):\n')
+        fo.write('        (skip_rows, offset) = seek_row(row_index, first_row, len(m), headers)\n')
+    else:
+        fo.write('    if (first_row is not None) and (start_byte == 0):\n')
+        fo.write('        skip_rows = max(first_row - 1, 0)\n')
+        fo.write('        offset = skip_rows * ' + str(lrecl) + '\n')
     fo.write('    # output_data is a list of lists that holds what we are reading (unless writing to a file)\n')
     fo.write('    output_data = []\n')
     if file_format.upper() not in ['DELIM', 'FLAT']:
@@ -1062,11 +4976,46 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
         if lrecl is None:
             raise ValueError("must specify lrecl with file_format = 'FLAT'")
     fo.write('    if module_path is None:\n')
-    fo.write("        module_path = pkg_resources.resource_filename('data_reader', 'reader/')\n")
+    fo.write("        module_path = os.path.dirname(os.path.abspath(__file__)) + '/'\n")
     fo.write('    else:\n')
     fo.write("        if module_path[-1] != '/':\n")
     fo.write("            module_path += '/'\n")
-    fo.write('    cn = "\\n"')
+    fo.write('    (column_names, legal_values, legal_lookup) = load_setup(module_path)\n')
+    fo.write('    # read is True for each field that is converted: the fields in columns and the partition field.  User\n')
+    fo.write('    # hooks can look at any field, so with hooks every field is read and drop_names are dropped after them\n')
+    fo.write('    read = [True] * ' + str(len(data_dict)) + '\n')
+    fo.write('    drop_names = []\n')
+    fo.write('    if columns is not None:\n')
+    fo.write('        if str(type(columns)).find("str") >= 0:\n')
+    fo.write('            columns = [columns]\n')
+    fo.write('        for name in columns:\n')
+    fo.write('            if name not in column_names:\n')
+    fo.write('                raise ValueError("column " + str(name) + " is not in the data dictionary")\n')
+    fo.write('        if (user_function is None) and (user_class is None):\n')
+    fo.write('            read = [(name in columns) or (name == partition) for name in column_names]\n')
+    fo.write('        else:\n')
+    fo.write('            drop_names = [name for name in column_names if (name not in columns) and (name != partition)]\n')
+    fo.write('    fields_read = [ind for ind in range(' + str(len(data_dict)) + ') if read[ind]]\n')
+    fo.write('    read_names = [column_names[ind] for ind in fields_read]\n')
+    fo.write('    # filter_list holds (position of the field, op, value) of each filter\n')
+    fo.write('    filter_list = []\n')
+    fo.write('    if filters is not None:\n')
+    fo.write('        for filt in filters:\n')
+    fo.write('            try:\n')
+    fo.write('                (name, op, value) = filt\n')
+    fo.write('            except:\n')
+    fo.write('                raise ValueError("each filter is (field name, op, value)")\n')
+    fo.write('            if name not in column_names:\n')
+    fo.write('                raise ValueError("filter field " + str(name) + " is not in the data dictionary")\n')
+    fo.write("            if op not in ('==', '!=', '<', '<=', '>', '>=', 'in', 'not in'):\n")
+    fo.write('                raise ValueError("filter op must be one of: ==, !=, <, <=, >, >=, in, not in")\n')
+    fo.write('            filter_list += [(column_names.index(name), op, value)]\n')
+    fo.write('    filter_names = [column_names[filt[0]] for filt in filter_list]\n')
+    if engine == 'ROW':
+        fo.write('    row_filters = [(ind, row_filter(ind, op, value, date_cache_size)) for (ind, op, value) in filter_list]\n')
+    
+    # the code to read the column names and legal values goes in function load_setup, written at the end
+    fs = io.StringIO()
     
     if reader_path is None:
         fname = pkg_resources.resource_filename('data_reader', 'reader/') + 'data/column_names.dat'
@@ -1079,75 +5028,68 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
     for ind in range(len(data_dict)):
         f.write(data_dict[ind]['field_name'] + '\n')
     f.close()
-    fo.write('    # read in the column names\n')
-    fo.write('    # for a FLAT file or a DELIM file, the columns must be in this order (the order built by the user\n')
-    fo.write('    # A file with headers can have the columns in a different order.  Indices below then will map\n')
-    fo.write('    # the dictionary order to the file order\n')
-    fo.write("    data_filename = module_path + '/data/column_names.dat'\n")
-    fo.write('    try:\n')
-    fo.write("        f = open(data_filename,'r')\n")
-    fo.write('    except:\n')
-    fo.write("        raise FileNotFoundError('cannot find/open file: ' + data_filename)\n")
-    fo.write('    column_names = []\n')
-    fo.write('    while True:\n')
-    fo.write('        val = f.readline()\n')
-    fo.write('        val = val.strip(" ").strip("\\n")\n')
-    fo.write('        if not val:\n')
-    fo.write('            break\n')
-    fo.write('        column_names += [val]\n')
-    fo.write('    f.close()\n')
-    fo.write('    # legal_values holds the legal values for the fields, as specified by the user.\n')
-    fo.write('    # legal_value files are in the same order as the fields in column_names\n')
-    fo.write('    # each entry of legal_values is a sorted numpy array\n')
-    fo.write('    legal_values = {}\n')
+    fs.write('    # read in the column names\n')
+    fs.write('    # for a FLAT file or a DELIM file, the columns must be in this order (the order built by the user\n')
+    fs.write('    # A file with headers can have the columns in a different order.  Indices below then will map\n')
+    fs.write('    # the dictionary order to the file order\n')
+    fs.write("    data_filename = module_path + '/data/column_names.dat'\n")
+    fs.write('    try:\n')
+    fs.write("        f = open(data_filename,'r')\n")
+    fs.write('    except:\n')
+    fs.write("        raise FileNotFoundError('cannot find/open file: ' + data_filename)\n")
+    fs.write('    column_names = []\n')
+    fs.write('    while True:\n')
+    fs.write('        val = f.readline()\n')
+    fs.write('        val = val.strip(" ").strip("\\n")\n')
+    fs.write('        if not val:\n')
+    fs.write('            break\n')
+    fs.write('        column_names += [val]\n')
+    fs.write('    f.close()\n')
+    fs.write('    # legal_values holds the legal values for the fields, as specified by the user.\n')
+    fs.write('    # legal_value files are in the same order as the fields in column_names\n')
+    fs.write('    # each entry of legal_values is a sorted numpy array\n')
+    fs.write('    legal_values = {}\n')
     
+    fs.write('    # legal_lookup holds what each check of legal values looks the values up in\n')
+    fs.write('    legal_lookup = {}\n')
     for ind in range(len(data_dict)):
         if data_dict[ind]['legal_values'] is not None:
-            # create data? files of legal values that the reader will read back me.
+            # create data? files of legal values that the reader will read back in, stored as typed numpy arrays
+            # so that they are not parsed again
             if reader_path is None:
-                fname = pkg_resources.resource_filename('data_reader', 'reader/') + 'data/data' + str(ind) + '.dat'
+                fname = pkg_resources.resource_filename('data_reader', 'reader/') + 'data/data' + str(ind) + '.npy'
             else:
-                fname = reader_path + '/data/data' + str(ind) + '.dat'
+                fname = reader_path + '/data/data' + str(ind) + '.npy'
+            var_type = data_dict[ind]['field_type'].upper()
+            lv = legal_array(data_dict[ind]['legal_values'], var_type, data_dict[ind]['field_name'])
             try:
-                f = open(fname, 'w')
+                f = open(fname, 'wb')
             except:
                 raise FileNotFoundError('could not find or open file: ' + fname)
-            for val in data_dict[ind]['legal_values']:
-                if str(type(val)).find('byte') >= 0:
-                    f.write(val.decode() + '\n')
-                else:
-                    f.write(str(val) + '\n')
+            np.save(f, lv, allow_pickle=False)
             f.close()
-            fo.write("    data_filename = module_path + '/data/data" + str(ind) + ".dat'\n")
-            fo.write('    try:\n')
-            fo.write("        f = open(data_filename,'r')\n")
-            fo.write('    except:\n')
-            fo.write("        raise FileNotFoundError('cannot find/open file: ' + data_filename)\n")
-            fo.write('    lv = []\n')
-            fo.write('    while True:\n')
-            fo.write('        val = f.readline()\n')
-            fo.write('        val = val.strip(" ").strip("\\n")\n')
-            fo.write('        if not val:\n')
-            fo.write('            break\n')
-            var_type = data_dict[ind]['field_type'].upper()
-            if var_type == 'BYTES':
-                fo.write('        val = val.encode()\n')
-            if (var_type == 'INT') or (var_type == 'FLOAT') or (var_type == 'DATE'):
-                fo.write('        try:\n')
-                if var_type == 'INT':
-                    fo.write('            val = int(float(val))\n')
-                if var_type == 'FLOAT':
-                    fo.write('            val = float(val)\n')
-                if var_type == 'DATE':
-                    fo.write("            val = datetime.datetime.strptime(val,'%Y-%m-%d').date()\n")
-                fo.write('        except:\n')
-                fo.write("            raise ValueError('Cannot interpret " + data_dict[ind]['field_name'] + \
-                         " legal value of ' + str(val) + ' as " + var_type + "')\n")
-            fo.write('        lv += [val]\n')
-            fo.write('    lv = np.array(lv)\n')
-            fo.write('    lv.sort()\n')
-            fo.write('    f.close()\n')
-            fo.write('    legal_values[' + str(ind) + '] = lv\n')
+            lookup = legal_lookup_type(lv, var_type, engine)
+            fs.write("    data_filename = module_path + '/data/data" + str(ind) + ".npy'\n")
+            fs.write('    try:\n')
+            fs.write('        lv = np.load(data_filename, allow_pickle=False)\n')
+            fs.write('    except:\n')
+            fs.write("        raise FileNotFoundError('cannot find/open file: ' + data_filename)\n")
+            fs.write('    legal_values[' + str(ind) + '] = lv\n')
+            if lookup == 'SET':
+                fs.write('    legal_lookup[' + str(ind) + '] = frozenset(lv.tolist())\n')
+            elif lookup == 'SORTED':
+                fs.write('    legal_lookup[' + str(ind) + '] = lv\n')
+            elif lookup == 'ZIP':
+                fs.write('    five = (np.char.str_len(lv) == 5) & np.char.isdigit(lv)\n')
+                fs.write('    bitmap = np.zeros(100000, dtype=bool)\n')
+                fs.write('    bitmap[lv[five].astype(np.int64)] = True\n')
+                fs.write('    legal_lookup[' + str(ind) + '] = (bitmap, lv[~five])\n')
+            elif lookup == 'BITMAP':
+                fs.write('    bitmap = np.zeros(int(lv[-1] - lv[0]) + 1, dtype=bool)\n')
+                fs.write('    bitmap[lv - lv[0]] = True\n')
+                fs.write('    legal_lookup[' + str(ind) + '] = (int(lv[0]), bitmap)\n')
+            else:
+                fs.write('    legal_lookup[' + str(ind) + '] = lv\n')
     
     fo.write('    # if the file to read is type DELIM, it might have headers\n')
     fo.write('    # and the columns can be in any order and there might be extra columns\n')
@@ -1162,380 +5104,596 @@ def create_reader(data_dict, reader_path=None, file_format='DELIM', delimiter=',
         fo.write('                    indices += [ind]\n')
         fo.write('                    break\n')
         fo.write('            else:\n')
-        fo.write("                raise ValueError('Column ' + cn + ' not in file')\n")
+        fo.write('                if (cn in read_names) or (cn in filter_names):\n')
+        fo.write("                    raise ValueError('Column ' + cn + ' not in file')\n")
+        fo.write('                indices += [None]\n')
         fo.write('    else:\n')
         fo.write('        indices = [ind for ind in range(' + str(len(data_dict)) + ')]\n')
-        fo.write('    if start_byte > 0:\n')
+        fo.write('    if (start_byte > 0) or (skip_rows > 0):\n')
         fo.write('        m.seek(offset)\n')
     else:
         fo.write('    indices = [ind for ind in range(' + str(len(data_dict)) + ')]\n')
     
-    fo.write('    # keep track of the row of the file with row_number\n')
-    fo.write('    row_number = 0\n')
-    fo.write('    # starting will be true until we find the first data row to keep\n')
-    fo.write('    starting = True\n')
-    fo.write('    # work through the file\n')
-    fo.write('    while True:\n')
-    fo.write('        # keep is True if we keep the obs\n')
-    fo.write('        keepx = True\n')
-    if file_format.upper() == 'DELIM':
-        fo.write('        line = m.readline()\n')
-        fo.write('        if not line:\n')
-        fo.write('            break\n')
+    if engine == 'ROW':
+        fo.write('    # keep track of the row of the file with row_number\n')
+        fo.write('    row_number = skip_rows\n')
+        fo.write('    out_names = [name for name in read_names if name not in drop_names]\n')
+        if (file_format.upper() == 'DELIM') and (string_delim is None):
+            fo.write('    # a line is split only as far as the last field read\n')
+            fo.write('    split_count = -1\n')
+            fo.write('    if not all(read):\n')
+            fo.write('        split_count = max([indices[ind] for ind in fields_read] +\n')
+            fo.write('                          [indices[filt[0]] for filt in filter_list] + [-1]) + 1\n')
+        fo.write('    # starting will be true until we find the first data row to keep\n')
+        fo.write('    starting = True\n')
+        fo.write('    t = clock()\n')
+        fo.write('    # work through the file\n')
+        fo.write('    while True:\n')
+        fo.write('        # keep is True if we keep the obs\n')
+        fo.write('        keepx = True\n')
+        if file_format.upper() == 'DELIM':
+            fo.write('        if gap > 0:\n')
+            fo.write('            # jump over the lines that are not in the sample without splitting them\n')
+            fo.write('            while (gap > 0) and m.readline():\n')
+            fo.write('                row_number += 1\n')
+            fo.write('                gap -= 1\n')
+            fo.write('                if ((last_row is not None) and (row_number >= last_row)) or \\\n')
+            fo.write('                        ((end_byte is not None) and (m.tell() > end_byte)):\n')
+            fo.write('                    break\n')
+            fo.write('        line = m.readline()\n')
+            fo.write('        if not line:\n')
+            fo.write('            break\n')
+            write_tick('read', 8)
+            if string_delim is None:
+                fo.write('        fx = line.split(d, split_count)\n')
+            else:
+                fo.write('        fx = parse(line)\n')
+            write_tick('split', 8)
+        if file_format.upper() == 'FLAT':
+            fo.write('        if gap > 0:\n')
+            fo.write('            # jump over the records that are not in the sample\n')
+            fo.write('            offset += gap * ' + str(lrecl) + '\n')
+            fo.write('            row_number += gap\n')
+            fo.write('            gap = 0\n')
+            fo.write('        fx = []\n')
+            fo.write('        if not m[offset:(1+offset)]:\n')
+            fo.write('            break\n')
+            fo.write('        if (end_byte is not None) and (offset >= end_byte):\n')
+            fo.write('            break\n')
+            write_tick('read', 8)
+            for ind in range(len(data_dict)):
+                fo.write('        start_offset = offset + ' + str(data_dict[ind]['field_start'] - 1) + '\n')
+                fo.write('        end_offset = start_offset + ' + str(data_dict[ind]['field_width']) + '\n')
+                fo.write('        fx += [m[start_offset:end_offset]]\n')
+            fo.write('        offset += ' + str(lrecl) + '\n')
+            write_tick('split', 8)
+        fo.write('        # the row is in the sample: draw the number of rows to jump over to the next one\n')
+        fo.write('        if sample_rate < 1:\n')
+        fo.write('            gap = sampler.gap()\n')
+        fo.write('        # check to see if it is worth working on this row\n')
+        fo.write('        row_number += 1\n')
+        fo.write('        if first_row is not None:\n')
+        fo.write('            keepx = keepx and (row_number >= first_row)\n')
+        fo.write('        if last_row is not None:\n')
+        fo.write('            if row_number > last_row:\n')
+        fo.write('                break\n')
+        fo.write('        if end_byte is not None:\n')
+        fo.write('            if m.tell() > end_byte:\n')
+        fo.write('                break\n')
+        fo.write('        if keepx:\n')
+        fo.write('            count_read += 1\n')
+        fo.write('            for (ind, test) in row_filters:\n')
+        fo.write('                if not test(fx[indices[ind]]):\n')
+        fo.write('                    keepx = False\n')
+        fo.write('                    count_filtered += 1\n')
+        fo.write('                    break\n')
+        write_tick('filter', 8)
+        fo.write('        if keepx:\n')
+        fo.write('            fx_out = co.OrderedDict()\n')
         if string_delim is None:
-            fo.write('        fx = line.split(d)\n')
+            decodeyn = '.decode()'
         else:
-            fo.write('        fx = parse(line)\n')
-    if file_format.upper() == 'FLAT':
-        fo.write('        fx = []\n')
-        fo.write('        if not m[offset:(1+offset)]:\n')
-        fo.write('            break\n')
-        fo.write('        if (end_byte is not None) and (offset >= end_byte):\n')
-        fo.write('            break\n')
+            decodeyn = ''
         for ind in range(len(data_dict)):
-            fo.write('        start_offset = offset + ' + str(data_dict[ind]['field_start'] - 1) + '\n')
-            fo.write('        end_offset = start_offset + ' + str(data_dict[ind]['field_width']) + '\n')
-            fo.write('        fx += [m[start_offset:end_offset]]\n')
-        fo.write('        offset += ' + str(lrecl) + '\n')
-    fo.write('        # check to see if it is worth working on this row\n')
-    fo.write('        if (sample_rate < 1) and (float(np.random.uniform(0,1,1)) > sample_rate):\n')
-    fo.write('            keepx = False\n')
-    fo.write('        row_number += 1\n')
-    fo.write('        if first_row is not None:\n')
-    fo.write('            keepx = keepx and (row_number >= first_row)\n')
-    fo.write('        if last_row is not None:\n')
-    fo.write('            if row_number > last_row:\n')
-    fo.write('                break\n')
-    fo.write('        if end_byte is not None:\n')
-    fo.write('            if m.tell() > end_byte:\n')
-    fo.write('                break\n')
-    fo.write('        if keepx:\n')
-    fo.write('            fx_out = co.OrderedDict()\n')
-    if string_delim is None:
-        decodeyn = '.decode()'
-    else:
-        decodeyn = ''
-    for ind in range(len(data_dict)):
-        sind = str(ind)
-        sind = 'indices[' + sind + ']'
-        var_type = data_dict[ind]['field_type'].upper()
-        var_name = data_dict[ind]['field_name']
-        min_value = data_dict[ind]['minimum_value']
-        max_value = data_dict[ind]['maximum_value']
-        var_format = data_dict[ind]['field_format']
-        if var_type == 'STR':
-            fo.write('            try:\n')
-            fo.write(
-                '                fx[' + sind + '] = fx[' + sind + ']' + decodeyn + ".strip('\\n').strip('\\r').strip(' ')\n")
-            if remove_char is not None:
+            sind = str(ind)
+            sind = 'indices[' + sind + ']'
+            # the code for the field goes to field_code first so that it can be put under "if read[ind]"
+            file_out = fo
+            fo = io.StringIO()
+            var_type = data_dict[ind]['field_type'].upper()
+            var_name = data_dict[ind]['field_name']
+            min_value = data_dict[ind]['minimum_value']
+            max_value = data_dict[ind]['maximum_value']
+            var_format = data_dict[ind]['field_format']
+            action = data_dict[ind]['action'].upper()
+            if var_type == 'STR':
+                fo.write('            try:\n')
                 fo.write(
-                    '                fx[' + sind + '] = fx[' + sind + ']' + ".replace('" + remove_char + "','')\n")
-            fo.write('            except:\n')
-            fo.write('                fx[' + sind + '] = ""\n' )
-        if var_type == 'ZIP':
-            fo.write('            try:\n')
-            fo.write(
-                '                fx[' + sind + '] = fx[' + sind + ']' + decodeyn + ".strip('\\n').strip('\\r').strip(' ')\n")
-            if remove_char is not None:
+                    '                fx[' + sind + '] = fx[' + sind + ']' + decodeyn + ".strip('\\n').strip('\\r').strip(' ')\n")
+                if remove_char is not None:
+                    fo.write(
+                        '                fx[' + sind + '] = fx[' + sind + ']' + ".replace('" + remove_char + "','')\n")
+                fo.write('            except:\n')
+                fo.write('                fx[' + sind + '] = ""\n' )
+            if var_type == 'ZIP':
+                fo.write('            try:\n')
                 fo.write(
-                    '                fx[' + sind + '] = fx[' + sind + ']' + ".replace('" + remove_char + "','')\n")
-            fo.write('            except:\n')
-            fo.write('                fx[' + sind + '] = ""\n' )
+                    '                fx[' + sind + '] = fx[' + sind + ']' + decodeyn + ".strip('\\n').strip('\\r').strip(' ')\n")
+                if remove_char is not None:
+                    fo.write(
+                        '                fx[' + sind + '] = fx[' + sind + ']' + ".replace('" + remove_char + "','')\n")
+                fo.write('            except:\n')
+                fo.write('                fx[' + sind + '] = ""\n' )
 
-            fo.write('            if len(fx[' + sind + ']) == 3:\n')
-            fo.write('                fx[' + sind + '] = "00" + fx[' + sind + ']\n')
-            fo.write('            if len(fx[' + sind + ']) == 4:\n')
-            fo.write('                fx[' + sind + '] = "0" + fx[' + sind + ']\n')
-            fo.write('            try:\n')
-            fo.write('                tmp = int(fx[' + sind + '])\n')
-            fo.write('            except:\n')
-            fo.write('                raise ValueError("zip has non-numeric values")\n')
-        if (var_type == 'STATE') or (var_type == 'STATETERR'):
-            fo.write('            try:\n')
-            fo.write(
-                '                fx[' + sind + '] = fx[' + sind + ']' + decodeyn + ".strip('\\n').strip('\\r').strip(' ')\n")
-            if remove_char is not None:
+                fo.write('            if len(fx[' + sind + ']) == 3:\n')
+                fo.write('                fx[' + sind + '] = "00" + fx[' + sind + ']\n')
+                fo.write('            if len(fx[' + sind + ']) == 4:\n')
+                fo.write('                fx[' + sind + '] = "0" + fx[' + sind + ']\n')
+                fo.write('            try:\n')
+                fo.write('                tmp = int(fx[' + sind + '])\n')
+                fo.write('            except:\n')
+                fo.write('                raise ValueError("zip has non-numeric values")\n')
+            if (var_type == 'STATE') or (var_type == 'STATETERR'):
+                fo.write('            try:\n')
                 fo.write(
-                    '                fx[' + sind + '] = fx[' + sind + ']' + ".replace('" + remove_char + "','')\n")
-            fo.write('            except:\n')
-            fo.write('                fx[' + sind + '] = ""\n' )
+                    '                fx[' + sind + '] = fx[' + sind + ']' + decodeyn + ".strip('\\n').strip('\\r').strip(' ')\n")
+                if remove_char is not None:
+                    fo.write(
+                        '                fx[' + sind + '] = fx[' + sind + ']' + ".replace('" + remove_char + "','')\n")
+                fo.write('            except:\n')
+                fo.write('                fx[' + sind + '] = ""\n' )
 
-        if var_type == 'DATE':
-            fo.write('            try:\n')
-            if remove_char is not None:
-                fo.write(
-                    '                fx[' + sind + '] = fx[' + sind + ']' + decodeyn + ".replace('" + remove_char + "','')\n")
-            else:
-                fo.write(
-                    '                fx[' + sind + '] = fx[' + sind + ']' + decodeyn + '\n')
-            if var_format.upper().find('CCYYMMDD') >= 0:
-                fo.write('                yr = int(fx[' + sind + '][0:4])\n')
-                fo.write('                mo = int(fx[' + sind + '][4:6])\n')
-                fo.write('                day = int(fx[' + sind + '][6:8])\n')
-                fo.write('                fx[' + sind + '] = datetime.date(yr, mo, day)\n')
-            elif var_format.upper().find('CCYYMM') >= 0:
-                fo.write('                yr = int(fx[' + sind + '][0:4])\n')
-                fo.write('                mo = int(fx[' + sind + '][4:6])\n')
-                fo.write('                fx[' + sind + '] = datetime.date(yr, mo, 1)\n')
-            elif var_format.upper().find('YYMM') >= 0:
-                fo.write('                yr = int(fx[' + sind + '][0:2])\n')
-                fo.write('                mo = int(fx[' + sind + '][2:4])\n')
-                fo.write('                fx[' + sind + '] = datetime.date(yr, mo, 1)\n')
-            elif var_format.upper().find('MM/DD/YY') >= 0:
-                fo.write('                dt = [int(x) for x in parse_date.findall(fx[' + sind + '])]\n')
-                fo.write('                fx[' + sind + '] = datetime.date(dt[2], dt[0], dt[1])\n')
-            elif var_format.upper().find('MMDDCCYY') >= 0:
-                fo.write('                yr = int(fx[' + sind + '][4:8])\n')
-                fo.write('                mo = int(fx[' + sind + '][0:2])\n')
-                fo.write('                day = int(fx[' + sind + '][2:4])\n')
-                fo.write('                fx[' + sind + '] = datetime.date(yr, mo, day)\n')
-            elif var_format.upper().find('MM/CCYY') >= 0:
-                fo.write('                yr = int(fx[' + sind + '][3:7])\n')
-                fo.write('                mo = int(fx[' + sind + '][0:2])\n')
-                fo.write('                fx[' + sind + '] = datetime.date(yr, mo, 1)\n')
-            elif var_format.upper().find('CCYY/MM/DD') >= 0:
-                fo.write('                yr = int(fx[' + sind + '][0:4])\n')
-                fo.write('                mo = int(fx[' + sind + '][5:7])\n')
-                fo.write('                day = int(fx[' + sind + '][8:10])\n')
-                fo.write('                fx[' + sind + '] = datetime.date(yr, mo, day)\n')
-            else:
-                fo.write('                dt = [int(x) for x in parse_date.findall(fx[' + sind + '])]\n')
-                fo.write('                fx[' + sind + '] = datetime.date(dt[2], dt[0], dt[1])\n')
-            if var_format[-1] == 'E':
-                fo.write('                fx[' + sind + '] = to_end_of_month(fx[' + sind + '])\n')
-            if var_format[-1] == 'B':
-                fo.write('                fx[' + sind + '] = fx[' + sind + '].replace(day=1)\n')
-            
-            fo.write('            except:\n')
-            
-            if data_dict[ind]['action'].upper() == 'FATAL':
-                fo.write(
-                    "                raise ValueError('type conversion error. Field:  " + var_name + \
-                    ", Value: '  + str(fx[" + sind + "]) + ' is not " + data_dict[ind]['field_type'] + "')\n")
-            else:
-                if data_dict[ind]['action'].upper() == 'DROP':
-                    fo.write('                keepx = False\n')
+            if var_type == 'DATE':
+                fo.write('            try:\n')
+                fo.write('                fx[' + sind + '] = decode_date' + str(ind) + '(fx[' + sind + '])\n')
+                fo.write('            except:\n')
+                write_row_action(action, "'type conversion error. Field:  " + var_name + ", Value: ' + str(fx[" +
+                                 sind + "]) + ' is not " + data_dict[ind]['field_type'] + "'",
+                                 data_dict[ind]['illegal_replacement_value'], sind, (var_name, 'conversion'))
+            if (var_type == 'INT') or (var_type == 'FLOAT'):
+                fo.write('            try:\n')
+                if remove_char is not None:
+                    fo.write(
+                        '                fx[' + sind + '] = fx[' + sind + ']' + decodeyn + ".replace('" + remove_char + "','')\n")
+                if var_type == 'INT':
+                    # this will truncate a float..dropping *float* will produce an error for '3.2'
+                    fo.write('                fx[' + sind + '] = int(float(fx[' + sind + ']))\n')
                 else:
-                    fo.write('                fx[' + sind + '] = ' + str(data_dict[ind]['illegal_replacement_value'])
-                             + '\n')
-        if (var_type == 'INT') or (var_type == 'FLOAT'):
-            fo.write('            try:\n')
-            if remove_char is not None:
-                fo.write(
-                    '                fx[' + sind + '] = fx[' + sind + ']' + decodeyn + ".replace('" + remove_char + "','')\n")
-            if var_type == 'INT':
-                # this will truncate a float..dropping *float* will produce an error for '3.2'
-                fo.write('                fx[' + sind + '] = int(float(fx[' + sind + ']))\n')
+                    fo.write('                fx[' + sind + '] = float(fx[' + sind + '])\n')
+                fo.write('            except ValueError:\n')
+                write_row_action(action, "'type conversion error. Field:  " + var_name + ", Value: ' + str(fx[" +
+                                 sind + "]) + ' is not " + data_dict[ind]['field_type'] + "'",
+                                 data_dict[ind]['illegal_replacement_value'], sind, (var_name, 'conversion'))
+            if min_value is not None:
+                fo.write('            # check vs. min value\n')
+                fo.write('            if (fx[' + sind + '] is not None) and (fx[' + sind + '] < ' + str(min_value) + '):\n')
+                write_row_action(action, "'value of " + var_name + " below minimum of " + str(min_value) + "'",
+                                 data_dict[ind]['minimum_replacement_value'], sind, (var_name, 'minimum'))
+            if max_value is not None:
+                fo.write('            # check vs. max value\n')
+                fo.write('            if (fx[' + sind + '] is not None) and (fx[' + sind + '] > ' + str(max_value) + '):\n')
+                write_row_action(action, "'value of " + var_name + " above maximum of " + str(max_value) + "'",
+                                 data_dict[ind]['maximum_replacement_value'], sind, (var_name, 'maximum'))
+            if data_dict[ind]['legal_values'] is not None:
+                fo.write('            # check vs. legal values\n')
+                fo.write('            if (fx[' + sind + '] is not None) and (fx[' + sind + '] not in legal_lookup[' +
+                         str(ind) + ']):\n')
+                write_row_action(action, "'value of " + var_name + " of ' + str(fx[" + sind + "]) + ' is not legal'",
+                                 data_dict[ind]['illegal_replacement_value'], sind, (var_name, 'legal'))
+            fo.write('            fx_out[column_names[' + str(ind) + ']] = fx[' + sind + ']\n')
+            field_code = fo.getvalue()
+            fo = file_out
+            fo.write('            if read[' + str(ind) + ']:\n')
+            for line in field_code.splitlines(True):
+                fo.write('    ' + line)
+        write_tick('convert', 12)
+        fo.write('            if failed:\n')
+        fo.write('                if rejects is not None:\n')
+        if file_format.upper() == 'DELIM':
+            fo.write('                    rejects.write_row(base + m.tell() - len(line), row_number, failed, line)\n')
+        else:
+            fo.write('                    rejects.write_row(base + offset - ' + str(lrecl) + ', row_number, failed,\n')
+            fo.write('                                      m[(offset - ' + str(lrecl) + '):offset])\n')
+        fo.write('                failed = []\n')
+        write_row_output()
+        fo.write('                    if window is not None:\n')
+        fo.write('                        place = m.tell()\n')
+        fo.write('                        if int(place / window) > int(last_place / window):\n')
+        fo.write('                            m.close()\n')
+        fo.write('                            m = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)\n')
+        fo.write('                            m.seek(place)\n')
+        fo.write('                            last_place = place\n')
+        fo.write('            else:\n')
+        fo.write('                count_dropped += 1\n')
+    else:
+        num_fields = str(len(data_dict))
+        fo.write('    # the vectorized engine reads blocks of whole lines. Each field is converted and checked for the\n')
+        fo.write('    # whole block at once. values/nulls hold, for each field, the converted values and where they are None.\n')
+        fo.write('    # rows only go one at a time through the user hooks and out to files\n')
+        fo.write('    by_row = (user_function is not None) or (user_class is not None)\n')
+        fo.write('    block_values = [[] for ind in range(' + num_fields + ')]\n')
+        fo.write('    block_nulls = [[] for ind in range(' + num_fields + ')]\n')
+        fo.write('    num_kept = 0\n')
+        if file_format.upper() == 'DELIM':
+            fo.write('    offset = m.tell()\n')
+            fo.write('    # the blocks stop at end_byte, or at the end of the data (see data_end) if it is None\n')
+            fo.write('    stop = end_byte\n')
+            fo.write('    block_bytes = 256 * block_rows\n')
+        else:
+            fo.write('    # records are the records that start before stop. Whole records are mapped straight from the\n')
+            fo.write('    # file; a short last record is padded out.  A compressed file is read a block of records at a time\n')
+            fo.write('    # to the end of the data, with num_records None.\n')
+            fo.write('    num_records = None\n')
+            fo.write('    if input_compression is None:\n')
+            fo.write('        if end_byte is None:\n')
+            fo.write('            stop = len(m)\n')
+            fo.write('        else:\n')
+            fo.write('            stop = min(end_byte, len(m))\n')
+            fo.write('        num_records = max(-((offset - stop) // ' + str(lrecl) + '), 0)\n')
+            fo.write('        num_whole = max((len(m) - offset) // ' + str(lrecl) + ', 0)\n')
+            fo.write('        if num_whole > 0:\n')
+            fo.write("            records = np.memmap(data_file, dtype=record_dtype, mode='r', offset=offset, shape=(num_whole,))\n")
+            fo.write('    record = 0\n')
+        fo.write('    # keep track of the row of the file with row_number\n')
+        fo.write('    row_number = skip_rows\n')
+        fo.write('    out_names = [name for name in read_names if name not in drop_names]\n')
+        fo.write('    # starting will be true until we find the first data row to keep\n')
+        fo.write('    starting = True\n')
+        fo.write('    t = clock()\n')
+        fo.write('    # work through the file\n')
+        if file_format.upper() == 'DELIM':
+            fo.write('    while True:\n')
+        else:
+            fo.write('    while (num_records is None) or (record < num_records):\n')
+        fo.write('        if (last_row is not None) and (row_number >= last_row):\n')
+        fo.write('            break\n')
+        write_tick('output', 8)
+        if file_format.upper() == 'DELIM':
+            fo.write('        end = offset + block_bytes\n')
+            fo.write('        if stop is not None:\n')
+            fo.write('            end = min(end, stop)\n')
+            fo.write('        end = data_end(m, end)\n')
+            fo.write('        if offset >= end:\n')
+            fo.write('            break\n')
+            fo.write('        if end < data_end(m, end + 1):\n')
+            fo.write('            # a block only holds whole lines\n')
+            fo.write('            end = m.rfind(b"\\n", offset, end) + 1\n')
+            fo.write('            if end == 0:\n')
+            fo.write('                if (stop is not None) and (offset + block_bytes >= stop):\n')
+            fo.write('                    break\n')
+            fo.write('                block_bytes *= 2\n')
+            fo.write('                continue\n')
+            fo.write('        text = m[offset:end].decode()\n')
+            fo.write('        if "\\r" in text:\n')
+            fo.write('            text = text.replace("\\r\\n", "\\n")\n')
+            write_tick('read', 8)
+            if string_delim is None:
+                fo.write('        picked = None\n')
+                fo.write('        if sample_rate < 1:\n')
+                fo.write('            # only the lines in the sample are split into fields\n')
+                fo.write('            lines = text.split("\\n")\n')
+                fo.write('            if not lines[-1]:\n')
+                fo.write('                lines.pop()\n')
+                fo.write('            picked = sampler.mask(len(lines))\n')
+                fo.write('            lines = list(itertools.compress(lines, picked.tolist())) + [""]\n')
+                fo.write('            text = "\\n".join(lines)\n')
+                fo.write('        fields = split_block(text, d.decode())\n')
+                fo.write('        if picked is None:\n')
+                fo.write('            n = fields.shape[0]\n')
+                fo.write('        else:\n')
+                fo.write('            n = picked.shape[0]\n')
             else:
-                fo.write('                fx[' + sind + '] = float(fx[' + sind + '])\n')
-            fo.write('            except ValueError:\n')
-            if data_dict[ind]['action'].upper() == 'FATAL':
-                fo.write(
-                    "                raise ValueError('type conversion error. Field:  " + var_name + \
-                    ", Value: '  + str(fx[" + sind + "]) + ' is not " + data_dict[ind]['field_type'] + "')\n")
+                fo.write('        fields = parse_block(text)\n')
+                fo.write('        n = fields.shape[0]\n')
+            fo.write('        block_bytes = max(int(block_rows * (end - offset) / n), 1024)\n')
+            fo.write('        (block_start, offset) = (offset, end)\n')
+        else:
+            fo.write('        if num_records is None:\n')
+            fo.write('            place = offset + record * ' + str(lrecl) + '\n')
+            fo.write('            chunk = m[place:place + block_rows * ' + str(lrecl) + ']\n')
+            fo.write('            if not chunk:\n')
+            fo.write('                break\n')
+            fo.write('            # a short last record is padded out\n')
+            fo.write("            chunk = chunk.ljust(-(-len(chunk) // " + str(lrecl) + ") * " + str(lrecl) + ", b'\\x00')\n")
+            fo.write('            fields = np.frombuffer(chunk, dtype=record_dtype)\n')
+            fo.write('        elif record < num_whole:\n')
+            fo.write('            fields = records[record:min(record + block_rows, num_records, num_whole)]\n')
+            fo.write('        else:\n')
+            fo.write('            short = m[offset + record * ' + str(lrecl) + ':len(m)]\n')
+            fo.write("            fields = np.frombuffer(short.ljust(" + str(lrecl) + ", b'\\x00'), dtype=record_dtype)\n")
+            write_tick('read', 8)
+            fo.write('        n = fields.shape[0]\n')
+            fo.write('        record += n\n')
+        fo.write('        rows = np.arange(row_number + 1, row_number + n + 1)\n')
+        fo.write('        row_number += n\n')
+        if (file_format.upper() == 'DELIM') and (string_delim is None):
+            fo.write('        if picked is not None:\n')
+            fo.write('            rows = rows[picked]\n')
+        else:
+            fo.write('        if sample_rate < 1:\n')
+            fo.write('            picked = sampler.mask(n)\n')
+            fo.write('            rows = rows[picked]\n')
+            fo.write('            fields = fields[picked]\n')
+        fo.write('        if rows.shape[0] == 0:\n')
+        fo.write('            continue\n')
+        fo.write('        # check to see which rows are worth working on\n')
+        fo.write('        keep = np.ones(rows.shape[0], dtype=bool)\n')
+        fo.write('        if first_row is not None:\n')
+        fo.write('            keep &= rows >= first_row\n')
+        fo.write('        if last_row is not None:\n')
+        fo.write('            keep &= rows <= last_row\n')
+        fo.write('        if not keep.all():\n')
+        fo.write('            fields = fields[keep]\n')
+        fo.write('            rows = rows[keep]\n')
+        write_tick('split', 8)
+        fo.write('        count_read += fields.shape[0]\n')
+        fo.write('        count_filtered += fields.shape[0]\n')
+        fo.write('        for (ind, op, value) in filter_list:\n')
+        if file_format.upper() == 'DELIM':
+            fo.write('            keep = block_filter(fields[:, indices[ind]], ind, op, value)\n')
+        else:
+            fo.write("            keep = block_filter(fields['f' + str(ind)], ind, op, value)\n")
+        fo.write('            if not keep.all():\n')
+        fo.write('                fields = fields[keep]\n')
+        fo.write('                rows = rows[keep]\n')
+        fo.write('        count_filtered -= fields.shape[0]\n')
+        write_tick('filter', 8)
+        fo.write('        # keep is now True for the rows that pass validation and fixed for the rows with a value fixed\n')
+        fo.write('        keep = np.ones(fields.shape[0], dtype=bool)\n')
+        fo.write('        fixed = np.zeros(fields.shape[0], dtype=bool)\n')
+        fo.write('        failures = []\n')
+        fo.write('        fatal = []\n')
+        fo.write('        values = [None] * ' + num_fields + '\n')
+        fo.write('        nulls = [None] * ' + num_fields + '\n')
+        for ind in range(len(data_dict)):
+            # raw is the field as read: str for DELIM, bytes for FLAT.  text is the field as str
+            if file_format.upper() == 'DELIM':
+                raw = 'fields[:, indices[' + str(ind) + ']]'
+                text = raw + '.astype(str)'
             else:
-                if data_dict[ind]['action'].upper() == 'DROP':
-                    fo.write('                keepx = False\n')
+                raw = "fields['f" + str(ind) + "']"
+                text = 'np.char.decode(' + raw + ')'
+            var_type = data_dict[ind]['field_type'].upper()
+            var_name = data_dict[ind]['field_name']
+            min_value = data_dict[ind]['minimum_value']
+            max_value = data_dict[ind]['maximum_value']
+            var_format = data_dict[ind]['field_format']
+            action = data_dict[ind]['action'].upper()
+            # the code for the field goes to field_code first so that it can be put under "if read[ind]"
+            file_out = fo
+            fo = io.StringIO()
+            fo.write('        # ' + var_name + '\n')
+            if var_type in ('STR', 'ZIP', 'STATE', 'STATETERR'):
+                fo.write('        col = np.char.strip(' + text + ', " \\r\\n")\n')
+                if remove_char is not None:
+                    fo.write("        col = np.char.replace(col, '" + remove_char + "', '')\n")
+                if var_type == 'ZIP':
+                    fo.write('        lens = np.char.str_len(col)\n')
+                    fo.write('        col = np.where((lens == 3) | (lens == 4), np.char.zfill(col, 5), col)\n')
+                    fo.write('        if not np.char.isdigit(col).all():\n')
+                    fo.write('            raise ValueError("zip has non-numeric values")\n')
+                fo.write('        null = np.zeros(col.shape[0], dtype=bool)\n')
+            if var_type == 'BYTES':
+                if file_format.upper() == 'DELIM':
+                    fo.write('        col = np.char.encode(' + text + ')\n')
                 else:
-                    fo.write('                fx[' + sind + '] = ' + str(data_dict[ind]['illegal_replacement_value'])
-                             + '\n')
-        if min_value is not None:
-            fo.write('            # check vs. min value\n')
-            fo.write('            if (fx[' + sind + '] is not None) and (fx[' + sind + '] < ' + str(min_value) + '):\n')
-            if data_dict[ind]['action'].upper() == 'FATAL':
-                fo.write("                raise ValueError('value of " + var_name + " below minimum of " + \
-                         str(min_value) + "')\n")
-            else:
-                if data_dict[ind]['action'].upper() == 'DROP':
-                    fo.write('                keepx = False\n')
+                    # a copy, so that the output does not hold on to the mapped file
+                    fo.write('        col = ' + raw + '.copy()\n')
+                fo.write('        null = np.zeros(col.shape[0], dtype=bool)\n')
+            if var_type in ('INT', 'FLOAT', 'DATE'):
+                if remove_char is not None:
+                    fo.write("        col = np.char.replace(" + text + ", '" + remove_char + "', '')\n")
                 else:
-                    fo.write(
-                        '                fx[' + sind + '] = ' + str(data_dict[ind]['minimum_replacement_value']) + '\n')
-        if max_value is not None:
-            fo.write('            # check vs. max value\n')
-            fo.write('            if (fx[' + sind + '] is not None) and (fx[' + sind + '] > ' + str(max_value) + '):\n')
-            if data_dict[ind]['action'].upper() == 'FATAL':
-                fo.write("                raise ValueError('value of " + var_name + " above maximum of " + \
-                         str(max_value) + "')\n")
-            else:
-                if data_dict[ind]['action'].upper() == 'DROP':
-                    fo.write('                keepx = False\n')
+                    fo.write('        col = ' + raw + '\n')
+                if var_type == 'DATE':
+                    (date_format, adjust) = date_layout(var_format)
+                    fo.write("        (col, bad) = to_date(col, '" + date_format + "', " + adjust + ")\n")
                 else:
-                    fo.write(
-                        '                fx[' + sind + '] = ' + str(data_dict[ind]['maximum_replacement_value']) + '\n')
-        #
-        if data_dict[ind]['legal_values'] is not None:
-            fo.write('            # check vs. legal values\n')
-            fo.write('            chk = np.searchsorted(legal_values[' + str(ind) + '], fx[' + sind + '])\n')
-            fo.write('            if (chk == legal_values[' + str(ind) + '].size) or ' +
-                     '(fx[' + sind + '] != legal_values[' + str(ind) + '][chk]):\n')
-            if data_dict[ind]['action'].upper() == 'FATAL':
-                fo.write("                raise ValueError('value of " + data_dict[ind]['field_name'] + \
-                         " of ' + str(fx[" + sind + "]) + ' is not legal')\n")
+                    fo.write('        (col, bad) = to_float(col)\n')
+                    if var_type == 'INT':
+                        # this will truncate a float, as int(float()) does
+                        fo.write('        col = np.trunc(col)\n')
+                fo.write('        null = np.zeros(col.shape[0], dtype=bool)\n')
+                write_block_action(action, "'type conversion error. Field:  " + var_name +
+                                   ", Value: ' + str(" + text + "[at]) + ' is not " +
+                                   data_dict[ind]['field_type'] + "'",
+                                   data_dict[ind]['illegal_replacement_value'], (var_name, 'conversion'))
+            write_tick('convert', 8)
+            if var_type == 'DATE':
+                bound = 'np.datetime64({0}, "D")'
             else:
-                if data_dict[ind]['action'].upper() == 'DROP':
-                    fo.write('                keepx = False\n')
+                bound = '{0}'
+            if min_value is not None:
+                fo.write('        # check vs. min value\n')
+                fo.write('        bad = ~null & (col < ' + bound.format(min_value) + ')\n')
+                write_block_action(action, "'value of " + var_name + " below minimum of " + str(min_value) + "'",
+                                   data_dict[ind]['minimum_replacement_value'], (var_name, 'minimum'))
+            if max_value is not None:
+                fo.write('        # check vs. max value\n')
+                fo.write('        bad = ~null & (col > ' + bound.format(max_value) + ')\n')
+                write_block_action(action, "'value of " + var_name + " above maximum of " + str(max_value) + "'",
+                                   data_dict[ind]['maximum_replacement_value'], (var_name, 'maximum'))
+            if data_dict[ind]['legal_values'] is not None:
+                fo.write('        # check vs. legal values\n')
+                # the value in the message as the row engine has it
+                legal_value = {'INT': 'int(col[at])', 'DATE': 'col[at].astype(object)'}.get(var_type, 'col[at]')
+                lookup = legal_lookup_type(data_dict[ind]['legal_values'], var_type, engine)
+                if lookup == 'SORTED':
+                    fo.write('        bad = ~null & ~in_sorted(col, legal_lookup[' + str(ind) + '])\n')
+                elif lookup == 'ZIP':
+                    fo.write('        bad = ~null & ~in_zips(col, legal_lookup[' + str(ind) + '])\n')
+                elif lookup == 'BITMAP':
+                    fo.write('        bad = ~null & ~in_bitmap(col, legal_lookup[' + str(ind) + '])\n')
                 else:
-                    fo.write(
-                        '                fx[' + sind + '] = ' + str(data_dict[ind]['illegal_replacement_value']) + '\n')
-        fo.write('            fx_out[column_names[' + str(ind) + ']] = fx[' + sind + ']\n')
-    fo.write('            if keepx:\n')
-    fo.write('                if user_function is not None:\n')
-    fo.write('                    keepx = user_function(fx_out)\n')
-    fo.write('                if keepx and (user_class is not None):\n')
-    fo.write('                    keepx = user_methodx(fx_out)\n')
-    fo.write('                if keepx:\n')
-    fo.write('                    if starting:\n')
-    fo.write('                        out_names = list(fx_out.keys())\n')
-    fo.write('                        if partition is not None:\n')
-    fo.write('                            if partition not in fx_out.keys():\n')
-    fo.write('                                raise ValueError("partition variable not in output file")\n')
-    fo.write('                            out_names = [r for r in out_names if r != partition]\n')
-    fo.write("                    if output_type == 'DELIM':\n")
-    fo.write('                        if partition is None:\n')
-    fo.write('                            if starting:\n')
-    fo.write('                                row_count = 0\n')
-    fo.write('                                try:\n')
-    fo.write('                                    if split_file is not None:\n')
-    fo.write('                                        opf = make_opf(output_file, None, file_count)\n')
-    fo.write('                                        fo = open(opf,"w")\n')
-    fo.write('                                        file_count += 1\n')
-    fo.write('                                    else:\n')
-    fo.write('                                        opf = output_file\n')
-    fo.write('                                        fo = open(opf,"w")\n') # (new) indented
-    fo.write('                                except:\n')
-    fo.write('                                    raise FileNotFoundError("cannot open file: " + output_file)\n')
-    fo.write('                                starting = False\n')
-    fo.write('                                if output_headers:\n')
-    fo.write('                                    for (index,field) in enumerate(out_names):\n')
-    fo.write('                                        fo.write(field)\n')
-    fo.write('                                        if index < len(out_names) - 1:\n')
-    fo.write('                                            fo.write(output_delim)\n')
-    fo.write('                                        else:\n')
-    fo.write('                                            fo.write(cn)\n')
-    fo.write('                            row_count += 1\n')
-    fo.write('                            for (index,field) in enumerate(out_names):\n')
-    fo.write('                                fo.write(str(fx_out[field]))\n')
-    fo.write('                                if index < len(out_names)-1:\n')
-    fo.write('                                    fo.write(output_delim)\n')
-    fo.write('                                else:\n')
-    fo.write('                                    fo.write(cn)\n')
-    fo.write('                            if split_file is not None and row_count > split_file:\n')
-    fo.write('                                fo.close()\n')
-    fo.write('                                starting = True\n')
-    fo.write('                                if gzip:\n')
-    fo.write("                                    call(['gzip', opf])\n")
-    fo.write('                        else:\n')
-    fo.write('                            if fx_out[partition] in outfile_dict.keys():\n')
-    fo.write('                                if outfile_dict[fx_out[partition]][2] < 0:\n')
-    fo.write('                                    fc = outfile_dict[fx_out[partition]][3]\n')
-    fo.write('                                    outfile_dict[fx_out[partition]][0] = make_opf(output_file, partition + "=" + str(fx_out[partition]), fc)\n')
-    fo.write('                                    outfile_dict[fx_out[partition]][1] = open(outfile_dict[fx_out[partition]][0],"a")\n')
-    fo.write('                                    outfile_dict[fx_out[partition]][2] = 0\n')
-    fo.write('                                fo = outfile_dict[fx_out[partition]][1]\n')
-    fo.write('                            else:\n')
-    fo.write('                                if split_file is not None:\n')
-    fo.write('                                    opf = make_opf(output_file, partition + "=" + str(fx_out[partition]), 0)\n')
-    fo.write('                                else:\n')
-    fo.write('                                    opf = make_opf(output_file, partition + "=" + str(fx_out[partition]))\n')
-    fo.write('                                fo = open(opf,"a")\n')
-    fo.write('                                outfile_dict[fx_out[partition]] = [opf, fo, 0, 0]\n')
-    fo.write('                            outfile_dict[fx_out[partition]][2] += 1\n')
-    fo.write('                            for (index,field) in enumerate(out_names):\n')
-    fo.write('                                fo.write(str(fx_out[field]))\n')
-    fo.write('                                if index < len(out_names)-1:\n')
-    fo.write('                                    fo.write(output_delim)\n')
-    fo.write('                                else:\n')
-    fo.write('                                    fo.write(cn)\n')
-
-    fo.write('                            if split_file is not None and outfile_dict[fx_out[partition]][2] > split_file:\n')
-    fo.write('                                fo.close()\n')
-    fo.write('                                if gzip:\n')
-    fo.write("                                    call(['gzip', outfile_dict[fx_out[partition]][0]])\n")
-    fo.write('                                outfile_dict[fx_out[partition]][3] += 1\n')
-    fo.write('                                outfile_dict[fx_out[partition]][2] = -1\n')
-
-    fo.write("                    elif output_type == 'TFRECORDS':\n")
-    fo.write('                        if starting:\n')
-    fo.write('                            row_count = 0\n')
-    fo.write('                            try:\n')
-    fo.write('                                writer = tf.python_io.TFRecordWriter(output_file)\n')
-    fo.write('                            except:\n')
-    fo.write('                                raise FileNotFoundError("cannot open file: " + output_file)\n')
-    fo.write('                            starting = False\n')
-    
-    fo.write('                        feature = {}\n')
-    fo.write('                        for (index,field) in enumerate(out_names):\n')
-    fo.write('                            field_type = str(type(fx_out[field]))\n')
-    fo.write("                            if field_type.find('float') >= 0:\n")
-    fo.write('                                f = tf.train.Feature(float_list=tf.train.FloatList(value=[fx_out[field]]))\n')
-    fo.write("                            elif field_type.find('str') >= 0 or field_type.find('zip') >= 0 or field_type.find('state') >= 0:\n")
-    fo.write('                                xf = [a.encode() for a in fx_out[field]]\n')
-    fo.write('                                f = tf.train.Feature(bytes_list=tf.train.BytesList(value=xf))\n')
-    fo.write("                            elif field_type.find('int') >= 0:\n")
-    fo.write('                                f = tf.train.Feature(int64_list=tf.train.Int64List(value=[fx_out[field]]))\n')
-    fo.write("                            elif field_type.find('bytes') >= 0: \n")
-    fo.write('                                xf = [a for a in fx_out[field]]\n')
-    fo.write('                                f = tf.train.Feature(bytes_list=tf.train.BytesList(value=xf))\n')
-    fo.write("                            elif field_type.find('date') >= 0: \n")
-#    fo.write('                                dt = 10000*fx_out[field].year + 100*fx_out[field].month + fx_out[field].day\n')
-    fo.write('                                dt = [fx_out[field].year, fx_out[field].month, fx_out[field].day]\n')
-    fo.write('                                f = tf.train.Feature(int64_list=tf.train.Int64List(value=dt))\n')
-    fo.write('                            feature[field] = f\n')
-    fo.write('                        features = tf.train.Features(feature=feature)\n')
-    fo.write('                        example = tf.train.Example(features=features)\n')
-    fo.write('                        writer.write(example.SerializeToString())\n')
-
-    fo.write('                    else:\n')
-    fo.write('                        fx_out = [fx_out[cc] for cc in list(fx_out.keys())]\n')
-    fo.write('                        output_data += [fx_out]\n')
-    fo.write('                    if window is not None:\n')
-    fo.write('                        place = m.tell()\n')
-    fo.write('                        if int(place / window) > int(last_place / window):\n')
-    fo.write('                            m.close()\n')
-    fo.write('                            m = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)\n')
-    fo.write('                            m.seek(place)\n')
-    fo.write('                            last_place = place\n')
+                    fo.write('        bad = ~null & ~np.isin(col, legal_lookup[' + str(ind) + '])\n')
+                write_block_action(action, "'value of " + var_name + " of ' + str(" + legal_value + ") + ' is not legal'",
+                                   data_dict[ind]['illegal_replacement_value'], (var_name, 'legal'))
+            write_tick('validate', 8)
+            fo.write('        values[' + str(ind) + '] = col\n')
+            fo.write('        nulls[' + str(ind) + '] = null\n')
+            field_code = fo.getvalue()
+            fo = file_out
+            fo.write('        if read[' + str(ind) + ']:\n')
+            for line in field_code.splitlines(True):
+                fo.write('    ' + line)
+        fo.write('        fatal_at = None\n')
+        fo.write('        if fatal:\n')
+        fo.write('            (count, fatal_at, message) = first_fatal(fatal, max_errors - errors)\n')
+        fo.write('            errors += count\n')
+        fo.write('        if failures:\n')
+        fo.write('            # rows holds the row number of each row of the block\n')
+        fo.write('            (at, failed) = block_failures(failures)\n')
+        fo.write('            if fatal_at is not None:\n')
+        fo.write('                # the rows from the one that stops the read on are not written\n')
+        fo.write('                failed = failed[0:int(np.searchsorted(at, fatal_at))]\n')
+        if file_format.upper() == 'DELIM':
+            fo.write('            block = m[block_start:end]\n')
+            fo.write('            starts = line_starts(block).tolist()\n')
+            fo.write('            for (row, failed_row) in zip(rows[at].tolist(), failed):\n')
+            fo.write('                line = row - (row_number - n + 1)\n')
+            fo.write('                rejects.write_row(base + block_start + starts[line], row, failed_row,\n')
+            fo.write('                                  block[starts[line]:starts[line + 1]])\n')
+        else:
+            fo.write('            for (row, failed_row) in zip(rows[at].tolist(), failed):\n')
+            fo.write('                place = offset + (row - skip_rows - 1) * ' + str(lrecl) + '\n')
+            fo.write('                rejects.write_row(base + place, row, failed_row, m[place:(place + ' + str(lrecl) + ')])\n')
+        fo.write('        if fatal_at is not None:\n')
+        fo.write('            raise ValueError(message)\n')
+        fo.write('        count_dropped += keep.shape[0] - int(keep.sum())\n')
+        fo.write('        count_fixed += int(fixed.sum())\n')
+        fo.write('        if not by_row:\n')
+        fo.write('            count_out += int(keep.sum())\n')
+        fo.write("        if (not by_row) and (output_type in ('PARQUET', 'ARROW')):\n")
+        fo.write('            if table_writer is None:\n')
+        fo.write('                table_writer = TableWriter(output_file, output_type, out_names, partition, split_file,\n')
+        fo.write('                                           compression, row_group_rows, compression_level)\n')
+        fo.write('            table_writer.write_columns([stack([values[ind][keep]], [nulls[ind][keep]], field_types[ind])\n')
+        fo.write('                                        for ind in fields_read])\n')
+        fo.write('            continue\n')
+        fo.write("        if (not by_row) and (output_type == 'DELIM'):\n")
+        fo.write('            if delim_writer is None:\n')
+        fo.write('                delim_writer = DelimWriter(output_file, out_names, output_delim, output_headers, partition,\n')
+        fo.write('                                           split_file, compression, write_buffer, write_thread,\n')
+        fo.write('                                           compression_level, compression_threads, max_open_files)\n')
+        fo.write('            delim_writer.write_columns([stack([values[ind][keep]], [nulls[ind][keep]], field_types[ind])\n')
+        fo.write('                                        for ind in fields_read])\n')
+        fo.write('            continue\n')
+        fo.write("        if (not by_row) and (output_type == 'TFRECORDS'):\n")
+        fo.write('            if tfrecord_writer is None:\n')
+        fo.write('                tfrecord_writer = ExampleWriter(output_file, out_names, compression, compression_level)\n')
+        fo.write('            tfrecord_writer.write_columns([stack([values[ind][keep]], [nulls[ind][keep]], field_types[ind])\n')
+        fo.write('                                           for ind in fields_read])\n')
+        fo.write('            continue\n')
+        fo.write('        if not by_row:\n')
+        fo.write('            for ind in fields_read:\n')
+        fo.write('                block_values[ind] += [values[ind][keep]]\n')
+        fo.write('                block_nulls[ind] += [nulls[ind][keep]]\n')
+        fo.write('            num_kept += int(keep.sum())\n')
+        fo.write('            if sample_size is not None:\n')
+        fo.write('                # the reservoir is cut back to sample_size when it holds twice that\n')
+        fo.write('                sample_keys += [sampler.keys(int(keep.sum()))]\n')
+        fo.write('                if num_kept >= 2 * sample_size:\n')
+        fo.write('                    sample_keys = cut_blocks(block_values, block_nulls, sample_keys, sample_size, fields_read)\n')
+        fo.write('                    num_kept = sample_size\n')
+        fo.write('            while (batch_rows is not None) and (num_kept >= batch_rows):\n')
+        fo.write('                columns = []\n')
+        fo.write('                for ind in fields_read:\n')
+        fo.write('                    (col, block_values[ind]) = take_rows(block_values[ind], batch_rows)\n')
+        fo.write('                    (null, block_nulls[ind]) = take_rows(block_nulls[ind], batch_rows)\n')
+        fo.write('                    columns += [stack([col], [null], field_types[ind])]\n')
+        fo.write('                num_kept -= batch_rows\n')
+        fo.write('                yield columns_output(columns, out_names, output_type)\n')
+        fo.write('            continue\n')
+        fo.write('        columns = [stack([values[ind][keep]], [nulls[ind][keep]], field_types[ind]).tolist()\n')
+        fo.write('                   for ind in fields_read]\n')
+        fo.write('        for row in zip(*columns):\n')
+        fo.write('            keepx = True\n')
+        fo.write('            fx_out = co.OrderedDict(zip(read_names, row))\n')
+        write_row_output()
+    if (file_format.upper() == 'FLAT') and (engine == 'VECTORIZED'):
+        fo.write('    # let go of the records so that the map can close\n')
+        fo.write('    records = fields = None\n')
     fo.write('    m.close()\n')
     fo.write('    fi.close()\n')
-    fo.write('    # select output type and we are done.\n')
-    fo.write("    if output_type == 'LIST':\n")
-    fo.write('        return output_data\n')
-    fo.write("    elif output_type == 'NUMPY':\n")
-    fo.write('        return np.matrix(output_data)\n')
-    fo.write("    elif output_type == 'PANDAS':\n")
-    fo.write('        return pd.DataFrame(output_data, columns=out_names)\n')
-    fo.write("    elif output_type == 'DELIM':\n")
-    fo.write('        if partition is None:\n')
-    fo.write('            fo.close()\n')
-    fo.write('            if gzip:\n')
-    fo.write("                call(['gzip', opf])\n")
-    fo.write('        else:\n')
-    fo.write('             for key in outfile_dict.keys():\n')
-    fo.write('                 outfile_dict[key][1].close()\n')
-    fo.write('                 if gzip:\n')
-    fo.write("                     call(['gzip', outfile_dict[key][0]])\n")
-    fo.write("    elif output_type == 'TFRECORDS':\n")
-    fo.write('        writer.close()\n')
+    fo.write('    # select output type and we are done.  With batches, only the rows left over are output here.\n')
+    if engine == 'VECTORIZED':
+        fo.write("    if (not by_row) and (output_type not in ('PARQUET', 'ARROW', 'DELIM', 'TFRECORDS')):\n")
+        fo.write('        # stack up the blocks of each field\n')
+        fo.write('        if (sample_size is not None) and (num_kept > sample_size):\n')
+        fo.write('            cut_blocks(block_values, block_nulls, sample_keys, sample_size, fields_read)\n')
+        fo.write('        if (batch_rows is None) or (num_kept > 0):\n')
+        fo.write('            columns = [stack(block_values[ind], block_nulls[ind], field_types[ind])\n')
+        fo.write('                       for ind in fields_read]\n')
+        fo.write('            yield columns_output(columns, out_names, output_type)\n')
+        fo.write("    elif output_type in ('LIST', 'NUMPY', 'PANDAS', 'ARRAYS'):\n")
+    else:
+        fo.write("    if output_type in ('LIST', 'NUMPY', 'PANDAS', 'ARRAYS'):\n")
+    fo.write('        if (sample_size is not None) and (len(output_data) > sample_size):\n')
+    fo.write('            output_data = cut_rows(output_data, sample_keys, sample_size)[0]\n')
+    fo.write('        if (batch_rows is None) or (len(output_data) > 0):\n')
+    fo.write('            yield rows_output(output_data, out_names, output_type)\n')
+    fo.write('    if tfrecord_writer is not None:\n')
+    fo.write('        tfrecord_writer.close()\n')
+    fo.write('    if table_writer is not None:\n')
+    fo.write('        table_writer.close()\n')
+    fo.write('    if delim_writer is not None:\n')
+    fo.write('        delim_writer.close()\n')
+    fo.write('    if rejects is not None:\n')
+    fo.write('        rejects.close()\n')
+    write_tick('output', 4)
+    fo.write('    if stats is not None:\n')
+    fo.write('        stats.record(times, clock() - start, [count_read, count_filtered, count_dropped, count_fixed, count_out],\n')
+    fo.write('                     violations)\n')
+    fo.write('\n')
+    fo.write('\n')
+    fo.write('def load_setup(module_path=None):\n')
+    fo.write('    """\n')
+    fo.write('    Read the column names and legal values from the data subdirectory of *module_path*.  These are read once\n')
+    fo.write('    and kept for later calls, until the files are created again.\n')
+    fo.write('\n')
+    fo.write('    :param module_path: path to this module\n')
+    fo.write('    :type module_path: str\n')
+    fo.write('    :return: column names, legal values of each field that has them, what to look each value up in\n')
+    fo.write('    :rtype: list, dict, dict\n')
+    fo.write('    """\n')
+    fo.write('    if module_path is None:\n')
+    fo.write("        module_path = os.path.dirname(os.path.abspath(__file__)) + '/'\n")
+    fo.write("    elif module_path[-1] != '/':\n")
+    fo.write("        module_path += '/'\n")
+    fo.write("    data_filename = module_path + '/data/column_names.dat'\n")
+    fo.write('    try:\n')
+    fo.write('        key = (module_path, os.stat(data_filename).st_mtime_ns)\n')
+    fo.write('    except:\n')
+    fo.write("        raise FileNotFoundError('cannot find/open file: ' + data_filename)\n")
+    fo.write('    if key in setup_cache:\n')
+    fo.write('        return setup_cache[key]\n')
+    fo.write(fs.getvalue())
+    fo.write('    setup_cache[key] = (column_names, legal_values, legal_lookup)\n')
+    fo.write('    return column_names, legal_values, legal_lookup\n')
     fo.close()
 
 
 def make_input_fn(data_dict, module_file, dep_var=None, dates='CCYYMMDD'):
     """
     
-    This function creates an input function, 'input_fn' for the TensorFlow estimator class.
+    This function creates an input function, 'input_fn' for the TensorFlow estimator class.  input_fn returns a
+    tf.data.Dataset of batches.  The files are interleaved, each batch is parsed at once, and batches are prefetched;
+    the records may be cached in memory or a file.
+    
+    Before, input_fn returned the tensors of the next batch from a one-shot iterator.  An estimator takes either, but
+    code that used those tensors directly must now iterate over the Dataset.
     
     if dep_var is specified, then it is popped off the features dictionary and returned separately. In this case,
-    the return is
+    each batch is
     
     - a dictionary of tensors that are the features of the analysis.
     - a tensor that is the dependent variable.
     
-    If it is not specified, then there is a single return: a dictionary of tensors.
+    If it is not specified, then each batch is a dictionary of tensors.
     
     TensorFlow does not have a dates data type. data_reader stores dates as a 3-tuple (year, month, day) in the
     TFRecord file.  The dates option determines how these are treated.  In each case, the length is reduced from 3
-    to 1 and the return is an Int64.  The options are:
+    to 1 and the return is a string of shape (batch, 1, 1).  A missing date is '0'.  The options are:
     
     - CCYYMMDD
     - CCYYMM
@@ -1559,22 +5717,40 @@ def make_input_fn(data_dict, module_file, dep_var=None, dates='CCYYMMDD'):
     """
     fo = open(module_file, 'w')
     fo.write('import tensorflow as tf\n\n')
-    fo.write('def input_fn(files, batch_size=1, shuffle=0, skip=0, take=0, num_epochs=1, parallel_calls=4, include_columns=None):\n')
+    fo.write('\n')
+    fo.write('def input_fn(files, batch_size=1, shuffle=0, skip=0, take=0, num_epochs=1, parallel_calls=None, include_columns=None,\n')
+    fo.write('             cache=None, cycle_length=None, compression_type=None):\n')
     fo.write('    """\n')
+    fo.write('    The records of *files* as a tf.data.Dataset of batches: a dictionary of tensors, or that and the tensor of the\n')
+    fo.write('    dependent variable.  The files are read in parallel, a record from each in turn, and each batch is parsed at\n')
+    fo.write('    once.  Batches are made ready ahead of the training.\n')
+    fo.write('\n')
     fo.write('    :param files: file (or list of files) to read\n')
     fo.write('    :type file: str or list of str\n')
     fo.write('    :param batch_size: number of records to read at each shot\n')
     fo.write('    :type batch_size: int\n')
     fo.write('    :param shuffle: number of records to shuffle (0=none)\n')
     fo.write('    :type shuffle: int\n')
+    fo.write('    :param skip: number of records to skip\n')
+    fo.write('    :type skip: int\n')
     fo.write('    :param take: number of records to read before EOF is issued\n')
     fo.write('    :type take: int\n')
     fo.write('    :param num_epochs: number of times to repeat through the data set\n')
     fo.write('    :type num_echochs: int\n')
-    fo.write('    :param parallel_calls: number of threads to use\n')
+    fo.write('    :param parallel_calls: number of threads to use.  The default is *None*: let TensorFlow tune it.\n')
     fo.write('    :type parallel_calls: int\n')
     fo.write('    :param include_columns: same as for *model_columns*: includes output type for ints and dates\n')
     fo.write('    :type include_columns: dict\n')
+    fo.write('    :param cache: *True* to keep the records in memory after the first epoch, or a file name to keep them in\n')
+    fo.write('      that file.  The default is *None*: read the files each epoch.\n')
+    fo.write('    :type cache: bool or str\n')
+    fo.write('    :param cycle_length: number of files read at once.  The default is *None*: let TensorFlow choose.  With 1,\n')
+    fo.write('      the files are read one after another.\n')
+    fo.write('    :type cycle_length: int\n')
+    fo.write('    :param compression_type: compression of the files: GZIP, ZLIB or *None* (the default)\n')
+    fo.write('    :type compression_type: str\n')
+    fo.write('    :return: batches.  Each has a first dimension of the number of records in the batch.\n')
+    fo.write('    :rtype: tf.data.Dataset\n')
     fo.write('\n')
     fo.write('    For fields of type INT or DATE, the *include_columns* dictionary directs how to treat the output.\n')
     fo.write('    The dictionary should have a key for the field that points to a dictionary.  That dictionary\n')
@@ -1582,92 +5758,94 @@ def make_input_fn(data_dict, module_file, dep_var=None, dates='CCYYMMDD'):
     fo.write('    If *include_columns* is not passed or it does not have a key for a given INT/DATE, the result\n')
     fo.write('    is treated as numeric.\n')
     fo.write('\n')
+    fo.write('    *skip* and *take* count the records in the order they are read: a record from each file in turn.\n')
+    fo.write('    A missing value is nan for a FLOAT and 0 for an INT or DATE.\n')
+    fo.write('\n')
     fo.write('    """\n')
-    fo.write('    def parse_input(proto):\n')
-    fo.write('        shape_np = 1\n')
-    fo.write('        keys_to_features = {}\n')
+    fo.write('    autotune = tf.data.experimental.AUTOTUNE\n')
+    fo.write('    if parallel_calls is None:\n')
+    fo.write('        parallel_calls = autotune\n')
+    fo.write('    keys_to_features = {}\n')
     for ind in range(len(data_dict)):
         field_name = data_dict[ind]['field_name']
         field_type = data_dict[ind]['field_type'].upper()
-        line = '        '
+        line = '    '
         if field_type == 'FLOAT':
-            line += "keys_to_features['" + field_name + "'] = tf.FixedLenFeature((shape_np), tf.float32)\n"
+            line += "keys_to_features['" + field_name + "'] = tf.io.FixedLenFeature((1), tf.float32, default_value=[float('nan')])\n"
         elif field_type == 'INT':
-            line += "keys_to_features['" + field_name + "'] = tf.FixedLenFeature((shape_np), tf.int64)\n"
+            line += "keys_to_features['" + field_name + "'] = tf.io.FixedLenFeature((1), tf.int64, default_value=[0])\n"
         elif field_type == 'DATE':
-            line += "keys_to_features['" + field_name + "'] = tf.FixedLenFeature((shape_np, 3), tf.int64)\n"
+            line += "keys_to_features['" + field_name + "'] = tf.io.FixedLenFeature((1, 3), tf.int64, default_value=[[0, 0, 0]])\n"
         elif field_type in ('STR', 'BYTES', 'STATE', 'ZIP', 'STATETERR'):
-            line += "keys_to_features['" + field_name + "'] = tf.VarLenFeature(tf.string)\n"
+            line += "keys_to_features['" + field_name + "'] = tf.io.VarLenFeature(tf.string)\n"
         fo.write(line)
-    fo.write('        parsed_features = tf.parse_single_example(proto, keys_to_features)\n')
-    if dep_var is None:
-        fo.write('        return parsed_features\n')
-    else:
-        fo.write("        dep_var = parsed_features.pop('" + dep_var + "')\n")
-        fo.write('        return parsed_features, dep_var\n')
     fo.write('\n')
-    fo.write('    ds = tf.data.TFRecordDataset(files).skip(skip)\n')
-    fo.write('    if take > 0:\n')
-    fo.write('        ds = ds.take(take)\n')
-    fo.write('    if shuffle > 0:\n')
-    fo.write('        ds = ds.suffle(buffer_size=shuffle)\n')
-    fo.write('    ds = ds.map(parse_input, num_parallel_calls=parallel_calls)\n')
-    fo.write('    if num_epochs > 1:\n')
-    fo.write('        ds = ds.repeat(num_epochs)\n')
-    fo.write('    ds = ds.batch(batch_size)\n')
-    fo.write('    iter = ds.make_one_shot_iterator()\n')
-    if dep_var is None:
-        fo.write('    x = iter.get_next()\n')
-    else:
-        fo.write('    (features, dep_var) = iter.get_next()\n')
+    fo.write('    def parse_batch(protos):\n')
+    fo.write('        features = tf.io.parse_example(protos, keys_to_features)\n')
     for ind in range(len(data_dict)):
         field_name = data_dict[ind]['field_name']
         field_type = data_dict[ind]['field_type'].upper()
         if field_name != dep_var:
             if field_type in ('STR', 'BYTES', 'STATE', 'ZIP', 'STATETERR'):
-                fo.write("    e = features.pop('" + field_name + "')\n")
-                fo.write('    cols = e.dense_shape[1]\n')
-                fo.write("    d = tf.sparse_to_dense(e.indices, (batch_size, cols), e.values, '')\n")
-                fo.write('    h = tf.reduce_join(d,1)\n')
-                fo.write("    features['" + field_name + "'] = h\n")
+                fo.write("        e = features.pop('" + field_name + "')\n")
+                fo.write("        d = tf.sparse.to_dense(e, default_value='')\n")
+                fo.write('        h = tf.strings.reduce_join(d, 1)\n')
+                fo.write("        features['" + field_name + "'] = h\n")
             if data_dict[ind]['field_type'].upper() == 'DATE':
                 dates = dates.upper()
                 if dates == 'CCYY':
-                    fo.write("    a = features['" + field_name + "']\n")
-                    fo.write('    yr = tf.as_string(tf.slice(a, [0, 0, 0], [batch_size, 1, 1]))\n')
-                    fo.write("    features['" + field_name +"'] = yr\n")
+                    fo.write("        a = features['" + field_name + "']\n")
+                    fo.write('        yr = tf.strings.as_string(a[:, :, 0:1])\n')
+                    fo.write("        features['" + field_name +"'] = yr\n")
                 elif dates == 'MM':
-                    fo.write("    a = features['" + field_name + "']\n")
-                    fo.write('    mon = tf.as_string(tf.slice(a, [0, 0, 1], [batch_size, 1, 1]))\n')
-                    fo.write("    features['" + field_name +"'] = mon\n")
+                    fo.write("        a = features['" + field_name + "']\n")
+                    fo.write('        mon = tf.strings.as_string(a[:, :, 1:2])\n')
+                    fo.write("        features['" + field_name +"'] = mon\n")
                 elif dates == 'DD':
-                    fo.write("    a = features['" + field_name + "']\n")
-                    fo.write('    day = tf.as_string(tf.slice(a, [0, 0, 2], [batch_size, 1, 1]))\n')
-                    fo.write("    features['" + field_name + "'] = day\n")
+                    fo.write("        a = features['" + field_name + "']\n")
+                    fo.write('        day = tf.strings.as_string(a[:, :, 2:3])\n')
+                    fo.write("        features['" + field_name + "'] = day\n")
                 elif dates == 'CCYYMM':
-                    fo.write("    a = features['" + field_name + "']\n")
-                    fo.write('    yr = tf.slice(a, [0, 0, 0], [batch_size, 1, 1])\n')
-                    fo.write('    mon = tf.slice(a, [0, 0, 1], [batch_size, 1, 1])\n')
-                    fo.write('    yrmon = tf.as_string(tf.add(tf.multiply(yr,100),mon))\n')
-                    fo.write("    features['" + field_name + "'] = yrmon\n")
+                    fo.write("        a = features['" + field_name + "']\n")
+                    fo.write('        yrmon = tf.strings.as_string(a[:, :, 0:1] * 100 + a[:, :, 1:2])\n')
+                    fo.write("        features['" + field_name + "'] = yrmon\n")
                 elif dates == 'CCYYMMDD':
-                    fo.write("    a = features['" + field_name + "']\n")
-                    fo.write('    yr = tf.slice(a, [0, 0, 0], [batch_size, 1, 1])\n')
-                    fo.write('    mon = tf.slice(a, [0, 0, 1], [batch_size, 1, 1])\n')
-                    fo.write('    day = tf.slice(a, [0, 0, 2], [batch_size, 1, 1])\n')
-                    fo.write('    yrmonday = tf.as_string(tf.add(tf.add(tf.multiply(yr,10000),tf.multiply(mon,100)),day))\n')
-                    fo.write("    features['" + field_name + "'] = yrmonday\n")
+                    fo.write("        a = features['" + field_name + "']\n")
+                    fo.write('        yrmonday = tf.strings.as_string(a[:, :, 0:1] * 10000 + a[:, :, 1:2] * 100 + a[:, :, 2:3])\n')
+                    fo.write("        features['" + field_name + "'] = yrmonday\n")
             if field_type in ('INT', 'DATE'):
-                fo.write("    if include_columns is not None and '" + field_name + "' in include_columns.keys():\n")
-                fo.write("        if include_columns['" + field_name + "']['type'].upper() == 'STR':\n")
-                fo.write("            e = features.pop('" + field_name + "')\n")
-                fo.write('            estr = tf.as_string(e)\n')
-                fo.write("            features['" + field_name + "'] = estr\n")
-
+                fo.write("        if include_columns is not None and '" + field_name + "' in include_columns.keys():\n")
+                fo.write("            if include_columns['" + field_name + "']['type'].upper() == 'STR':\n")
+                fo.write("                e = features.pop('" + field_name + "')\n")
+                fo.write('                estr = tf.strings.as_string(e)\n')
+                fo.write("                features['" + field_name + "'] = estr\n")
     if dep_var is None:
-        fo.write('    return features\n')
+        fo.write('        return features\n')
     else:
-        fo.write('    return features, dep_var\n')
+        fo.write("        dep_var = features.pop('" + dep_var + "')\n")
+        fo.write('        return features, dep_var\n')
+    fo.write('\n')
+    fo.write('    if isinstance(files, str):\n')
+    fo.write('        files = [files]\n')
+    fo.write('    ds = tf.data.Dataset.from_tensor_slices(files)\n')
+    fo.write('    ds = ds.interleave(lambda f: tf.data.TFRecordDataset(f, compression_type=compression_type),\n')
+    fo.write('                       cycle_length=cycle_length, num_parallel_calls=parallel_calls)\n')
+    fo.write('    if skip > 0:\n')
+    fo.write('        ds = ds.skip(skip)\n')
+    fo.write('    if take > 0:\n')
+    fo.write('        ds = ds.take(take)\n')
+    fo.write('    # the records are kept before shuffling, so each epoch is shuffled anew\n')
+    fo.write('    if cache is True:\n')
+    fo.write('        ds = ds.cache()\n')
+    fo.write('    elif cache:\n')
+    fo.write('        ds = ds.cache(cache)\n')
+    fo.write('    if shuffle > 0:\n')
+    fo.write('        ds = ds.shuffle(buffer_size=shuffle)\n')
+    fo.write('    if num_epochs > 1:\n')
+    fo.write('        ds = ds.repeat(num_epochs)\n')
+    fo.write('    ds = ds.batch(batch_size)\n')
+    fo.write('    ds = ds.map(parse_batch, num_parallel_calls=parallel_calls)\n')
+    fo.write('    return ds.prefetch(autotune)\n')
     fo.write('\n')
     fo.close()
     return
@@ -7,9 +7,86 @@ import pandas as pd
 import numpy as np
 import datetime
 import time
+import os
+import sys
+import tempfile
+import importlib.util
+
+
+def make_reader(data_dict, reader_path, module_name, **kwargs):
+    """
+    Create a reader in reader_path and import it.
+    """
+    if not os.path.isdir(reader_path + '/data'):
+        os.mkdir(reader_path + '/data')
+    d.create_reader(data_dict, reader_path=reader_path, module_name=module_name, **kwargs)
+    spec = importlib.util.spec_from_file_location(module_name, reader_path + '/' + module_name + '.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # so that multi_process can pickle the reader
+    sys.modules[module_name] = module
+    return module
+
+
+def write_test_file(file_name, rows=500, headers=False):
+    """
+    Write a small DELIM file: obs, sin of obs, letters, state, date as CCYYMMDD and as MM/DD/CCYY.
+    Every 97th sin is not a number.
+    """
+    base = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    base_state = 'AZTXNYCAFLMIOHWIMNNVUT'
+    with open(file_name, 'w') as f:
+        if headers:
+            f.write('obs,sin,letters,state,date1,date2\n')
+        for i in range(1, rows + 1):
+            dt = datetime.date(2000, 1, 1) + datetime.timedelta(7 * i)
+            if i % 97 == 0:
+                sin = 'x'
+            else:
+                sin = str(round(np.sin(i), 3))
+            f.write(str(i) + ',' + sin + ',' + base[i % 48: 5 + i % 48] + ',' + base_state[2*(i % 11): 2 + 2*(i % 11)]
+                    + ',' + dt.strftime('%Y%m%d') + ',' + dt.strftime('%m/%d/%Y') + '\n')
+
+
+# the fields of write_test_file and their add_field arguments
+file_fields = {'obs': {'field_type': 'int'}, 'sin': {'field_type': 'float'}, 'letters': {'field_type': 'str'},
+               'state': {'field_type': 'state'}, 'date1': {'field_type': 'date', 'field_format': 'CCYYMMDD'},
+               'date2': {'field_type': 'date', 'field_format': 'MM/DD/CCYY'}}
+
+
+def dictionary_of(names, **options):
+    """
+    A data dictionary of fields of write_test_file.  A keyword argument named for a field gives add_field
+    arguments that are added to or replace those of file_fields.
+    """
+    dp = d.BuildDataDictionary()
+    for name in names:
+        dp.add_field(name, **dict(file_fields[name], **options.get(name, {})))
+    return dp
 
 
 class TestBuild_data_dictionary(TestCase):
+    
+    def setUp(self):
+        # each test works in a directory of its own that is removed when it is done
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = self.tmp_dir.name
+        self.data_file = self.tmp + '/test.csv'
+    
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+    
+    def reader(self, dp, module_name, **kwargs):
+        """
+        Create a reader of data dictionary dp in the test directory and import it.
+        """
+        return make_reader(dp.dictionary, self.tmp, module_name, **kwargs)
+    
+    def params(self, **kwargs):
+        """
+        Parameters for reader of the test file, with the reader in the test directory.
+        """
+        return dict({'data_file': self.data_file, 'module_path': self.tmp}, **kwargs)
 
     # 3: w/date: 4870
     def test_new(self):
@@ -392,3 +469,715 @@ class TestBuild_data_dictionary(TestCase):
         self.assertEqual(rr, 0, 'record counts not correct')
 
         
+
+    def test_vectorized(self):
+        
+        # the vectorized engine must give the same result as the row engine
+        write_test_file(self.data_file, headers=True)
+        dv = dictionary_of(['obs', 'sin', 'letters', 'state', 'date1', 'date2'],
+                           sin={'maximum_value': 0.5, 'maximum_replacement_value': 2.0,
+                                'minimum_value': -0.5, 'minimum_replacement_value': -2.0},
+                           letters={'legal_values': ['bcdef', 'cdefg', 'defgh'], 'illegal_replacement_value': '"zzzzz"'},
+                           date1={'field_format': 'CCYYMMDDE', 'minimum_value': 'date(2001,1,1)', 'action': 'fix'})
+        rr = self.reader(dv, 'row_reader')
+        rv = self.reader(dv, 'vec_reader', engine='vectorized')
+        params = self.params(headers=True, block_rows=50)
+        for extra in ({}, {'first_row': 20, 'last_row': 300}, {'start_byte': 1000, 'end_byte': 9000}):
+            px = params.copy()
+            px.update(extra)
+            self.assertTrue(rr.reader(px.copy()).equals(rv.reader(px.copy())), 'vectorized engine does not match')
+            px['output_type'] = 'list'
+            self.assertEqual(rr.reader(px.copy()), rv.reader(px.copy()), 'vectorized engine does not match')
+
+        def user1(fx):
+            fx['obs2'] = 2 * fx['obs']
+            return fx['obs'] % 3 == 0
+
+        params['user_function'] = user1
+        self.assertTrue(rr.reader(params.copy()).equals(rv.reader(params.copy())), 'vectorized user_function failed')
+
+    def test_iter_batches(self):
+        
+        # batches put back together must be the same as reading the whole file, for both engines
+        write_test_file(self.data_file)
+        db = dictionary_of(['obs', 'sin', 'letters', 'state', 'date1', 'date2'])
+        for engine in ('row', 'vectorized'):
+            rb = self.reader(db, 'batch_reader_' + engine, engine=engine)
+            params = self.params(first_row=3, block_rows=70)
+            full = rb.reader(params.copy())
+            batches = list(rb.iter_batches(params.copy(), batch_rows=100))
+            self.assertEqual([b.shape[0] for b in batches], [100, 100, 100, 100, 98], 'batch sizes are not right')
+            self.assertTrue(pd.concat(batches, ignore_index=True).equals(full), 'batches do not match reader')
+
+            params['output_type'] = 'arrays'
+            batches = list(rb.iter_batches(params.copy(), batch_rows=400))
+            self.assertEqual(len(batches), 2, 'wrong number of batches')
+            chk = (np.concatenate([b['obs'] for b in batches]) != np.arange(3, 501)).sum()
+            self.assertEqual(chk, 0, 'arrays batches are not right')
+
+    def test_row_index(self):
+        
+        # reading with a row index must give the same rows as reading without one
+        write_test_file(self.data_file, headers=True)
+        index_file = d.build_index(self.data_file, every=7, headers=True)
+        index = np.load(index_file)
+        self.assertEqual(list(index[0:3]), [7, os.stat(self.data_file).st_size, 500], 'index header is not right')
+        db = dictionary_of(['obs', 'sin', 'date1'])
+        for engine in ('row', 'vectorized'):
+            ri = self.reader(db, 'index_reader_' + engine, engine=engine)
+            for (first_row, last_row) in ((1, None), (8, 8), (50, 120), (496, None)):
+                params = self.params(headers=True, first_row=first_row, last_row=last_row)
+                full = ri.reader(params.copy())
+                params['row_index'] = index_file
+                self.assertTrue(ri.reader(params).equals(full), 'row index read does not match')
+            self.assertRaises(ValueError, ri.reader, self.params(first_row=5, row_index=index_file))
+
+    def test_shared_memory(self):
+        
+        # multi_process must give the same data whether or not the output comes back through shared memory
+        write_test_file(self.data_file)
+        db = dictionary_of(['obs', 'sin', 'letters', 'date1'], sin={'action': 'fix', 'illegal_replacement_value': None})
+        rs = self.reader(db, 'shared_reader')
+        params = self.params(output_type='pandas')
+        full = rs.reader(params.copy())
+        output = d.multi_process(rs.reader, params.copy(), 3, shared_memory=True)
+        self.assertTrue(output.equals(full), 'shared memory output does not match reader')
+        output = d.multi_process(rs.reader, params.copy(), 3)
+        self.assertTrue(output.reset_index(drop=True).equals(full), 'multi_process output does not match reader')
+        params['output_type'] = 'list'
+        output = d.multi_process(rs.reader, params.copy(), 2, shared_memory=True)
+        self.assertEqual(output, rs.reader(params.copy()), 'shared memory list output does not match reader')
+        # the columns go into the block a batch at a time, and a read that keeps no rows still has its columns
+        params = self.params(output_type='arrays', block_rows=64)
+        for engine in ('row', 'vectorized'):
+            rb = self.reader(db, 'shared_batches_' + engine, engine=engine)
+            full = rb.reader(params.copy())
+            (output, stats) = d.multi_process(rb.reader, dict(params, stats=True), 3, shared_memory=True)
+            self.assertEqual(list(output.keys()), list(full.keys()))
+            for name in full:
+                self.assertEqual(output[name].tolist(), full[name].tolist(), 'column ' + name + ' does not match')
+            self.assertEqual(stats.rows['read'], 500, 'wrong number of rows read')
+            output = d.multi_process(rb.reader, dict(params, filters=[('obs', '>', 1000)]), 3, shared_memory=True)
+            self.assertEqual([(name, col.shape[0]) for (name, col) in output.items()],
+                             [('obs', 0), ('sin', 0), ('letters', 0), ('date1', 0)])
+
+    def test_chunk_size(self):
+        
+        # many small tasks, more processes than the old limit of 26 and streamed output give the same rows
+        write_test_file(self.data_file)
+        rc = self.reader(dictionary_of(['obs', 'letters']), 'chunk_reader')
+        params = self.params(output_type='list')
+        full = rc.reader(params.copy())
+        self.assertEqual(d.multi_process(rc.reader, params.copy(), 30, chunk_size=1000), full, 'chunked output not right')
+        parts = list(d.multi_process(rc.reader, params.copy(), 3, chunk_size=2000, stream=True))
+        num_tasks = int(np.ceil(os.stat(self.data_file).st_size / 2000))
+        self.assertEqual(len(parts), num_tasks, 'wrong number of tasks')
+        self.assertEqual(sorted(sum(parts, [])), full, 'streamed output not right')
+
+    def test_reader_pool(self):
+        
+        # a ReaderPool reads many files with the same processes
+        for ind in range(4):
+            write_test_file(self.tmp + '/test' + str(ind) + '.csv', rows=100 + ind)
+        rp = self.reader(dictionary_of(['obs', 'state']), 'pool_reader')
+        params = [self.params(data_file=self.tmp + '/test' + str(ind) + '.csv', output_type='list') for ind in range(4)]
+        with d.ReaderPool(rp.reader, 2, module_path=self.tmp) as pool:
+            outputs = pool.map(params)
+            self.assertEqual([len(output) for output in outputs], [100, 101, 102, 103], 'wrong number of rows')
+            self.assertEqual(outputs[2], rp.reader(params[2].copy()), 'pool output does not match reader')
+            self.assertEqual(pool.submit(params[1]).get(), outputs[1], 'submit output does not match map')
+            output = pool.multi_process(params[3].copy(), chunk_size=500)
+            self.assertEqual(output, outputs[3], 'pool multi_process output does not match map')
+        # the setup is read once and then reused
+        self.assertEqual(len(rp.setup_cache), 1, 'setup not cached')
+        self.assertTrue(rp.load_setup(self.tmp) is rp.load_setup(self.tmp + '/'), 'setup not reused')
+
+    def test_parquet(self):
+        
+        # parquet and arrow files must read back as the same data as the reader returns
+        try:
+            import pyarrow.dataset as ds
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        write_test_file(self.data_file)
+        db = dictionary_of(['obs', 'sin', 'letters', 'state', 'date1'],
+                           sin={'action': 'fix', 'illegal_replacement_value': None})
+        for engine in ('row', 'vectorized'):
+            rq = self.reader(db, 'parquet_reader_' + engine, engine=engine)
+            full = rq.reader(self.params())
+            for output_type in ('parquet', 'arrow'):
+                out_dir = self.tmp + '/' + engine + output_type
+                os.mkdir(out_dir)
+                params = self.params(output_type=output_type, output_file=out_dir + '/out.' + output_type,
+                                     partition='state', split_file=20, row_group_rows=16)
+                self.assertIsNone(rq.reader(params), 'file output returned data')
+                table = ds.dataset(out_dir, format=output_type, partitioning='hive').to_table().to_pandas()
+                table = table.sort_values('obs').reset_index(drop=True)
+                self.assertEqual(str(table['date1'].dtype), 'object', 'dates not written as dates')
+                cols = ['obs', 'sin', 'letters', 'date1']
+                self.assertTrue(table[cols].equals(full[cols]), output_type + ' output does not match reader')
+                self.assertTrue((table['state'].astype(str) == full['state']).all(), 'partitions are not right')
+
+    def test_legal_values(self):
+        
+        # each kind of legal-value lookup must drop the same rows in both engines
+        write_test_file(self.data_file)
+        base = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+        letters = [base[i: i + 5] for i in range(0, 48, 2)]
+        dates = [datetime.date(2000, 1, 1) + datetime.timedelta(7 * i) for i in range(0, 500, 2)]
+        db = dictionary_of(['obs', 'sin', 'letters', 'state', 'date1'],
+                           obs={'legal_values': list(range(0, 600, 3)), 'action': 'drop'},
+                           sin={'action': 'fix', 'illegal_replacement_value': None},
+                           letters={'legal_values': letters, 'action': 'drop'},
+                           state={'action': 'drop'},
+                           date1={'legal_values': dates, 'action': 'drop'})
+        outputs = []
+        for engine in ('row', 'vectorized'):
+            rl = self.reader(db, 'legal_reader_' + engine, engine=engine)
+            outputs += [rl.reader(self.params())]
+        self.assertTrue(os.path.isfile(self.tmp + '/data/data0.npy'), 'legal values not saved as .npy')
+        self.assertTrue(outputs[0].equals(outputs[1]), 'engines do not agree')
+        self.assertTrue((outputs[0]['obs'] % 6 == 0).all(), 'wrong rows kept')
+        self.assertTrue(outputs[0]['letters'].isin(letters).all(), 'wrong rows kept')
+        self.assertGreater(outputs[0].shape[0], 0, 'no rows kept')
+        self.assertEqual(rl.in_sorted(np.array(['abcdefg', 'bcdef', 'a', 'zz']), np.array(['abcde', 'bcdef'])).tolist(),
+                         [False, True, False, False], 'wrong lookup of strings')
+        
+        # zips are checked against the whole list of zips: a bitmap in the vectorized engine
+        zips = np.loadtxt(pkg_resources.resource_filename('data_reader', 'data/zips.dat'), dtype=str)
+        with open(self.tmp + '/zips.csv', 'w') as f:
+            for i in range(2000):
+                f.write(str(i) + ',' + [zips[(i * 37) % zips.shape[0]], str(i * 50 % 100000).zfill(5), str(i % 1000),
+                                        '123456789'][i % 4] + '\n')
+        dz = dictionary_of(['obs'])
+        dz.add_field('zip', 'zip', action='drop')
+        outputs = []
+        for engine in ('row', 'vectorized'):
+            rz = self.reader(dz, 'zip_reader_' + engine, engine=engine)
+            outputs += [rz.reader(self.params(data_file=self.tmp + '/zips.csv'))]
+        self.assertTrue(outputs[0].equals(outputs[1]), 'engines do not agree on zips')
+        self.assertTrue(outputs[0]['zip'].isin(zips).all(), 'wrong zips kept')
+        self.assertGreater(outputs[0].shape[0], 500, 'too few zips kept')
+        bitmap = np.zeros(100000, dtype=bool)
+        bitmap[[501, 99999]] = True
+        self.assertEqual(rz.in_zips(np.array(['00501', '123456789', '99999', '1234', '00502']),
+                                    (bitmap, np.array(['123456789']))).tolist(),
+                         [True, True, True, False, False], 'wrong lookup of zips')
+
+    def test_dates(self):
+        
+        # every date format must convert the same way in both engines, with and without remove_char
+        layouts = {'CCYYMMDD': '%Y%m%d', 'CCYYMM': '%Y%m', 'YYMM': '%y%m', 'MM/DD/YY': '%m/%d/%y',
+                   'MMDDCCYY': '%m%d%Y', 'MM/CCYY': '%m/%Y', 'CCYY/MM/DD': '%Y/%m/%d', 'MM/DD/CCYY': '%m/%d/%Y'}
+        with open(self.tmp + '/dates.csv', 'w') as f:
+            for i in range(300):
+                dt = datetime.date(1995, 1, 1) + datetime.timedelta(31 * (i % 40))
+                row = [dt.strftime(layout) for layout in layouts.values()]
+                if i % 17 == 0:
+                    row = ['x' + x[1:] for x in row]
+                if i % 5 == 0:
+                    row = [x.replace('0', '#0', 1) for x in row]
+                f.write(','.join(row) + '\n')
+        dd = d.BuildDataDictionary()
+        for (ind, date_format) in enumerate(layouts):
+            dd.add_field('date' + str(ind), 'date', field_format=date_format + ['', 'E', 'B'][ind % 3],
+                         action='fix', illegal_replacement_value=None)
+        outputs = []
+        for engine in ('row', 'vectorized'):
+            rd = self.reader(dd, 'date_reader_' + engine, engine=engine, remove_char='#')
+            outputs += [rd.reader(self.params(data_file=self.tmp + '/dates.csv', date_cache_size=16))]
+        self.assertTrue(outputs[0].equals(outputs[1]), 'engines do not agree')
+        self.assertEqual(outputs[0]['date0'][1], datetime.date(1995, 2, 1), 'CCYYMMDD not converted')
+        self.assertEqual(outputs[0]['date1'][1], datetime.date(1995, 2, 28), 'CCYYMME not converted')
+        self.assertTrue(outputs[0]['date0'][17] is None, 'bad date not fixed')
+
+    def test_reader_cache(self):
+        
+        # a second create_reader with the same dictionary returns the cached module without writing anything
+        write_test_file(self.data_file)
+        cache_dir = self.tmp + '/cache'
+        dc = dictionary_of(['obs', 'sin', 'letters'], obs={'legal_values': list(range(0, 600, 2)), 'action': 'drop'})
+        rc = d.create_reader(dc.dictionary, cache_dir=cache_dir, engine='vectorized')
+        self.assertEqual(len(os.listdir(cache_dir)), 1, 'reader not cached')
+        self.assertTrue(rc is d.create_reader(dc.dictionary, cache_dir=cache_dir, engine='vectorized'),
+                        'cached reader not returned')
+        self.assertEqual(rc.reader(self.data_file).shape, (250, 3), 'cached reader does not read')
+        dc.add_field('state', 'state')
+        rs = d.create_reader(dc.dictionary, cache_dir=cache_dir, engine='vectorized')
+        self.assertFalse(rs is rc, 'changed dictionary gave the same reader')
+        self.assertEqual(len(os.listdir(cache_dir)), 2, 'changed dictionary not cached')
+
+    def test_flat_vectorized(self):
+        
+        # the vectorized engine must read a FLAT file as the row engine does
+        with open(self.tmp + '/test.dat', 'w') as f:
+            for i in range(1, 1001):
+                dt = datetime.date(2000, 1, 1) + datetime.timedelta(7 * i)
+                amount = str(round(np.sin(i), 3)) if i % 97 else 'x'
+                f.write(str(i).rjust(6) + amount.rjust(8) + 'abcdefghij'[i % 7:i % 7 + 3].ljust(4) +
+                        dt.strftime('%Y%m%d') + '\n')
+        df = d.BuildDataDictionary()
+        df.add_field('obs', 'int', field_start=1, field_width=6, maximum_value=990, action='drop')
+        df.add_field('amount', 'float', field_start=7, field_width=8, action='fix', illegal_replacement_value=0.0)
+        df.add_field('letters', 'str', field_start=15, field_width=4)
+        df.add_field('date1', 'date', field_format='CCYYMMDD', field_start=19, field_width=8)
+        rr = self.reader(df, 'flat_row', file_format='flat', lrecl=27)
+        rv = self.reader(df, 'flat_vec', file_format='flat', lrecl=27, engine='vectorized')
+        params = self.params(data_file=self.tmp + '/test.dat', block_rows=64)
+        for extra in ({}, {'first_row': 20, 'last_row': 300}, {'start_byte': 1000, 'end_byte': 9000}):
+            px = params.copy()
+            px.update(extra)
+            self.assertTrue(rr.reader(px.copy()).equals(rv.reader(px.copy())), 'vectorized engine does not match')
+        self.assertEqual(rv.reader(params.copy()).shape, (990, 4), 'wrong number of rows')
+
+    def test_columns(self):
+        
+        # only the columns asked for are read; their checks still apply but the checks of the others do not
+        write_test_file(self.data_file, headers=True)
+        dp = dictionary_of(['obs', 'sin', 'letters', 'state', 'date1'],
+                           letters={'legal_values': ['bcdef', 'cdefg', 'defgh'], 'action': 'drop'})
+        params = self.params(headers=True)
+        for engine in ('row', 'vectorized'):
+            rp = self.reader(dp, 'columns_' + engine, engine=engine)
+            full = rp.reader(params.copy())
+            px = params.copy()
+            px['columns'] = ['date1', 'obs']
+            part = rp.reader(px.copy())
+            self.assertEqual(list(part.columns), ['obs', 'date1'], 'wrong columns')
+            self.assertEqual(part.shape[0], 500, 'rows dropped by a field not read')
+            px['columns'] = ['obs', 'letters', 'date1']
+            self.assertTrue(rp.reader(px.copy()).equals(full[['obs', 'letters', 'date1']]), 'columns do not match')
+            px['user_function'] = lambda row: row['state'] != 'CA'
+            self.assertEqual(list(rp.reader(px.copy()).columns), ['obs', 'letters', 'date1'], 'hook columns not dropped')
+            px['columns'] = ['nothing']
+            self.assertRaises(ValueError, rp.reader, px)
+
+    def test_filters(self):
+        
+        # filters keep the same rows as filtering the full output, including filters on fields not read
+        write_test_file(self.data_file, headers=True)
+        dp = dictionary_of(['obs', 'sin', 'state', 'date1'])
+        params = self.params(headers=True)
+        filters = [('state', 'in', ['CA', 'TX']), ('date1', '>=', datetime.date(2003, 1, 1)), ('obs', '<', 400)]
+        for engine in ('row', 'vectorized'):
+            rp = self.reader(dp, 'filters_' + engine, engine=engine)
+            full = rp.reader(params.copy())
+            keep = full.state.isin(['CA', 'TX']) & (full.obs < 400) & \
+                full.date1.apply(lambda x: x is not None and x >= datetime.date(2003, 1, 1))
+            px = params.copy()
+            px['filters'] = filters
+            part = rp.reader(px.copy())
+            self.assertTrue(part.shape[0] > 0, 'no rows kept')
+            self.assertTrue(part.equals(full[keep].reset_index(drop=True)), 'filtered rows do not match')
+            px['columns'] = ['obs']
+            self.assertEqual(list(rp.reader(px.copy()).obs), list(part.obs), 'filter on a field not read')
+            px['filters'] = [('state', 'like', 'C%')]
+            self.assertRaises(ValueError, rp.reader, px)
+
+    def test_compressed(self):
+        
+        # a compressed file reads the same as the plain file, whole, in byte shards and in multi_process
+        import gzip
+        import bz2
+        write_test_file(self.data_file, headers=True)
+        text = open(self.data_file, 'rb').read()
+        step = len(text) // 5 + 1
+        open(self.data_file + '.gz', 'wb').write(b''.join([gzip.compress(text[place:place + step])
+                                                           for place in range(0, len(text), step)]))
+        open(self.data_file + '.bz2', 'wb').write(bz2.compress(text))
+        index = np.load(d.build_block_index(self.data_file + '.gz'))
+        self.assertEqual(index.shape[0], 6, 'wrong number of blocks')
+        self.assertEqual(int(index[-1, 1]), len(text), 'wrong decompressed size')
+        dp = dictionary_of(['obs', 'letters', 'state', 'date1'])
+        params = self.params(headers=True, output_type='pandas')
+        for engine in ('row', 'vectorized'):
+            rp = self.reader(dp, 'compressed_' + engine, engine=engine)
+            plain = rp.reader(params.copy())
+            for data_file in (self.data_file + '.gz', self.data_file + '.bz2'):
+                self.assertTrue(rp.reader(dict(params, data_file=data_file)).equals(plain), 'compressed file differs')
+                px = dict(params, data_file=data_file, start_byte=len(text) // 2 + 3, end_byte=len(text) - 100)
+                self.assertTrue(rp.reader(px).equals(rp.reader(dict(px, data_file=self.data_file))), 'shard differs')
+                mp = d.multi_process(rp.reader, dict(params, data_file=data_file), 2)
+                self.assertTrue(mp.reset_index(drop=True).equals(plain), 'multi_process differs')
+                px = dict(params, data_file=data_file, block_rows=7, first_row=10, last_row=300)
+                self.assertTrue(rp.reader(px).equals(rp.reader(dict(px, data_file=self.data_file))), 'rows differ')
+            # a last line with no newline is read, whole or as the end of a shard
+            open(self.data_file + '.nonl.gz', 'wb').write(gzip.compress(text.rstrip(b'\n')))
+            px = dict(params, data_file=self.data_file + '.nonl.gz', start_byte=len(text) - 200)
+            self.assertTrue(rp.reader(px).equals(rp.reader(dict(px, data_file=self.data_file))), 'last line differs')
+            self.assertTrue(rp.reader(dict(px, start_byte=0)).equals(plain), 'file with no last newline differs')
+        # the stream holds only the pieces being read
+        m = rp.StreamMap(iter([b'x' * 99 + b'\n'] * 10000), look=500000)
+        for place in range(0, 10 ** 6, 1000):
+            self.assertEqual(len(m[place:place + 1000]), 0 if place > 500000 else min(1000, 500100 - place),
+                             'wrong piece read')
+            self.assertTrue(len(m.data) < 5000, 'stream holds what was read')
+
+    def test_delim_writer(self):
+        
+        # delim output is the same from both engines, with and without the writing thread, and split_file is exact
+        write_test_file(self.data_file, headers=True)
+        dp = dictionary_of(['obs', 'letters', 'state', 'date1'])
+        params = self.params(headers=True)
+        outputs = []
+        for engine in ('row', 'vectorized'):
+            rp = self.reader(dp, 'delim_' + engine, engine=engine)
+            full = rp.reader(params.copy())
+            for write_thread in (False, True):
+                out = tempfile.mkdtemp(dir=self.tmp)
+                rp.reader(dict(params, output_type='delim', output_file=out + '/out.csv', split_file=120,
+                               write_thread=write_thread, write_buffer=1000))
+                parts = [pd.read_csv(out + '/out' + str(ind) + '.csv') for ind in range(5)]
+                self.assertEqual([part.shape[0] for part in parts], [120, 120, 120, 120, 20], 'wrong split')
+                back = pd.concat(parts).reset_index(drop=True)
+                self.assertEqual(list(back.obs), list(full.obs), 'rows differ')
+                self.assertEqual(list(back.date1), [str(x) for x in full.date1], 'dates differ')
+                rp.reader(dict(params, output_type='delim', output_file=out + '/part.csv', partition='state',
+                               write_thread=write_thread))
+                outputs += [sorted([(state, open(out + '/state=' + state + '/part.csv').read())
+                                    for state in set(full.state)])]
+        for output in outputs[1:]:
+            self.assertEqual(output, outputs[0], 'partition files differ')
+
+    def test_compressed_output(self):
+        
+        # compressed delim output reads back as written, a block per write_buffer, and can be read as input
+        write_test_file(self.data_file, headers=True)
+        rp = self.reader(dictionary_of(['obs', 'letters', 'state', 'date1']), 'compressed_out', engine='vectorized')
+        params = self.params(headers=True)
+        full = rp.reader(params.copy())
+        for (compression, extension) in (('gzip', '.gz'), ('bz2', '.bz2'), ('xz', '.xz')):
+            for threads in (0, 2):
+                out = tempfile.mkdtemp(dir=self.tmp)
+                rp.reader(dict(params, output_type='delim', output_file=out + '/out.csv', compression=compression,
+                               compression_threads=threads, write_buffer=1000))
+                back = pd.read_csv(out + '/out.csv' + extension)
+                self.assertEqual(list(back.obs), list(full.obs), 'rows differ')
+                blocks = np.load(d.build_block_index(out + '/out.csv' + extension))
+                self.assertTrue(blocks.shape[0] > 2, 'one block for all of the output')
+                again = rp.reader(dict(params, data_file=out + '/out.csv' + extension, start_byte=0,
+                                       end_byte=int(blocks[-1, 1]) // 2))
+                self.assertEqual(list(again.obs), list(full.obs[0:again.shape[0]]), 'rows read back differ')
+
+    def test_partition_writer(self):
+        
+        # with few open files the partition files are the same, and the manifest counts the rows of each
+        write_test_file(self.data_file, headers=True)
+        dp = dictionary_of(['obs', 'letters', 'state'])
+        params = self.params(headers=True, output_type='delim', partition='letters')
+        outputs = []
+        for engine in ('row', 'vectorized'):
+            rp = self.reader(dp, 'partition_' + engine, engine=engine)
+            for (max_open_files, write_buffer) in ((1000, 1 << 22), (3, 200)):
+                out = tempfile.mkdtemp(dir=self.tmp)
+                rp.reader(dict(params, output_file=out + '/part.csv', max_open_files=max_open_files,
+                               write_buffer=write_buffer))
+                manifest = pd.read_csv(out + '/part.manifest.csv')
+                self.assertEqual(list(manifest.columns), ['letters', 'file', 'rows'], 'wrong manifest')
+                self.assertEqual(manifest.shape[0], 48, 'wrong number of files')
+                self.assertEqual(manifest.rows.sum(), 500, 'wrong number of rows')
+                for (letters, opf, rows) in manifest.itertuples(index=False):
+                    self.assertEqual(opf, out + '/letters=' + letters + '/part.csv', 'wrong file')
+                    self.assertEqual(len(open(opf).read().splitlines()), rows, 'wrong rows')
+                outputs += [sorted([(opf[len(out):], open(opf).read()) for opf in manifest.file])]
+        for output in outputs[1:]:
+            self.assertEqual(output, outputs[0], 'partition files differ')
+
+    def test_feature_encoder(self):
+        
+        # the encoders write each kind of feature in the protobuf format of tf.train.Example
+        rp = self.reader(dictionary_of(['obs']), 'encoder')
+        self.assertEqual(rp.feature_encoder('a', 'INT')(1), b'\n\n\n\x01a\x12\x05\x1a\x03\n\x01\x01', 'wrong int')
+        self.assertEqual(rp.feature_encoder('a', 'INT')(None), b'', 'missing int not left out')
+        self.assertEqual(rp.feature_encoder('a', 'FLOAT')(1.5), b'\n\r\n\x01a\x12\x08\x12\x06\n\x04\x00\x00\xc0?',
+                         'wrong float')
+        self.assertEqual(rp.feature_encoder('a', 'DATE')(datetime.date(2020, 1, 2)),
+                         b'\n\r\n\x01a\x12\x08\x1a\x06\n\x04\xe4\x0f\x01\x02', 'wrong date')
+        self.assertEqual(rp.feature_encoder('a', 'STR')('xy'), b'\n\r\n\x01a\x12\x08\n\x06\n\x01x\n\x01y', 'wrong str')
+        self.assertEqual(rp.feature_encoder('a', None)('xy'), rp.feature_encoder('a', 'STR')('xy'), 'wrong guess')
+        self.assertEqual(rp.varint(-1), b'\xff' * 9 + b'\x01', 'wrong negative varint')
+
+    def test_tfrecords(self):
+        
+        # tfrecords output returns nothing, and TensorFlow reads back the rows the reader returns
+        try:
+            import tensorflow as tf
+        except ImportError:
+            self.skipTest('tensorflow is not installed')
+        write_test_file(self.data_file, headers=True)
+        dp = dictionary_of(['obs', 'sin', 'letters', 'date1'], sin={'action': 'fix', 'illegal_replacement_value': None})
+        params = self.params(headers=True)
+        for engine in ('row', 'vectorized'):
+            rp = self.reader(dp, 'tfrecords_' + engine, engine=engine)
+            full = rp.reader(params.copy())
+            output_file = self.tmp + '/out_' + engine + '.tfrecords'
+            self.assertIsNone(rp.reader(dict(params, output_type='tfrecords', output_file=output_file)),
+                              'tfrecords output returned data')
+            records = [record.numpy() for record in tf.data.TFRecordDataset(output_file)]
+            self.assertEqual(len(records), 500, 'wrong number of records')
+            for (record, row) in zip(records, full.itertuples(index=False)):
+                feature = tf.train.Example.FromString(record).features.feature
+                self.assertEqual(list(feature['obs'].int64_list.value), [row.obs])
+                if row.sin is None or np.isnan(row.sin):
+                    self.assertNotIn('sin', feature, 'missing float not left out')
+                else:
+                    self.assertAlmostEqual(feature['sin'].float_list.value[0], row.sin, places=6)
+                self.assertEqual(b''.join(feature['letters'].bytes_list.value).decode(), row.letters)
+                self.assertEqual(list(feature['date1'].int64_list.value),
+                                 [row.date1.year, row.date1.month, row.date1.day])
+            parsed = tf.io.parse_example(records, {'obs': tf.io.FixedLenFeature([], tf.int64),
+                                                   'sin': tf.io.VarLenFeature(tf.float32),
+                                                   'date1': tf.io.FixedLenFeature([3], tf.int64)})
+            self.assertEqual(parsed['obs'].numpy().tolist(), full.obs.tolist(), 'parsed obs differ')
+            self.assertEqual(parsed['sin'].dense_shape.numpy().tolist(), [500, 1], 'wrong float shape')
+            self.assertEqual(parsed['date1'].numpy()[0].tolist(), [full.date1[0].year, full.date1[0].month,
+                                                                   full.date1[0].day], 'parsed dates differ')
+
+    def test_make_input_fn(self):
+        
+        # the input function batches, then parses, and the module compiles
+        dp = dictionary_of(['obs', 'letters', 'date1'])
+        dp.add_field('y', 'float')
+        d.make_input_fn(dp.dictionary, self.tmp + '/inp.py', dep_var='y')
+        import py_compile
+        py_compile.compile(self.tmp + '/inp.py', doraise=True)
+        text = open(self.tmp + '/inp.py').read()
+        self.assertTrue(text.find('ds.shuffle(') > 0, 'no shuffle')
+        self.assertTrue(text.find('ds.batch(') < text.find('ds.map(parse_batch'), 'parsed before batching')
+        self.assertTrue(text.find('tf.io.parse_example') > 0, 'not parsed a batch at a time')
+
+    def test_input_fn(self):
+        
+        # input_fn reads tfrecords written by the reader as a Dataset of parsed batches, missing values included
+        try:
+            import tensorflow as tf
+        except ImportError:
+            self.skipTest('tensorflow is not installed')
+        write_test_file(self.data_file, headers=True)
+        dp = dictionary_of(['obs', 'sin', 'letters', 'date1'], sin={'action': 'fix', 'illegal_replacement_value': None},
+                           date1={'maximum_value': 'date(2005,1,1)', 'maximum_replacement_value': None})
+        rp = self.reader(dp, 'input_fn_reader', engine='vectorized')
+        full = rp.reader(self.params(headers=True))
+        rp.reader(self.params(headers=True, output_type='tfrecords', output_file=self.tmp + '/test.tfrecords'))
+        d.make_input_fn(dp.dictionary, self.tmp + '/inp.py', dep_var='sin')
+        spec = importlib.util.spec_from_file_location('inp', self.tmp + '/inp.py')
+        inp = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(inp)
+        ds = inp.input_fn(self.tmp + '/test.tfrecords', batch_size=64)
+        self.assertTrue(isinstance(ds, tf.data.Dataset), 'input_fn does not return a Dataset')
+        batches = list(ds)
+        self.assertEqual([features['obs'].shape[0] for (features, dep_var) in batches], [64] * 7 + [52])
+        (features, dep_var) = batches[-1]
+        self.assertEqual(sorted(features.keys()), ['date1', 'letters', 'obs'], 'wrong features')
+        self.assertEqual((features['obs'].shape, features['obs'].dtype), ((52, 1), tf.int64))
+        self.assertEqual((features['letters'].shape, features['letters'].dtype), ((52,), tf.string))
+        self.assertEqual((features['date1'].shape, features['date1'].dtype), ((52, 1, 1), tf.string))
+        self.assertEqual((dep_var.shape, dep_var.dtype), ((52, 1), tf.float32))
+        obs = np.concatenate([features['obs'].numpy()[:, 0] for (features, dep_var) in batches])
+        self.assertEqual(obs.tolist(), full.obs.tolist(), 'wrong records')
+        dates = np.concatenate([features['date1'].numpy()[:, 0, 0] for (features, dep_var) in batches])
+        expected = [b'0' if x is None else x.strftime('%Y%m%d').encode() for x in full.date1]
+        self.assertTrue(expected.count(b'0') > 0, 'no missing dates')
+        self.assertEqual(dates.tolist(), expected, 'wrong dates')
+        sin = np.concatenate([dep_var.numpy()[:, 0] for (features, dep_var) in batches])
+        self.assertEqual(np.isnan(sin).tolist(), full.sin.isnull().tolist(), 'missing floats are not nan')
+        letters = np.concatenate([features['letters'].numpy() for (features, dep_var) in batches])
+        self.assertEqual([x.decode() for x in letters], full.letters.tolist(), 'wrong strings')
+
+    def test_sampling(self):
+        
+        # a seed gives the same sample each time, streams give different samples, and sample_size is exact
+        write_test_file(self.data_file, headers=True)
+        dp = dictionary_of(['obs', 'letters', 'state'])
+        params = self.params(headers=True, seed=7)
+        for engine in ('row', 'vectorized'):
+            rp = self.reader(dp, 'sample_' + engine, engine=engine)
+            first = rp.reader(dict(params, sample_rate=0.2))
+            again = rp.reader(dict(params, sample_rate=0.2))
+            other = rp.reader(dict(params, sample_rate=0.2, sample_stream=1))
+            self.assertEqual(list(first.obs), list(again.obs), 'same seed, different sample')
+            self.assertNotEqual(list(first.obs), list(other.obs), 'same sample from different streams')
+            self.assertTrue(50 < first.shape[0] < 150, 'wrong sample rate')
+            self.assertEqual(list(first.obs), sorted(first.obs), 'sample out of order')
+            sample = rp.reader(dict(params, sample_size=30))
+            self.assertEqual(sample.shape[0], 30, 'wrong sample size')
+            self.assertEqual(list(sample.obs), sorted(set(sample.obs)), 'sample out of order')
+            self.assertEqual(list(sample.obs), list(rp.reader(dict(params, sample_size=30)).obs),
+                             'same seed, different sample')
+            self.assertEqual(rp.reader(dict(params, sample_size=1000)).shape[0], 500, 'rows lost')
+
+    def test_reader_stats(self):
+        
+        # stats count the rows and violations the same way in both engines, and multi_process adds them up
+        write_test_file(self.data_file)
+        dp = dictionary_of(['obs', 'sin', 'letters'], obs={'maximum_value': 400, 'action': 'drop'},
+                           sin={'action': 'fix', 'illegal_replacement_value': 0.0})
+        params = self.params(output_type='pandas', stats=True, filters=[('obs', '>', 10)],
+                             user_function=lambda row: row['obs'] % 2 == 0)
+        rows = {'read': 500, 'filtered': 10, 'dropped': 100, 'fixed': 5, 'rejected': 195, 'kept': 195}
+        for engine in ('row', 'vectorized'):
+            rp = self.reader(dp, 'stats_' + engine, engine=engine)
+            (df, stats) = rp.reader(params.copy())
+            self.assertEqual(df.shape[0], 195, 'wrong number of rows')
+            self.assertEqual(dict(stats.rows), rows, 'wrong row counts')
+            self.assertEqual(dict(stats.violations), {('obs', 'maximum'): 100, ('sin', 'conversion'): 5},
+                             'wrong violations')
+            self.assertTrue(stats.times['total'] >= sum([stats.times[stage] for stage in stats.stages]), 'bad times')
+            self.assertEqual(len(rp.reader(dict(params, stats=False))), 195, 'stats returned')
+            (df, stats) = d.multi_process(rp.reader, dict(params, user_function=None), 2)
+            self.assertEqual(stats.runs, 2, 'stats of a task lost')
+            self.assertEqual(stats.rows['kept'], df.shape[0], 'wrong row counts')
+            total = rp.ReaderStats()
+            d.multi_process(rp.reader, dict(params, user_function=None, stats=total), 2, shared_memory=True)
+            self.assertEqual(total.rows['dropped'], 100, 'wrong row counts')
+
+    def test_benchmark(self):
+        
+        # the synthetic files of each kind read back in full, and a case is measured and saved
+        import data_reader.benchmark as b
+        tmp = self.tmp
+        for kind in b.kinds:
+            for file_format in ('delim', 'flat'):
+                if (kind == 'quoted') and (file_format == 'flat'):
+                    continue
+                (rows, size) = b.write_data_file(kind, file_format, tmp + '/' + kind + file_format, 20000,
+                                                 block_rows=500, distinct_blocks=2)
+                self.assertTrue((size >= 20000) and (size == os.stat(tmp + '/' + kind + file_format).st_size))
+                (dp, lrecl, string_delim) = b.make_dictionary(kind, file_format)
+                name = 'bench_' + kind + file_format
+                os.makedirs(tmp + '/' + name + '/data')
+                d.create_reader(dp.dictionary, reader_path=tmp + '/' + name, file_format=file_format, lrecl=lrecl,
+                                string_delim=string_delim, module_name=name, engine='vectorized')
+                rp = b.load_reader(tmp + '/' + name + '/' + name + '.py')
+                df = rp.reader({'data_file': tmp + '/' + kind + file_format, 'module_path': tmp + '/' + name,
+                                'output_type': 'pandas'})
+                if kind == 'legal':
+                    self.assertTrue(0 < df.shape[0] < rows, 'illegal values kept')
+                    self.assertEqual(int((df['level'] == -1).sum()) > 0, True, 'illegal values not fixed')
+                else:
+                    self.assertEqual(df.shape[0], rows, 'wrong number of rows')
+        cases = b.benchmark_cases(kinds=('narrow',), file_formats=('delim',), engines=('vectorized',),
+                                  output_types=('arrays',), num_processes=(1,), sample_rates=(1.0,))
+        self.assertEqual(len(cases), 1)
+        for label in ('old', 'new'):
+            results = b.run_benchmarks(tmp + '/work', 20000, cases, tmp + '/results.csv', label, verbose=False)
+            self.assertEqual(results[0]['error'], None, 'benchmark failed')
+            self.assertEqual(results[0]['rows_out'], results[0]['file_rows'], 'wrong number of rows')
+        self.assertEqual(len(b.read_results(tmp + '/results.csv')), 2)
+        self.assertEqual(len(b.compare_results(tmp + '/results.csv', 'old', 'new')), 1)
+        self.assertEqual(b.parse_size('2GB'), 2 << 30)
+
+    def test_reject_file(self):
+        
+        # the rows that fail a check go to the reject file as they are in the file, and FATAL stops after max_errors
+        write_test_file(self.data_file, headers=True)
+        with open(self.data_file, 'rb') as f:
+            data = f.read()
+        dp = dictionary_of(['obs', 'sin', 'letters'], obs={'maximum_value': 400, 'action': 'drop'},
+                           sin={'action': 'fatal'})
+        reject_file = self.tmp + '/rejects.txt'
+        params = self.params(headers=True, max_errors=5, reject_file=reject_file)
+        for engine in ('row', 'vectorized'):
+            rp = self.reader(dp, 'rejects_' + engine, engine=engine)
+            self.assertRaises(ValueError, rp.reader, dict(params, max_errors=4))
+            df = rp.reader(dict(params, block_rows=64))
+            self.assertEqual(df.shape[0], 396, 'wrong number of rows')
+            rejects = rp.read_rejects(reject_file)
+            self.assertEqual(len(rejects), 104, 'wrong number of rejects')
+            for (offset, row, failures, record) in rejects:
+                self.assertEqual(data[offset:offset + len(record)], record, 'record not as in the file')
+                self.assertEqual(int(record.split(b',')[0]), row, 'wrong row')
+            self.assertEqual(rejects[-16][2], [('obs', 'maximum', 'drop'), ('sin', 'conversion', 'fatal')])
+            self.assertEqual(rp.write_rejects(reject_file, self.tmp + '/again.csv', data.split(b'\n')[0]), 104)
+            df = rp.reader(dict(params, data_file=self.tmp + '/again.csv', reject_file=None, stats=True))
+            self.assertEqual((df[0].shape[0], df[1].rows['read']), (0, 104), 'wrong number of rows read again')
+
+    def test_fatal_order(self):
+        
+        # both engines stop on the same FATAL row with the same message, whatever the block size
+        write_test_file(self.data_file, headers=True)
+        dp = dictionary_of(['obs', 'sin', 'letters', 'date1'],
+                           obs={'maximum_value': 450, 'legal_values': list(range(0, 600, 5)), 'action': 'fatal'},
+                           sin={'minimum_value': -0.95, 'action': 'fatal'},
+                           date1={'minimum_value': 'date(2000,6,1)', 'action': 'fatal'})
+        reject_file = self.tmp + '/rejects.txt'
+        rr = self.reader(dp, 'fatal_order_row')
+        rv = self.reader(dp, 'fatal_order_vectorized', engine='vectorized')
+        for max_errors in (0, 1, 5, 60, 1000):
+            for block_rows in (7, 1000):
+                results = []
+                for rp in (rr, rv):
+                    params = self.params(headers=True, max_errors=max_errors, block_rows=block_rows,
+                                         reject_file=reject_file)
+                    try:
+                        result = rp.reader(params).shape
+                    except ValueError as e:
+                        result = str(e)
+                    with open(reject_file, 'rb') as f:
+                        results += [(result, f.read())]
+                self.assertEqual(results[0], results[1], 'engines differ at max_errors ' + str(max_errors))
+                if max_errors == 5:
+                    self.assertEqual(results[1][0], 'value of date1 below minimum of date(2000,6,1)')
+        self.assertEqual(results[1][0], (77, 4), 'wrong rows kept')
+
+    def test_from_sample(self):
+        
+        # the types, date formats, legal values and FLAT layout are found from the file, and the reader reads it
+        write_test_file(self.data_file, headers=True)
+        dp = d.BuildDataDictionary.from_sample(self.data_file, headers=True)
+        fields = [(f['field_name'], f['field_type'], f['field_format']) for f in dp.dictionary.values()]
+        self.assertEqual(fields, [('obs', 'INT', None), ('sin', 'STR', None), ('letters', 'STR', None),
+                                  ('state', 'STATE', None), ('date1', 'DATE', 'CCYYMMDD'),
+                                  ('date2', 'DATE', 'MM/DD/CCYY')])
+        rp = self.reader(dp, 'from_sample_delim')
+        self.assertEqual(rp.reader(self.params(headers=True)).shape, (500, 6))
+        with open(self.tmp + '/test.dat', 'w') as f:
+            for i in range(1, 301):
+                f.write(('abcdef'[0:1 + i % 6]).ljust(9) + str(round(i * 1.25, 2)).rjust(8) + ' ' + 'ABC'[i % 3] +
+                        str(i % 7).rjust(3) + ' ' + str(i).zfill(5) + '\n')
+        dp = d.BuildDataDictionary.from_sample(self.tmp + '/test.dat', 'flat', bounds=True,
+                                               field_names=['name', 'amount', 'code', 'level', 'id'])
+        fields = [(f['field_type'], f['field_start'], f['field_width']) for f in dp.dictionary.values()]
+        # the blanks between fields go to a number that follows and otherwise to the field before
+        self.assertEqual(fields, [('STR', 1, 6), ('FLOAT', 7, 12), ('STR', 19, 1), ('INT', 20, 4), ('STR', 24, 5)])
+        self.assertEqual(dp.lrecl, 29)
+        self.assertEqual(dp.dictionary[2]['legal_values'].tolist(), ['A', 'B', 'C'])
+        self.assertEqual((dp.dictionary[1]['minimum_value'], dp.dictionary[1]['maximum_value']), (1.25, 375.0))
+        rp = self.reader(dp, 'from_sample_flat', file_format='FLAT', lrecl=dp.lrecl)
+        df = rp.reader(self.params(data_file=self.tmp + '/test.dat'))
+        self.assertEqual(df['level'].sum(), sum([i % 7 for i in range(1, 301)]))
+        self.assertEqual(df['id'].iloc[0], '00001')
+
+    def test_mixed_field_start(self):
+        
+        # either every field has field_start/field_width or none does
+        dp = d.BuildDataDictionary()
+        dp.add_field('name', 'str', field_start=1, field_width=6)
+        self.assertRaises(ValueError, dp.add_field, 'amount', 'float')
+        dp = d.BuildDataDictionary()
+        dp.add_field('name', 'str')
+        self.assertRaises(ValueError, dp.add_field, 'amount', 'float', field_start=7, field_width=12)
+
+    def test_cbsa_enrich(self):
+        
+        # enrich agrees with the user methods, and both with zipCBSA.dat, over a block of zips
+        data_path = pkg_resources.resource_filename('data_reader', 'data/')
+        (zips, cbsas) = d.read_cbsa_data(data_path + 'zipCBSA.dat')
+        (shipped, shipped_cbsas) = d.load_cbsa_data()
+        self.assertTrue((shipped == zips).all() and (shipped_cbsas == cbsas).all(), 'numpy files out of date')
+        rows = np.arange(0, zips.shape[0], 97)
+        block = {'zip': np.array(zips['zip'][rows].tolist() + ['00000', None, '123456'], dtype=object),
+                 'state': np.array(zips['state'][rows].tolist() + ['NY', 'NY', 'NY'], dtype=object)}
+        block['state'][1] = 'XX'
+        pc = d.PopulateCBSAData(check_state=True)
+        out = pc.enrich(dict(block), names=True)
+        for i in range(block['zip'].shape[0]):
+            fx = {'zip': block['zip'][i], 'state': block['state'][i]}
+            pc.cbsa_code_and_name(fx)
+            self.assertEqual((fx['cbsa_code'], fx['cbsa_name'], fx['zip_ok']),
+                             (out['cbsa_code'][i], out['cbsa_name'][i], out['zip_ok'][i]))
+        self.assertEqual(out['cbsa_code'][0:-3].tolist(), cbsas['cbsa_code'][zips['cbsa'][rows]].tolist())
+        self.assertEqual(out['cbsa_code'][-3:].tolist(), [None, None, None])
+        self.assertEqual(out['zip_ok'].sum(), rows.shape[0] - 1)
+        df = pc.enrich(pd.DataFrame(block))
+        self.assertEqual(df['cbsa_code'].iloc[0:-3].tolist(), out['cbsa_code'][0:-3].tolist())
@@ -4,7 +4,7 @@ setup(
     name='data_reader',
     version='1.2',
     packages=['data_reader','data_reader.reader'],
-    package_data={'data_reader': ['data/*.dat','test_data/*'],'data_reader.reader': ['data/*'] },
+    package_data={'data_reader': ['data/*.dat','data/*.npy','test_data/*'],'data_reader.reader': ['data/*'] },
     url='',
     license='MIT',
     author='William Alexander',